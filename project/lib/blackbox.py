@@ -1,7 +1,16 @@
+import os
 import sys
+import math
 import multiprocessing as mp
+import queue
+import time
 import numpy as np
 import scipy.optimize as op
+from scipy.spatial.distance import cdist
+
+
+DROPPED = -1  # stage of initial points that were dropped from the plan
+BEST_CENTRES = 5  # number of best points the vectorized acquisition places candidates around
 
 
 def get_default_executor():
@@ -38,7 +47,8 @@ def get_default_executor():
 
 def search(f, box, n, m, batch, resfile,
            rho0=0.5, p=1.0, nrand=10000, nrand_frac=0.05,
-           executor=get_default_executor()):
+           executor=get_default_executor(), x0=None, prior=None, latin_cache=None,
+           acquisition='slsqp', ncand=10000):
     """
     Minimize given expensive black-box function and save results into text file.
 
@@ -55,7 +65,7 @@ def search(f, box, n, m, batch, resfile,
     batch : int
         Number of function calls evaluated simultaneously (in parallel).
     resfile : str
-        Text file to save results.
+        Text file to save results. None to not save them.
     rho0 : float, optional
         Initial "balls density".
     p : float, optional
@@ -67,11 +77,26 @@ def search(f, box, n, m, batch, resfile,
     executor : callable, optional
         Should have a map method and behave as a context manager.
         Allows the user to use various parallelisation tools
-        as dask.distributed or pathos.
+        as dask.distributed or pathos. It is entered once per search
+        and used for all batches.
+    x0 : list of lists, optional
+        Points (in box coordinates) to evaluate in the initial stage
+        instead of latin hypercube points, e.g. the best points of an
+        earlier search. At most n are used.
+    prior : ndarray, optional
+        Already evaluated points [[x1, x2, .., xd, val], ...] (in box
+        coordinates) that are added to the initial stage without being
+        evaluated again. Allows warm-starting a search.
+    latin_cache : str, optional
+        Directory in which latin hypercube designs are cached.
+    acquisition : str, optional
+        How the next batch of points is chosen: 'slsqp' minimizes the
+        fit for each point with one constraint per existing point,
+        'vectorized' scores ncand candidates with the fit at once and
+        picks the whole batch with array operations.
+    ncand : int, optional
+        Number of candidates scored by the 'vectorized' acquisition.
     """
-    # space size
-    d = len(box)
-
     # adjusting the number of function calls to the batch size
     if n % batch != 0:
         n = n - n % batch + batch
@@ -79,76 +104,430 @@ def search(f, box, n, m, batch, resfile,
     if m % batch != 0:
         m = m - m % batch + batch
 
-    # go from normalized values (unit cube) to absolute values (box)
-    def cubetobox(x):
-        return [box[i][0]+(box[i][1]-box[i][0])*x[i] for i in range(d)]
+    opt = BlackBox(box, n, m, rho0=rho0, p=p, nrand=nrand, nrand_frac=nrand_frac, x0=x0, prior=prior,
+                   latin_cache=latin_cache, acquisition=acquisition, ncand=ncand)
 
-    # generating latin hypercube
-    points = np.zeros((n, d+1))
-    points[:, 0:-1] = latin(n, d)
+    # the executor is opened once, so its workers are reused by every batch of both stages
+    with executor() as e:
+        while not opt.done():
+            proposals = opt.ask(batch)
+            values = list(e.map(f, [x for _, x in proposals]))
+            for (k, _), value in zip(proposals, values):
+                opt.tell(k, value)
 
-    # initial sampling
-    for i in range(n//batch):
-        with executor() as e:
-            points[batch*i:batch*(i+1), -1] = list(e.map(f, list(map(cubetobox, points[batch*i:batch*(i+1), 0:-1]))))
+    # saving results into text file
+    points = opt.result()
+    if resfile is not None:
+        save_results(points, resfile)
 
-    # normalizing function values
-    fmax = max(abs(points[:, -1]))
-    points[:, -1] = points[:, -1]/fmax
+    #Receive sorted list of candidate args + valuation.
+    return points
 
-    # volume of d-dimensional ball (r = 1)
-    if d % 2 == 0:
-        v1 = np.pi**(d/2)/np.math.factorial(d/2)
-    else:
-        v1 = 2*(4*np.pi)**((d-1)/2)*np.math.factorial((d-1)/2)/np.math.factorial(d)
 
-    # subsequent iterations (current subsequent iteration = i*batch+j)
-    T = np.identity(d)
+def save_results(points, resfile):
+    """
+    Save evaluated points [[x1, x2, .., xd, val], ...] into a text file.
+    The file is replaced in one step, so it is never left half-written.
+    """
+    d = points.shape[1]-1
+    labels = [' par_'+str(i+1)+(7-len(str(i+1)))*' '+',' for i in range(d)]+[' f_value    ']
+    tmp_path = '{}.{}.tmp'.format(resfile, os.getpid())
+    np.savetxt(tmp_path, points, delimiter=',', fmt=' %+1.4e', header=''.join(labels), comments='')
+    os.replace(tmp_path, resfile)
+
+
+def run_async(opt, f, executor, workers, callback=None, time_budget=None):
+    """
+    Drive an ask/tell optimiser to completion, keeping up to workers
+    evaluations running at all times. A new point is proposed as soon as
+    any evaluation finishes, so no worker waits for the rest of a batch.
+
+    With a time budget, the mean duration of the finished evaluations is
+    used to estimate how many more fit into the remaining time, and the
+    plan of the optimiser is reduced to that number (see BlackBox.reduce).
+    No point is proposed once an evaluation would not finish in time, so
+    the search stops early with the points evaluated so far.
+
+    Parameters
+    ----------
+    opt : BlackBox
+        The optimiser. May already hold evaluated points.
+    f : callable
+        The objective function to be minimized.
+    executor : object
+        An entered executor with an apply_async method taking callback
+        and error_callback arguments (as multiprocessing pools do).
+    workers : int
+        Maximal number of evaluations running at once.
+    callback : callable, optional
+        Called with the optimiser after each value it is told, e.g. to
+        checkpoint its state.
+    time_budget : float, optional
+        Wall-clock seconds the search may take.
+
+    Returns
+    -------
+    points : ndarray
+        The result of the optimiser, see BlackBox.result.
+    """
+    finished = queue.Queue()
+    start = time.time()
+    started = {}  # start time of each running evaluation
+    durations = []
+
+    while not opt.done():
+        allowed = workers-len(started)
+        if time_budget is not None and durations:
+            remaining = start+time_budget-time.time()
+            duration = np.mean(durations)
+            opt.reduce(max(0, int(remaining/duration*workers)-len(started)))
+            if remaining < duration:
+                allowed = 0
+
+        for k, x in opt.ask(allowed):
+            started[k] = time.time()
+            executor.apply_async(f, (x,), callback=lambda value, k=k: finished.put((k, value, None)),
+                                 error_callback=lambda error, k=k: finished.put((k, None, error)))
+
+        if not started:
+            if time_budget is not None:
+                break
+            raise RuntimeError('optimiser proposed no points although it is not done')
+
+        k, value, error = finished.get()
+        durations.append(time.time()-started.pop(k))
+        if error is not None:
+            raise error
+        opt.tell(k, value)
+        if callback is not None:
+            callback(opt)
+
+    return opt.result()
+
+
+class BlackBox:
+    """
+    Ask/tell version of the search. Points are requested with ask and
+    their values reported with tell, in any order and while other points
+    are still being evaluated. The optimiser never calls the objective
+    function itself, so the caller decides how evaluations are run.
+
+    All initial points (latin hypercube, x0) are handed out first. The
+    subsequent points are built from an RBF-fit of the points evaluated
+    so far and keep their distance to all points handed out, including
+    those still being evaluated. Subsequent points are only proposed
+    once the initial stage is fully evaluated; until then ask returns
+    fewer points than requested.
+
+    The state returned by get_state only holds numbers and arrays, so it
+    can be pickled and the search continued with from_state, e.g. in
+    another process.
+
+    Parameters
+    ----------
+    box, n, m, rho0, p, nrand, nrand_frac, x0, prior, latin_cache, acquisition, ncand :
+        As in search. n and m are used as given.
+    """
+
+    def __init__(self, box, n, m, rho0=0.5, p=1.0, nrand=10000, nrand_frac=0.05,
+                 x0=None, prior=None, latin_cache=None, acquisition='slsqp', ncand=10000):
+        self.box = np.array(box, dtype=float)
+        self.n = n
+        self.m = m
+        self.settings = {'rho0': rho0, 'p': p, 'nrand': nrand, 'nrand_frac': nrand_frac,
+                         'acquisition': acquisition, 'ncand': ncand}
+        d = len(box)
+
+        # generating latin hypercube, replacing its first points by the given initial ones
+        initial = latin(n, d, latin_cache)
+        if x0 is not None and len(x0) > 0:
+            k = min(len(x0), n)
+            initial[0:k] = [self._boxtocube(x) for x in x0[0:k]]
+
+        # every point handed out or known, in unit cube coordinates, with its value (nan while not evaluated)
+        self.x = np.zeros((0, d))
+        self.y = np.zeros(0)
+        self.asked = np.zeros(0, dtype=bool)
+        self.stage = np.zeros(0, dtype=int)  # 0 for initial points, 1 for subsequent ones, DROPPED
+
+        # number of evaluations the search is planned to make, and of previously evaluated points
+        self.planned = n+m
+        self.known = 0 if prior is None else len(prior)
+
+        # previously evaluated points count towards the initial stage
+        if prior is not None and len(prior) > 0:
+            prior = np.array(prior, dtype=float)
+            self._append([self._boxtocube(x) for x in prior[:, 0:-1]], 0, values=prior[:, -1])
+        self._append(initial, 0)
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restore an optimiser from the result of get_state. Points that
+        were handed out but not evaluated are handed out again by ask.
+        """
+        opt = cls.__new__(cls)
+        opt.box = np.array(state['box'], dtype=float)
+        opt.n, opt.m = state['n'], state['m']
+        opt.planned, opt.known = state['planned'], state['known']
+        opt.settings = dict(state['settings'])
+        opt.x = np.array(state['x'], dtype=float)
+        opt.y = np.array(state['y'], dtype=float)
+        opt.stage = np.array(state['stage'], dtype=int)
+        # lost evaluations are forgotten, so their points are proposed again
+        opt.asked = ~np.isnan(opt.y)
+        return opt
+
+    def get_state(self):
+        """
+        Return a picklable dictionary from which from_state restores the
+        optimiser.
+        """
+        return {'box': self.box.tolist(), 'n': self.n, 'm': self.m, 'planned': self.planned, 'known': self.known,
+                'settings': dict(self.settings),
+                'x': np.copy(self.x), 'y': np.copy(self.y), 'stage': np.copy(self.stage)}
+
+    def ask(self, k=1):
+        """
+        Propose up to k points to evaluate.
+
+        Returns
+        -------
+        proposals : list of tuples
+            (id, point in box coordinates) for each proposed point. The id
+            is passed to tell with the point's value.
+        """
+        proposals = []
+
+        # initial points and points whose evaluation was lost
+        waiting = np.where(~self.asked & np.isnan(self.y) & (self.stage != DROPPED))[0]
+        for i in waiting[0:k]:
+            self.asked[i] = True
+            proposals.append((int(i), self._cubetobox(self.x[i])))
+
+        # subsequent points, once the initial stage is evaluated
+        k = min(k-len(proposals), self.m-np.sum(self.stage == 1))
+        if k > 0 and not np.any(np.isnan(self.y[self.stage == 0])):
+            ids = self._append(self._propose(k), 1)
+            self.asked[ids] = True
+            proposals += [(int(i), self._cubetobox(self.x[i])) for i in ids]
+
+        return proposals
+
+    def tell(self, k, value):
+        """
+        Report the value of the point with the given id.
+        """
+        self.y[k] = value
+
+    def done(self):
+        """
+        Return whether all points of both stages are evaluated.
+        """
+        return np.sum(self.stage == 1) == self.m and not np.any(np.isnan(self.y[self.stage != DROPPED]))
+
+    def reduce(self, k):
+        """
+        Plan at most k more points to be handed out. The initial points
+        not handed out yet and the subsequent points are cut down in the
+        same proportion, keeping enough initial points for the RBF-fit
+        where possible. Dropped initial points are never handed out.
+        """
+        d = len(self.box)
+        unasked = np.where((self.stage == 0) & ~self.asked)[0]
+        left = self.m-np.sum(self.stage == 1)
+        if len(unasked)+left <= k:
+            return
+
+        keep = int(round(len(unasked)*k/float(len(unasked)+left)))
+        # the fit needs d+1 initial points
+        keep = min(k, len(unasked), max(keep, d+1-(np.sum(self.stage == 0)-len(unasked))))
+        self.stage[unasked[keep:]] = DROPPED
+        self.m = np.sum(self.stage == 1)+k-keep
+
+    def progress(self):
+        """
+        Return the number of evaluations made (not counting prior points)
+        and the number of evaluations the search was planned to make.
+        """
+        return int(np.sum(~np.isnan(self.y)))-self.known, self.planned
+
+    def pending(self):
+        """
+        Return the ids of all points handed out and not evaluated yet.
+        """
+        return [int(i) for i in np.where(self.asked & np.isnan(self.y))[0]]
+
+    def result(self):
+        """
+        Return all evaluated points [[x1, x2, .., xd, val], ...] in box
+        coordinates, sorted by value.
+        """
+        evaluated = ~np.isnan(self.y)
+        points = np.zeros((np.sum(evaluated), len(self.box)+1))
+        points[:, 0:-1] = [self._cubetobox(x) for x in self.x[evaluated]]
+        points[:, -1] = self.y[evaluated]
+        return points[points[:, -1].argsort()]
+
+    def _append(self, x, stage, values=None):
+        ids = np.arange(len(self.x), len(self.x)+len(x))
+        self.x = np.append(self.x, np.reshape(x, (-1, len(self.box))), axis=0)
+        self.y = np.append(self.y, np.full(len(x), np.nan) if values is None else values)
+        self.asked = np.append(self.asked, np.full(len(x), values is not None))
+        self.stage = np.append(self.stage, np.full(len(x), stage))
+        return ids
 
-    for i in range(m//batch):
+    # go from normalized values (unit cube) to absolute values (box)
+    def _cubetobox(self, x):
+        return list(self.box[:, 0]+(self.box[:, 1]-self.box[:, 0])*x)
+
+    # go from absolute values (box) to normalized values (unit cube)
+    def _boxtocube(self, x):
+        return (np.asarray(x, dtype=float)-self.box[:, 0])/(self.box[:, 1]-self.box[:, 0])
+
+    def _propose(self, k):
+        """
+        Choose k subsequent points in the unit cube.
+        """
+        d = len(self.box)
+        rho0, p, m = self.settings['rho0'], self.settings['p'], self.m
+
+        # evaluated points, without duplicates, which would make the RBF-fit singular
+        evaluated = ~np.isnan(self.y)
+        points = np.zeros((np.sum(evaluated), d+1))
+        points[:, 0:-1] = self.x[evaluated]
+        points[:, -1] = self.y[evaluated]
+        _, unique = np.unique(np.round(points[:, 0:-1], 12), axis=0, return_index=True)
+        points = points[np.sort(unique)]
+
+        # normalizing function values by the initial stage
+        fmax = max(abs(self.y[self.stage == 0]))
+        points[:, -1] = points[:, -1]/(fmax if fmax > 0 else 1.)
+
+        # volume of d-dimensional ball (r = 1)
+        if d % 2 == 0:
+            v1 = np.pi**(d/2)/math.factorial(d//2)
+        else:
+            v1 = 2*(4*np.pi)**((d-1)/2)*math.factorial((d-1)//2)/math.factorial(d)
 
         # refining scaling matrix T
+        T = np.identity(d)
         if d > 1:
-            fit_noscale = rbf(points, np.identity(d))
-            population = np.zeros((nrand, d+1))
-            population[:, 0:-1] = np.random.rand(nrand, d)
-            population[:, -1] = list(map(fit_noscale, population[:, 0:-1]))
-
-            cloud = population[population[:, -1].argsort()][0:int(nrand*nrand_frac), 0:-1]
-            eigval, eigvec = np.linalg.eig(np.cov(np.transpose(cloud)))
-            T = [eigvec[:, j]/np.sqrt(eigval[j]) for j in range(d)]
-            T = T/np.linalg.norm(T)
+            T = rescale(points, self.settings['nrand'], self.settings['nrand_frac'])
 
-        # sampling next batch of points
         fit = rbf(points, T)
-        points = np.append(points, np.zeros((batch, d+1)), axis=0)
 
-        for j in range(batch):
-            r = ((rho0*((m-1.-(i*batch+j))/(m-1.))**p)/(v1*(n+i*batch+j)))**(1./d)
-            cons = [{'type': 'ineq', 'fun': lambda x, localk=k: np.linalg.norm(np.subtract(x, points[localk, 0:-1])) - r}
-                    for k in range(n+i*batch+j)]
+        # the current subsequent iteration is s, counting the initial points as in the original search
+        n = np.sum(self.stage == 0)
+        first = np.sum(self.stage == 1)
+        radii = [((rho0*((m-1.-s)/max(m-1., 1.))**p)/(v1*(n+s)))**(1./d) for s in range(first, first+k)]
+
+        # new points keep their distance to all points handed out, evaluated or not
+        existing = self.x[self.stage != DROPPED]
+        if self.settings['acquisition'] == 'vectorized':
+            # half of the candidates are placed around the best points, which uniform candidates rarely come close
+            # to when there are many dimensions
+            best = points[np.argsort(points[:, -1])[0:BEST_CENTRES], 0:-1]
+            return select_batch(fit, existing, radii, self.settings['ncand'], centres=best)
+
+        batch = np.zeros((k, d))
+        for j, r in enumerate(radii):
+            cons = [{'type': 'ineq', 'fun': lambda x, localk=i: np.linalg.norm(np.subtract(x, existing[localk])) - r}
+                    for i in range(len(existing))]
             while True:
                 minfit = op.minimize(fit, np.random.rand(d), method='SLSQP', bounds=[[0., 1.]]*d, constraints=cons)
                 if np.isnan(minfit.x)[0] == False:
                     break
-            points[n+i*batch+j, 0:-1] = np.copy(minfit.x)
+            batch[j] = np.copy(minfit.x)
+            existing = np.append(existing, batch[j:j+1], axis=0)
+        return batch
 
-        with executor() as e:
-            points[n+batch*i:n+batch*(i+1), -1] = list(e.map(f, list(map(cubetobox, points[n+batch*i:n+batch*(i+1), 0:-1]))))/fmax
 
-    # saving results into text file
-    points[:, 0:-1] = list(map(cubetobox, points[:, 0:-1]))
-    points[:, -1] = points[:, -1]*fmax
-    points = points[points[:, -1].argsort()]
+def rescale(points, nrand, nrand_frac):
+    """
+    Build the scaling matrix of the RBF-fit. The fit without scaling is
+    evaluated at nrand random points at once and the best nrand_frac of
+    them form a cloud whose principal axes are scaled to equal length.
 
-    #Receive sorted list of candidate args + valuation.
-    return points
+    Parameters
+    ----------
+    points : ndarray
+        Array of evaluated points [[x1, x2, .., xd, val], ...] (unit cube).
+    nrand : int
+        Number of random samples.
+    nrand_frac : float
+        Fraction of nrand that forms the cloud.
+
+    Returns
+    -------
+    T : ndarray
+        Scaling matrix of norm 1.
+    """
+    d = points.shape[1]-1
+    population = np.random.rand(nrand, d)
+    values = rbf(points, np.identity(d))(population)
+
+    size = max(int(nrand*nrand_frac), d+1)
+    cloud = population[np.argpartition(values, size-1)[0:size]]
+
+    # the covariance is symmetric, so its eigenvalues are real; flat directions are capped instead of blowing up
+    eigval, eigvec = np.linalg.eigh(np.cov(cloud, rowvar=False))
+    eigval = np.maximum(eigval, 1e-12*max(eigval.max(), 1e-12))
+    T = (eigvec/np.sqrt(eigval)).T
+    return T/np.linalg.norm(T)
+
+
+def select_batch(fit, existing, radii, ncand, centres=None):
+    """
+    Choose a batch of new points by scoring random candidates with the fit.
+
+    The candidates are ranked by their fitted value once. The j-th point
+    of the batch is the best candidate that is at least radii[j] away
+    from all existing and already chosen points. If no candidate is far
+    enough away, the one furthest from all points is taken.
+
+    Parameters
+    ----------
+    fit : callable
+        RBF-fit accepting an array of points.
+    existing : ndarray
+        Array of already evaluated points (unit cube).
+    radii : list
+        Minimal distance of each new point to all others.
+    ncand : int
+        Number of candidates.
+    centres : ndarray, optional
+        Points (unit cube) around which half of the candidates are
+        placed, spread over a few times the largest radius. The other
+        half is spread uniformly.
+
+    Returns
+    -------
+    batch : ndarray
+        Array of len(radii) new points in the unit cube.
+    """
+    d = existing.shape[1]
+    candidates = np.random.rand(ncand, d)
+    if centres is not None and len(centres) > 0:
+        nlocal = ncand//2
+        around = centres[np.random.randint(len(centres), size=nlocal)]
+        candidates[0:nlocal] = np.clip(around+np.random.normal(scale=2*max(radii), size=(nlocal, d)), 0., 1.)
+    order = np.argsort(fit(candidates))
+
+    # distance of every candidate to its nearest point
+    nearest = cdist(candidates, existing).min(axis=1)
+
+    batch = np.zeros((len(radii), d))
+    for j, r in enumerate(radii):
+        valid = order[nearest[order] >= r]
+        chosen = valid[0] if len(valid) > 0 else np.argmax(nearest)
+        batch[j] = candidates[chosen]
+        nearest = np.minimum(nearest, cdist(candidates, batch[j:j+1])[:, 0])
 
-    #labels = [' par_'+str(i+1)+(7-len(str(i+1)))*' '+',' for i in range(d)]+[' f_value    ']
-    #np.savetxt(resfile, points, delimiter=',', fmt=' %+1.4e', header=''.join(labels), comments='')
+    return batch
 
 
-def latin(n, d):
+def latin(n, d, cache_dir=None, iterations=1000):
     """
     Build latin hypercube.
 
@@ -158,34 +537,56 @@ def latin(n, d):
         Number of points.
     d : int
         Size of space.
+    cache_dir : str, optional
+        Directory in which designs are stored per (n, d). A stored
+        design is reused instead of being built again.
+    iterations : int, optional
+        Number of attempted swaps when minimizing the spread.
 
     Returns
     -------
     lh : ndarray
         Array of points uniformly placed in d-dimensional unit cube.
     """
-    # spread function
-    def spread(points):
-        return sum(1./np.linalg.norm(np.subtract(points[i], points[j])) for i in range(n) for j in range(n) if i > j)
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, 'latin_{}_{}.npy'.format(n, d))
+        if os.path.exists(path):
+            return np.load(path)
 
-    # starting with diagonal shape
-    lh = [[i/(n-1.)]*d for i in range(n)]
+    # spread contribution of a point: sum of inverse distances to all other points
+    def spread(point, others):
+        return np.sum(1./np.sqrt(np.sum((others-point)**2, axis=1)))
 
-    # minimizing spread function by shuffling
-    minspread = spread(lh)
+    # starting with diagonal shape
+    lh = np.array([[i/(n-1.)]*d for i in range(n)])
 
-    for i in range(1000):
+    # minimizing spread function by shuffling. Swapping a coordinate of two points only changes their distances to
+    # the other points (the distance between the two stays the same), so only those are recomputed.
+    for i in range(iterations):
         point1 = np.random.randint(n)
         point2 = np.random.randint(n)
         dim = np.random.randint(d)
+        if point1 == point2:
+            continue
+
+        others = np.delete(lh, [point1, point2], axis=0)
+        new1, new2 = np.copy(lh[point1]), np.copy(lh[point2])
+        new1[dim], new2[dim] = lh[point2, dim], lh[point1, dim]
+
+        oldspread = spread(lh[point1], others) + spread(lh[point2], others)
+        newspread = spread(new1, others) + spread(new2, others)
 
-        newlh = np.copy(lh)
-        newlh[point1, dim], newlh[point2, dim] = newlh[point2, dim], newlh[point1, dim]
-        newspread = spread(newlh)
+        if newspread < oldspread:
+            lh[point1], lh[point2] = new1, new2
 
-        if newspread < minspread:
-            lh = np.copy(newlh)
-            minspread = newspread
+    if cache_dir is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        # written under a temporary name first, so concurrent searches never read a partial design
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as writer:
+            np.save(writer, lh)
+        os.replace(tmp_path, path)
 
     return lh
 
@@ -204,7 +605,8 @@ def rbf(points, T):
     Returns
     -------
     fit : callable
-        Function that returns the value of the RBF-fit at a given point.
+        Function that returns the value of the RBF-fit at a given point,
+        or an array of values when given an array of points (one per row).
     """
     n = len(points)
     d = len(points[0])-1
@@ -212,7 +614,10 @@ def rbf(points, T):
     def phi(r):
         return r*r*r
 
-    Phi = [[phi(np.linalg.norm(np.dot(T, np.subtract(points[i, 0:-1], points[j, 0:-1])))) for j in range(n)] for i in range(n)]
+    # distances are taken between scaled points, as |T(x-y)| = |Tx-Ty|
+    T = np.asarray(T, dtype=float)
+    scaled = np.dot(points[:, 0:-1], T.T)
+    Phi = phi(cdist(scaled, scaled))
 
     P = np.ones((n, d+1))
     P[:, 0:-1] = points[:, 0:-1]
@@ -231,6 +636,9 @@ def rbf(points, T):
     lam, b, a = sol[0:n], sol[n:n+d], sol[n+d]
 
     def fit(x):
-        return sum(lam[i]*phi(np.linalg.norm(np.dot(T, np.subtract(x, points[i, 0:-1])))) for i in range(n)) + np.dot(b, x) + a
+        x = np.asarray(x, dtype=float)
+        X = np.atleast_2d(x)
+        values = np.dot(phi(cdist(np.dot(X, T.T), scaled)), lam) + np.dot(X, b) + a
+        return values if x.ndim > 1 else values[0]
 
     return fit
@@ -0,0 +1,75 @@
+import math
+import time
+from functools import partial
+import numpy as np
+
+from lib.blackbox import get_default_executor, latin
+
+
+def search(f, box, n, eta=3, time_budget=None, executor=get_default_executor(), latin_cache=None):
+    """
+    Minimize given expensive black-box function by successive halving.
+
+    All n candidates are first evaluated at the lowest fidelity. Only the
+    best 1/eta of them are promoted to the next rung, where the fidelity
+    is eta times higher, until the last rung is evaluated at full fidelity
+    (1.0). The lowest fidelity is chosen so that at least one candidate
+    reaches the last rung.
+
+    Parameters
+    ----------
+    f : callable
+        The objective function to be minimized. Called as f(x, fidelity),
+        where fidelity is in (0, 1] and 1 is a full evaluation.
+    box : list of lists
+        List of ranges for each parameter.
+    n : int
+        Number of candidates evaluated at the lowest fidelity.
+    eta : int, optional
+        Reduction factor between rungs.
+    time_budget : float, optional
+        Wall-clock seconds after which no further rung is started. The
+        candidates of the highest completed rung are then returned.
+    executor : callable, optional
+        Should have a map method and behave as a context manager.
+        It is entered once per search and used for all rungs.
+    latin_cache : str, optional
+        Directory in which latin hypercube designs are cached.
+
+    Returns
+    -------
+    points : ndarray
+        Candidates of the highest completed rung with their values,
+        [[x1, x2, .., xd, val], ...], sorted by value.
+    fidelity : float
+        Fidelity the returned values were evaluated at.
+    """
+    start = time.time()
+    d = len(box)
+
+    # go from normalized values (unit cube) to absolute values (box)
+    def cubetobox(x):
+        return [box[i][0]+(box[i][1]-box[i][0])*x[i] for i in range(d)]
+
+    rungs = int(math.floor(math.log(n, eta) + 1e-9))
+    candidates = np.array(list(map(cubetobox, latin(n, d, latin_cache))))
+    points, fidelity = None, 0.
+
+    with executor() as e:
+        for k in range(rungs+1):
+            if points is not None and time_budget is not None and time.time() - start > time_budget:
+                break
+
+            rung_fidelity = float(eta)**(k-rungs)
+            values = list(e.map(partial(f, fidelity=rung_fidelity), list(candidates)))
+
+            points = np.zeros((len(candidates), d+1))
+            points[:, 0:-1] = candidates
+            points[:, -1] = values
+            points = points[points[:, -1].argsort()]
+            fidelity = rung_fidelity
+
+            # promoting the best candidates
+            candidates = points[0:max(1, len(points)//eta), 0:-1]
+
+    return points, fidelity
@@ -5,8 +5,10 @@
 import src.ai.board_info as board_info
 import src.utils.file_io as io
 import src.ai.heuristics as heur
-import src.ai.bot_learning as bot_learn
+import src.ai.training_runner as training_runner
 import src.utils.game_recorder as gc
+import src.utils.profile_store as store
+import src.utils.write_behind as write_behind
 # library imports.
 import importlib
 import numpy as np
@@ -16,13 +18,16 @@ TRAIN_INTERVAL = 50  # Consider training after this many games have been played
 GAME_COUNT = 20  # Default number of games to train.
 MAX_GAMES_WITHOUT_TRAINING = 200  # Force a training session after this many games have elapsed against the opponent.
 UNDERPERFOMANCE_THRESHOLD = 0.1  # By how much a trained bot has to underperform to be retrained at a training interval.
+BACKGROUND_TRAINING = True  # Whether to train in a background process instead of before the next game.
 
 
 class AI:
     """
     This class is used to load bots, logging and tracking their performance vs an opponent and training. Of particular
-    importance to this class is the self.opponent_profile. It is a dictionary that contains all information about games
-    between the chosen bot and a specific opponent. It has a structure as follows:
+    importance to this class is the profile of the bot against the opponent, which holds all information about games
+    between the chosen bot and a specific opponent. It is kept in the profile store (see src/utils/profile_store.py),
+    which the AI queries for just what it needs. Assembled as a whole (profile_store.load_profile()), it has a
+    structure as follows:
 
         {'bot_name': self.bot.bot_name,
         opponent_name': self.opponent_name,
@@ -40,13 +45,13 @@ class AI:
 
         'heuristics':{name of a heuristic:{map_type: heuristic value},...}
 
-        'misc':{'games_since_training': number of games since last training, 'accuracy_before_training': bot accuracy
-        prior to training, 'accuracy_after_training': accuracy after training}.
+        'misc':{'games_since_training': {map_type: number of games since last training}, 'accuracy_before_training':
+        {map_type: bot accuracy prior to training}, 'accuracy_after_training': {map_type: accuracy after training}}.
     """
 
     def __init__(self, game_state):
         self.bot = None  # the bot to use
-        self.opponent_profile = None  # a dictionary of the opponent's data.
+        self.bot_name = None  # name the bot was loaded by, which is also the name of its data directory.
         self.opponent_name = game_state['OpponentId']
         self.game_id = game_state['GameId']
         self.heuristic_info = None  # list containing (heuristic name, value) used by bot during play.
@@ -67,17 +72,26 @@ class AI:
         :param heuristic_choices: a list of heuristic names.
         :return:
         """
-        self.opponent_profile = io.load_profile(name, self.opponent_name)
+        self.bot_name = name
         self.heuristic_choices = heuristic_choices
+        # A profile.p file from before the profile store is imported the first time the profile is opened.
+        if store.import_pickled_profile(self.bot_name, self.opponent_name):
+            print('Imported the profile of', self.bot_name, 'against', self.opponent_name + '.')
         self.display_play_stats()  # Displays play-time stats in the console.
 
         self.bot_location = PLUGIN_PATH + '.' + name
         # Gets the class Bot and creates an instance of it.
         self.bot = getattr(importlib.import_module(self.bot_location), 'Bot')()
 
-        if not self.opponent_profile:
+        if not store.has_profile(self.bot_name, self.opponent_name):
             self._generate_profile()
 
+        # Take over the heuristics of any training that finished in the background since the last game.
+        self._take_over_training_results()
+        # Continue any training that was interrupted by closing the client.
+        self._resume_interrupted_training()
+        self.display_training_status()  # Displays what is being trained in the background.
+
         # Check if there are heuristics specified to use and whether the bot actually supports heuristics.
         if heuristic_choices:
             if self._bot_has_heuristics():
@@ -101,21 +115,32 @@ class AI:
     def finish_game(self, game_state, won, train_bot=False):
         """
         This function is to be called after a game is finished to get the gameplay stats, assess the bot's performance
-        and decide whether to train it.
+        and decide whether to train it. The game is stored in the background (see write_behind.py), so unless the bot
+        is trained before the next game, this returns without waiting for any disk I/O.
         :param game_state: an aigaming game_state dictionary (should be the last game state).
         :param won: a boolean that specifies whether the game was won or not.
         :param train_bot: optional parameter that specifies whether the bot should consider training.
         :return:
         """
 
-        self._add_game_to_profile(game_state, won)  # adds game to opponent profile.
+        write_behind.submit(self._add_game_to_profile, game_state, won)  # adds game to opponent profile.
+        write_behind.submit(store.compact_games, self.bot_name, self.opponent_name)  # summarises old games.
 
         # If we want to train the bot AND the bot can actually be trained AND the ai deems it worthwhile to train
-        # the bot, the bot is trained.
-        if train_bot and self._bot_has_heuristics() and self._decide_whether_to_train():
-            self._train_bot()
-        # Save training results and added game.
-        io.save_profile(self.opponent_profile, self.bot.bot_name, self.opponent_name)
+        # the bot, the bot is trained. In the background, the bot keeps playing with its current heuristics until the
+        # training has finished. The decision needs the stored game, so it is queued behind it.
+        if train_bot and self._bot_has_heuristics():
+            if BACKGROUND_TRAINING:
+                write_behind.submit(self._consider_training)
+            else:
+                write_behind.flush()
+                if self._decide_whether_to_train():
+                    self._train_bot()
+
+    def _consider_training(self):
+        # Submit a training to the background process if the ai deems it worthwhile.
+        if self._decide_whether_to_train():
+            self._submit_training()
 
     def _bot_has_heuristics(self):
         """
@@ -136,19 +161,20 @@ class AI:
         set_heuristics = getattr(self.bot, "set_heuristics", None)
         heuristics = []
         self.heuristic_info = []
+        trained_heuristics = store.get_heuristics(self.bot_name, self.opponent_name)
         # For each heuristic, load the respective function and weight.
         for name in heuristic_names:
 
             # Check if a this heuristic has ever been set and if not, skip it.
-            if name not in self.opponent_profile['heuristics']:
+            if name not in trained_heuristics:
                 print('Bot', self.bot.bot_name, 'has not trained', name, 'yet.')
                 continue
 
             heuristic_func = getattr(heur, name)  # get the heuristic function
 
             # Try to load the heuristic relevant to the map type.
-            if self.map_type in self.opponent_profile['heuristics'][name]:
-                heuristic_val = self.opponent_profile['heuristics'][name][self.map_type]
+            if self.map_type in trained_heuristics[name]:
+                heuristic_val = trained_heuristics[name][self.map_type]
 
                 self.heuristic_info.append((name, heuristic_val))
                 print('Loading a', self.map_type, 'heuristic:', '\'' + name + '\'', 'of value', heuristic_val)
@@ -166,7 +192,7 @@ class AI:
         :return:
         """
         # If we are not at a training interval, do not train.
-        remainder = len(self.opponent_profile['games']) % TRAIN_INTERVAL
+        remainder = store.count_games(self.bot_name, self.opponent_name) % TRAIN_INTERVAL
         if remainder != 0:
             print('No training as the training interval has not been reached. Will attempt after',
                   TRAIN_INTERVAL - remainder, 'game(s).')
@@ -180,28 +206,30 @@ class AI:
             return False
 
         # If we have never trained a chosen heuristic, do train.
-        trained_heuristics = set(self.opponent_profile['heuristics'].keys())
+        heuristics = store.get_heuristics(self.bot_name, self.opponent_name)
+        trained_heuristics = set(heuristics.keys())
         chosen_heuristics = set(self.heuristic_choices)
         if trained_heuristics != chosen_heuristics:
             print('Will commence training as', self.bot.bot_name, 'has not trained all chosen heuristics.')
             return True
 
         # If a heuristic has never been trained with a map type, do train.
-        for heuristic in self.opponent_profile['heuristics']:
-            if self.map_type not in self.opponent_profile['heuristics'][heuristic]:
+        for heuristic in heuristics:
+            if self.map_type not in heuristics[heuristic]:
                 print('Will commence training as', self.bot.bot_name, 'has not trained', heuristic, 'on a',
                       self.map_type, 'map.')
                 return True
 
         # If we have not trained for MAX_GAMES_WITHOUT_TRAINING or more, do train.
-        if self.opponent_profile['misc']['games_since_training'][self.map_type] >= MAX_GAMES_WITHOUT_TRAINING:
+        training_state = store.get_training_state(self.bot_name, self.opponent_name, self.map_type)
+        if training_state['games_since_training'] >= MAX_GAMES_WITHOUT_TRAINING:
             print('Will commence training as', self.bot.bot_name, 'has not been trained on', self.map_type, 'in',
-                  self.opponent_profile['misc']['games_since_training'][self.map_type], 'games.')
+                  training_state['games_since_training'], 'games.')
             return True
 
         # If the current accuracy has sufficiently underperformed vs the one prior to training, do train.
-        accuracy_after_training = self.opponent_profile['misc']['accuracy_after_training'][self.map_type]
-        accuracy_before_training = self.opponent_profile['misc']['accuracy_before_training'][self.map_type]
+        accuracy_after_training = training_state['accuracy_after_training']
+        accuracy_before_training = training_state['accuracy_before_training']
         if accuracy_after_training < accuracy_before_training * (1 - UNDERPERFOMANCE_THRESHOLD):
             print('Will commence training as', self.bot.bot_name + '\'s accuracy has dropped from:',
                   '{:.3f}'.format(accuracy_before_training * 100) + '%', 'to:',
@@ -217,19 +245,75 @@ class AI:
 
     def _train_bot(self):
         """
-        This function prepares the training algorithm for a bot. It begins by setting various training parameters,
-        then starting the training and finally storing the result. Note: the AI will always attempt to train on the map
-        type it has under self.map_type (typically the last played one).
+        This function trains the bot before returning. It begins by setting various training parameters, then starting
+        the training and finally storing the result. Note: the AI will always attempt to train on the map type it has
+        under self.map_type (typically the last played one).
+        :return:
+        """
+        job = self._training_job()
+        training_runner.run_job(job, lambda values: self._store_training(job, values))  # run the optimiser.
+
+    def _store_training(self, job, values):
+        """
+        This function stores the result of a training job in the opponent profile.
+        :param job: the job dictionary (see training_runner.TrainingRunner).
+        :param values: a list of trained heuristic values, in the order of the job's heuristic names.
+        :return:
+        """
+        self._update_heuristics(values, job['map_type'], job['heuristic_names'])  # store heuristics.
+        self._reset_training_performance(job['map_type'])  # reset training stats to monitor the latest train.
+
+    def _submit_training(self):
+        """
+        This function queues the training of the bot in the background process. Its result is stored by the next AI
+        to load the bot against this opponent (see _take_over_training_results()).
         :return:
         """
-        o = bot_learn.Optimiser(self.bot.bot_name, self.opponent_name, self.bot_location)  # initialise optimiser
-        o.prepare_heuristics(self.heuristic_choices)  # set heuristics to train.
-        o.set_optimisation_type('minimise')  # set whether to minimise or maximise the evaluation function.
-        games = self._select_training_games()  # get game ids to train on.
-        o.prepare_offensive_games(games)  # load them into the optimiser.
-        result = o.optimise()  # run the optimiser.
-        self._update_heuristics(result[:-1], self.map_type)  # store heuristics.
-        self._reset_training_performance()  # reset training stats to monitor performance of latest train.
+        if training_runner.get_runner().submit(self._training_job()):
+            print('Training', self.bot.bot_name, 'on', self.map_type, 'maps in the background.')
+        else:
+            print('Training', self.bot.bot_name, 'on', self.map_type, 'maps is already under way.')
+
+    def _training_job(self):
+        """
+        This function sets the training parameters. The job holds everything needed to train the bot, so it can also be
+        run by another process.
+        :return: a job dictionary, as described in training_runner.TrainingRunner.
+        """
+        return {'bot_name': self.bot_name,
+                'opponent_name': self.opponent_name,
+                'bot_location': self.bot_location,
+                'heuristic_names': list(self.heuristic_choices),  # heuristics to train.
+                'map_type': self.map_type,
+                'game_ids': self._select_training_games(),  # game ids to train on.
+                'optimisation_type': 'minimise'}  # whether to minimise or maximise the evaluation function.
+
+    def _take_over_training_results(self):
+        """
+        This function stores the heuristics of trainings that finished in the background in the opponent profile. The
+        heuristics are stored before a result is deleted, so a result is never lost.
+        :return:
+        """
+        for path, result in io.load_training_results(self.bot_name, self.opponent_name):
+            if result is not None:
+                print('Taking over background training on', result['map_type'], 'maps.')
+                self._update_heuristics(result['values'], result['map_type'], result['heuristic_names'])
+                self._reset_training_performance(result['map_type'])
+            io.remove_file(path)
+
+    def _resume_interrupted_training(self):
+        """
+        This function continues the trainings against this opponent that were started, but never finished, e.g. as
+        the client was closed. Each continues from its last checkpoint, either in the background or right away.
+        :return:
+        """
+        for job in training_runner.interrupted_jobs(self.bot_name, self.opponent_name):
+            if BACKGROUND_TRAINING:
+                if training_runner.get_runner().submit(job):
+                    print('Resuming training on', job['map_type'], 'maps in the background.')
+            else:
+                print('Resuming training on', job['map_type'], 'maps.')
+                training_runner.run_job(job, lambda values: self._store_training(job, values))
 
     def _select_training_games(self):
         """
@@ -237,44 +321,38 @@ class AI:
         constants and what games are available and of the right map type.
         :return: a list of game ids
         """
-        games = self.opponent_profile['games'] # get games
-        # count of how many games we actually have stored.
-        game_count = min(len(games), gc.MAX_GAMES_LOGGED_PER_OPPONENT)
-        # get the ids of games we actually have stored (by recency).
-        stored_games = sorted(games, reverse=True)[:game_count]
-        # Get the stored games that actually are of the desired map type.
-        map_games = [g for g in stored_games if games[g]['map_type'] == self.map_type]
-        # Return the mapped games, capped by the GAME_COUNT needed for training.
-        selection = min(len(map_games), GAME_COUNT)
-
-        return map_games[:selection]
+        # Of the games we actually have stored (the most recent ones), get those of the desired map type, capped by
+        # the GAME_COUNT needed for training. The store reads these off its index of games by id, most recent first,
+        # so only the selected games are looked at.
+        return store.get_recent_game_ids(self.bot_name, self.opponent_name, self.map_type,
+                                         recent=gc.MAX_GAMES_LOGGED_PER_OPPONENT, limit=GAME_COUNT)
 
-    def _update_heuristics(self, values, map_type):
+    def _update_heuristics(self, values, map_type, names=None):
         """
-        This function updates the heuristics in the opponent_profile after training.
+        This function updates the heuristics in the opponent profile after training.
         :param values: a list of heuristic weights (assumed to be in same order as heuristic names).
         :param map_type: a string that holds the type of map the heuristics were trained on.
+        :param names: optional list of heuristic names. Defaults to the chosen heuristics.
         :return:
         """
+        if names is None:
+            names = self.heuristic_choices
+        heuristics = store.get_heuristics(self.bot_name, self.opponent_name)
         # Iterate through each heuristic name and weight.
-        for name, val in zip(self.heuristic_choices, values):
-            # If we have never set the heuristic before, create the dictionary to hold it.
-            if name not in self.opponent_profile['heuristics']:
-                self.opponent_profile['heuristics'][name] = {}
-
+        for name, val in zip(names, values):
             # Choose respective text to either set or update the heuristic.
-            if map_type in self.opponent_profile['heuristics'][name]:
+            if map_type in heuristics.get(name, {}):
                 print('Replacing', map_type, 'heuristic', '\'' + name + '\'', 'of value',
-                      self.opponent_profile['heuristics'][name][map_type], 'with:', val)
+                      heuristics[name][map_type], 'with:', val)
             else:
                 print('Setting', map_type, 'heuristic', '\'' + name + '\'', 'with:', val)
             # Set the heuristic.
-            self.opponent_profile['heuristics'][name][map_type] = val
+            store.set_heuristic(self.bot_name, self.opponent_name, name, map_type, val)
 
     def _add_game_to_profile(self, game_state, won):
         """
-        Adds the latest played game to the opponent_profile. These are kept for displaying and monitoring bot
-        performance against certain opponents.
+        Adds the latest played game to the opponent profile. These are kept for displaying and monitoring bot
+        performance against certain opponents. The game and the updated training performance are stored at once.
         :param game_state: an aigaming game_state dictionary (should be the last game state).
         :param won: a boolean that specifies whether the game was won or not.
         :return:
@@ -282,18 +360,21 @@ class AI:
 
         performance = self._assess_game_performance(game_state) # get metrics of how well the game went for the bot.
 
-        self.opponent_profile['games'][self.game_id] = performance
+        game_stats = dict(performance)
 
         # Store if the game was actually won or not.
-        self.opponent_profile['games'][self.game_id].update({'victory': won})
+        game_stats.update({'victory': won})
 
         # Tag game as either land or no land for later analysis.
-        self.opponent_profile['games'][self.game_id].update({'map_type': self.map_type})
+        game_stats.update({'map_type': self.map_type})
+
+        # Add list of heuristics and values used to game. The store also counts the game towards the training
+        # performance of the map type, in the same transaction.
+        trainable = self._bot_has_heuristics()
+        if trainable:
+            game_stats.update({'heuristics': self.heuristic_info})
 
-        # Add list of heuristics and values used to game and update training performance info.
-        if self._bot_has_heuristics():
-            self._update_training_performance(performance)
-            self.opponent_profile['games'][self.game_id].update({'heuristics': self.heuristic_info})
+        store.add_game(self.bot_name, self.opponent_name, self.game_id, game_stats, track_training=trainable)
 
     def _assess_game_performance(self, final_state):
         """
@@ -323,63 +404,41 @@ class AI:
 
         return performance
 
-    def _update_training_performance(self, last_performance):
+    def _reset_training_performance(self, map_type=None):
         """
-        This function updates the training performance of the bot before and after training to enable tracking of its
-        performance.
-        :param last_performance: a dictionary containing performances. It has the form:
-        {'accuracy': accuracy, 'evasion': evasion,.... any other metrics defined by the bot}
+        Resets the training tracking of a bot just after it has been trained. The current performance is updated to be
+        the previous performance.
+        :param map_type: optional type of map the bot was trained on. Defaults to the current map type.
         :return:
         """
+        if map_type is None:
+            map_type = self.map_type
+        # A single update in the store, so a game recorded in the background at the same time cannot undo it.
+        store.reset_training_state(self.bot_name, self.opponent_name, map_type)
 
-        # If we have never tracked the bot, initialise the metrics to track.
-        if 'games_since_training' not in self.opponent_profile['misc']:
-            self.opponent_profile['misc']['games_since_training'] = {}
-            self.opponent_profile['misc']['accuracy_before_training'] = {}
-            self.opponent_profile['misc']['accuracy_after_training'] = {}
-
-        # If we have never tracked the bot for a map type, set the performance as the one of the last game.
-        if self.map_type not in self.opponent_profile['misc']['games_since_training']:
-            self.opponent_profile['misc']['games_since_training'][self.map_type] = 1
-            self.opponent_profile['misc']['accuracy_before_training'][self.map_type] = 0
-            self.opponent_profile['misc']['accuracy_after_training'][self.map_type] = last_performance['accuracy']
-
-        # Otherwise we are currently tracking the bot after some training.
-        else:
-            # Increment the games played since training.
-            self.opponent_profile['misc']['games_since_training'][self.map_type] += 1
-            previous_accuracy = self.opponent_profile['misc']['accuracy_after_training'][self.map_type]
-            new_accuracy = last_performance['accuracy']
-            games_in_avg = self.opponent_profile['misc']['games_since_training'][self.map_type]
-            # Update the bot's average accuracy after training incrementally.
-            self.opponent_profile['misc']['accuracy_after_training'][self.map_type] = \
-                previous_accuracy + (new_accuracy - previous_accuracy) / games_in_avg
-
-    def _reset_training_performance(self):
+    def display_training_status(self):
         """
-        Resets the training tracking of a bot just after it has been trained. The current performance is updated to be
-        the previous performance.
+        This function displays the state of the trainings in the background process, if there are any: the running
+        training, how many are queued and how many have finished or failed so far.
         :return:
         """
-        self.opponent_profile['misc']['games_since_training'][self.map_type] = 0
-        self.opponent_profile['misc']['accuracy_before_training'][self.map_type] = \
-            self.opponent_profile['misc']['accuracy_after_training'][self.map_type]
-        self.opponent_profile['misc']['accuracy_after_training'][self.map_type] = 0
+        status = training_runner.get_status()
+        if status is None:
+            return
+        if status['running']:
+            bot_name, opponent_name, map_type = status['running']
+            print('Training', bot_name, 'against', opponent_name, 'on', map_type, 'maps in the background.')
+        print('Background trainings: queued:', len(status['queued']), '| finished:', status['finished'],
+              '| failed:', status['failed'])
 
     def _generate_profile(self):
         """
-        Generates a dictionary holding a barebones profile of the bot and opponent.
+        Generates a barebones profile of the bot and opponent. Games, heuristics and training state are added to it as
+        they come.
         :return:
         """
         print('\nBot', self.bot.bot_name, 'has not played', self.opponent_name, 'before.')
-        self.opponent_profile = {'bot_name': self.bot.bot_name,
-                                 'opponent_name': self.opponent_name,
-                                 # Contains mapping of game_id:[interesting statistics about the game]
-                                 'games': {},
-                                 # Contains current heuristic values to use for the opponent.
-                                 'heuristics': {},
-                                 # Anything else.
-                                 'misc': {}}
+        store.create_profile(self.bot_name, self.opponent_name, self.bot.bot_name)
 
     def display_play_stats(self):
         """
@@ -392,43 +451,40 @@ class AI:
         accuracy and evasion
         accuracy and evasion on current map type
 
-        Note: a lot of this information is re-calculated from the opponent_profile rather than cached,
-        so this function can become slower as the opponent profile grows in games.
+        Note: this information comes from the running totals of the profile store, so it takes the same time however
+        many games have been played.
 
         :return:
         """
-        if self.opponent_profile:
+        display_name = store.get_display_name(self.bot_name, self.opponent_name)
+        stats = store.get_stats(self.bot_name, self.opponent_name)
+        if display_name and stats['games'] > 0:
             # Print banner
-            print('\n---', self.opponent_profile['bot_name'], 'vs:', self.opponent_profile['opponent_name'], '---')
+            print('\n---', display_name, 'vs:', self.opponent_name, '---')
 
-            game_stats = self.opponent_profile['games'].values()
-            print('Games played:', len(game_stats))
+            print('Games played:', stats['games'])
 
             # Calculate win rate
-            wins = [game['victory'] for game in game_stats]
-            avg_wins = wins.count(True) / len(wins)
+            avg_wins = stats['wins'] / stats['games']
             win_str = 'Win rate: ' + '{:.3f}'.format(avg_wins * 100) + '%'
 
-            map_wins = [game['victory'] for game in game_stats if game['map_type'] == self.map_type]
-            if map_wins:
-                avg_map_wins = map_wins.count(True) / len(map_wins)
+            map_stats = store.get_stats(self.bot_name, self.opponent_name, self.map_type)
+            if map_stats['games'] > 0:
+                avg_map_wins = map_stats['wins'] / map_stats['games']
                 win_str += '     ' + self.map_type + ': ' + '{:.3f}'.format(avg_map_wins * 100) + '%'
 
             print(win_str)
 
             # Calculate accuracy and evasion.
-            avg_accuracy = np.average([game['accuracy'] for game in game_stats])
-            avg_evasion = np.average([game['evasion'] for game in game_stats])
+            avg_accuracy = stats['accuracy']
+            avg_evasion = stats['evasion']
             print('Average accuracy:', '{:.3f}'.format(avg_accuracy * 100) + '%     ',
                   'Average evasion:', '{:.3f}'.format(avg_evasion * 100) + '%')
 
-            avg_map_accuracies = [g['accuracy'] for g in game_stats if g['map_type'] == self.map_type]
-            avg_map_evasions = [g['evasion'] for g in game_stats if g['map_type'] == self.map_type]
-
             # In case this is the first game on this type of map, do not show any performances.
-            if avg_map_accuracies and avg_map_evasions:
-                avg_map_accuracy = np.average(avg_map_accuracies)
-                avg_map_evasion = np.average(avg_map_evasions)
+            if map_stats['games'] > 0:
+                avg_map_accuracy = map_stats['accuracy']
+                avg_map_evasion = map_stats['evasion']
                 print('Average', self.map_type, 'accuracy:', '{:.3f}'.format(avg_map_accuracy * 100) + '%     ',
                       'Average', self.map_type, 'evasion:', '{:.3f}'.format(avg_map_evasion * 100) + '%')
             print()
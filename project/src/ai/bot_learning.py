@@ -4,19 +4,38 @@
 
 # Project imports
 import src.ai.board_info as board_info
+import src.utils.board_archive as archive
 import src.utils.file_io as io
 import src.ai.heuristics as heur
 import lib.blackbox as bb  # optimisation function
+import lib.halving as halving  # multi-fidelity optimisation function
 import src.ai.offensive_explorer as explorer
+import src.utils.game_log as game_log
+import src.utils.rollout_cache as rollout_cache
 
 # Library imports
 import copy
+import hashlib
+import math
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import time
 
 BB_GLOBAL_CALLS = 10  # Number of global search calls the black box optimisation makes.
 BB_LOCAL_CALLS = 5  # Number of local search calls the black box optimisation makes.
+BB_WARM_GLOBAL_CALLS = 4  # Number of global search calls when warm-starting from a previous training.
+BB_ACQUISITION = 'vectorized'  # How the black box chooses new points: 'vectorized' or 'slsqp' (the original method).
 PARALLEL_CALLS = 4  # Default number of threads that will investigate different parameters.
+ROLLOUT_PROCESSES = None  # Number of processes simulating games for all investigated parameters. None for all cores.
+OPTIMISATION_STRATEGY = 'blackbox'  # Either 'blackbox' or 'halving' (multi-fidelity successive halving).
+HALVING_CANDIDATES = 27  # Number of candidates successive halving screens at the lowest fidelity.
+HALVING_REDUCTION = 3  # Successive halving promotes 1/HALVING_REDUCTION candidates to a fidelity this many times higher.
+TIME_BUDGET = None  # Wall-clock seconds an optimisation may take. None for no limit.
+ROLLOUT_SEED = 0  # Seed for simulating games, so evaluations are reproducible and cacheable. None for no seed.
+CHECKPOINT_INTERVAL = 30  # Seconds between checkpoints of a black box optimisation. 0 to checkpoint every evaluation.
+
+_worker_optimiser = None  # The optimiser a worker process of the rollout pool simulates games with.
 
 
 class Optimiser:
@@ -30,15 +49,27 @@ class Optimiser:
     prepare_offensive_games(game ids): so the optimiser knows what games to load and optimise over.
     """
 
-    def __init__(self, bot_name, opponent_name, bot_location):
+    def __init__(self, bot_name, opponent_name, bot_location, use_rollout_cache=True):
         self.bot_name = bot_name
         self.opponent_name = opponent_name
-        self.opponent_profile = io.load_profile(bot_name, self.opponent_name)  # profile as defined in ai.py
         self.bot_location = bot_location  # module location from which to load the bot.
         self.games = None  # list of game_state-like dictionaries that hold everything necessary to optimise over a game.
-        self.heuristics = []  # list of heuristic functions.
-        self.heuristic_names = []  # list of heuristic names.
+        self.map_type = None  # type of map the games were played on, if known.
+        self.heuristic_names = ()  # tuple of heuristic names. Their values are only bound per evaluation.
         self.optimisation_type = None
+        self.seed = ROLLOUT_SEED  # seed for simulating games.
+        self.game_executor = None  # pool to simulate games in parallel with. If None, games are played in turn.
+        # cache of previously simulated games, shared with other optimisers of this bot and opponent.
+        self.rollout_cache = None
+        if use_rollout_cache:
+            self.rollout_cache = rollout_cache.RolloutCache(bot_name, opponent_name,
+                                                            rollout_cache.bot_version(bot_location))
+
+    def __getstate__(self):
+        # The pool cannot be shared, so it is not shipped to worker processes.
+        state = self.__dict__.copy()
+        state['game_executor'] = None
+        return state
 
     def prepare_heuristics(self, chosen_heuristics):
         """
@@ -47,29 +78,39 @@ class Optimiser:
         :return:
         """
         for h in chosen_heuristics:
-            self.heuristic_names.append(h)
-            self.heuristics.append([getattr(heur, h)])
+            getattr(heur, h)  # fail early on heuristics that do not exist.
+        self.heuristic_names += tuple(chosen_heuristics)
 
-    def prepare_offensive_games(self, game_ids):
+    def prepare_offensive_games(self, game_ids, map_type=None):
         """
-        Load the list of stored games pick the ones with the desired game ids. Then for each one, choose the final state
-        and remove all fired shots, keeping the ship positions.
+        Load the games with the desired game ids from the board archives, which hold the final opponent board of each
+        game. Games that are missing from the archives (e.g. ones recorded before archives existed) are read from the
+        game log instead: for each one, choose the final state and remove all fired shots, keeping the ship positions.
         :param game_ids: A list of integer game ids for the game to load. Note that these have to be present in the
         game log or there will be errors.
+        :param map_type: optional type of map the games were played on. If not given, all archives are searched.
         :return:
         """
+        self.map_type = map_type
+        found = {}
+        for m_t in ([map_type] if map_type else ['land', 'no-land']):
+            stored = archive.load_archive(self.bot_name, self.opponent_name, m_t)
+            if stored is not None:
+                found.update(archive.get_games(stored, game_ids))
 
-        # Load serialised games
-        all_games = io.load_pickled_game_log(self.bot_name, self.opponent_name)
-        self.games = []
+        # Only read logged games if some are not in an archive, and then only their final states.
+        missing = [game_id for game_id in game_ids if game_id not in found]
+        if missing:
+            final_states = game_log.load_final_states(self.bot_name, self.opponent_name, missing)
+            for game_id in missing:
+                # Get last known board of the game.
+                final_state = final_states[game_id]
+                opp_board = _extract_original_opp_board(final_state['OppBoard'])
+                found[game_id] = {'game_id': game_id, 'opp_board': opp_board, 'ships': final_state['Ships']}
 
-        for game_id in game_ids:
-            game_states = all_games[game_id]
-            # Get last known board of the game.
-            opp_board = _extract_original_opp_board(game_states[-1]['OppBoard'])
-            self.games.append({'game_id': game_id, 'opp_board': opp_board, 'ships': game_states[-1]['Ships']})
+        self.games = [found[game_id] for game_id in game_ids]
 
-    def play_games(self, heuristic_values):
+    def play_games(self, heuristic_values, fidelity=1.):
         """
         The function to be fed to the optimisation algorithm. It works by exploring each game and counting the hits and
         misses in the terminal state, effectively measuring accuracy. It then averages them for the game and moves on
@@ -78,64 +119,238 @@ class Optimiser:
 
         minimise: the average number of misses
         maximise: the accuracy (hits/(misses+hits))
+
+        A fidelity below 1 makes for a cheaper, but noisier evaluation: only that fraction of the games (the first ones)
+        is played and that fraction of the boards sampled per game.
         :param heuristic_values: a list of heuristic values that the optimisation algorithm chooses to test.
+        :param fidelity: a number in (0, 1], where 1 is a full evaluation.
         :return: a floating number representing a score.
         """
+        games = self.games[:max(1, int(math.ceil(fidelity * len(self.games))))]
+        samples = max(1, int(math.ceil(fidelity * explorer.BOARD_SAMPLES)))
 
-        # Pair each heuristic function with the respective weight.
-        for heuristic, val in zip(self.heuristics, heuristic_values):
-            heuristic.append(val)
-
-        misses = [] # list of average miss counts per game
-        hits = [] # list of average hit counts per game
+        # Reuse the result of previous simulations of these games with the same heuristic values where there are any.
+        results = [None] * len(games)
+        if self.rollout_cache:
+            results = [self.rollout_cache.get(game['game_id'], self.heuristic_names, heuristic_values,
+                                              samples, self.seed) for game in games]
+        missing = [idx for idx, result in enumerate(results) if result is None]
 
-        for game in self.games:
-            disposable_game = copy.deepcopy(game) # Need to copy this as this function will be called multiple times.
-            # Call for the explorer to explore this board's game tree.
-            sampled_games = explorer.init_bfs(self.bot_location, self.heuristics, disposable_game['opp_board'],
-                                              disposable_game['ships'], explorer.BOARD_SAMPLES)
-            sampled_misses = []
-            sampled_hits = []
+        # Simulate the remaining games. With a game executor, each game is a separate task, so the games of all the
+        # values currently being evaluated are spread over all of its processes.
+        if self.game_executor:
+            played = self.game_executor.map(_play_game_in_worker,
+                                            [(idx, heuristic_values, samples) for idx in missing], chunksize=1)
+        else:
+            heuristics = heur.bind(self.heuristic_names, heuristic_values)
+            played = [self._play_game(games[idx], heuristics, samples) for idx in missing]
 
-            # Average the misses & hits for a game.
-            for s_g in sampled_games:
-                result = board_info.count_hits_and_misses(s_g)
-                sampled_misses.append(result['misses'])
-                sampled_hits.append(result['hits'])
+        for idx, result in zip(missing, played):
+            results[idx] = result
+            if self.rollout_cache:
+                self.rollout_cache.put(games[idx]['game_id'], self.heuristic_names, heuristic_values,
+                                       samples, self.seed, result)
 
-            misses.append(np.average(sampled_misses))
-            hits.append(np.average(sampled_hits))
+        misses = [result['misses'] for result in results]  # list of average miss counts per game
+        hits = [result['hits'] for result in results]  # list of average hit counts per game
 
         # Choose which score to return based on optimisation type.
         if self.optimisation_type == 'minimise':
             return np.average(misses)
         if self.optimisation_type == 'maximise':
-            return np.average(np.divide(hits, misses + hits))
+            return np.average(np.divide(hits, np.add(misses, hits)))
 
-    def optimise(self):
+    def _play_game(self, game, heuristics, samples):
         """
-        This function makes the call to the optimisation algorithm black-box. The details of how it works can be found
-        on the creator's page: https://github.com/paulknysh/blackbox.
-        :return:
+        Has the explorer sample games on a board with the given heuristics and averages their hits and misses.
+        :param game: a dictionary holding the game_id, the original opponent board and ships of a game.
+        :param heuristics: a tuple of heuristic tuples in the form: (heuristic function, heuristic weight), as made by
+        heuristics.bind().
+        :param samples: the number of boards to sample.
+        :return: a dictionary of the form {'misses': average misses, 'hits': average hits}.
         """
+        disposable_game = copy.deepcopy(game) # Need to copy this as this function will be called multiple times.
+        # Seed each game separately, so its result does not depend on the order in which games are played.
+        seed = None if self.seed is None else str(self.seed) + '-' + str(game['game_id'])
+        # Call for the explorer to explore this board's game tree.
+        sampled_games = explorer.init_bfs(self.bot_location, heuristics, disposable_game['opp_board'],
+                                          disposable_game['ships'], samples, seed=seed)
+        sampled_misses = []
+        sampled_hits = []
+
+        # Average the misses & hits for a game.
+        for s_g in sampled_games:
+            result = board_info.count_hits_and_misses(s_g)
+            sampled_misses.append(result['misses'])
+            sampled_hits.append(result['hits'])
+
+        return {'misses': np.average(sampled_misses), 'hits': np.average(sampled_hits)}
+
+    def optimise(self, warm_start=True, strategy=None, time_budget=None, checkpoint=True):
+        """
+        This function makes the call to one of two optimisation strategies:
+
+        blackbox: the optimisation algorithm black-box. The details of how it works can be found on the creator's page:
+        https://github.com/paulknysh/blackbox.
+        halving: successive halving (see lib/halving.py), which screens many candidates on few games and boards and
+        only evaluates the best ones on all of them.
+
+        The fully evaluated points are stored in the training history of the bot and opponent. If warm_start is set and
+        an earlier training of the same heuristics and map type exists, its points seed the black-box search: points
+        evaluated on the very same games (and samples, seed and bot version) are reused as they are and otherwise, the
+        best previous points are evaluated again on the current games (mostly from the rollout cache, as game sets
+        overlap). The global stage is then reduced to BB_WARM_GLOBAL_CALLS.
+
+        If checkpoint is set, the state of a black-box search is stored under the opponent's data directory every
+        CHECKPOINT_INTERVAL seconds, together with a text file of the points evaluated so far. An optimisation of the
+        same heuristics on the same games that finds such a checkpoint continues from it instead of starting over.
+
+        With a time budget, the black-box search estimates the duration of an evaluation from the first ones and cuts
+        down both stages to fit into the budget. It returns the best point found so far once the budget runs out and
+        reports how much of the planned search it completed.
+        :param warm_start: whether to seed the black-box search with the points of the previous training.
+        :param strategy: optional name of the strategy. Defaults to OPTIMISATION_STRATEGY.
+        :param time_budget: optional wall-clock seconds the optimisation may take. Defaults to TIME_BUDGET.
+        :param checkpoint: whether to checkpoint and resume a black-box search.
+        :return: the best point found, as a list of heuristic values followed by its score.
+        """
+        if strategy is None:
+            strategy = OPTIMISATION_STRATEGY
+        if time_budget is None:
+            time_budget = TIME_BUDGET
+
         boxes = []
         for name in self.heuristic_names:
             boxes.append(heur.SEARCH_RANGES[name])
 
+        history = io.load_training_history(self.bot_name, self.opponent_name) or {}
+        history_key = (self.map_type, self.heuristic_names)
+        fingerprint = self._games_fingerprint()
+
+        # A single scheduler is used for the whole optimisation. It evaluates a batch of values concurrently and
+        # simulates the games of all of them on one shared pool of processes.
+        def executor():
+            return RolloutScheduler(self, PARALLEL_CALLS, ROLLOUT_PROCESSES)
+
         start = time.time()
-        print('Starting optimisation of:', ','.join(self.heuristic_names))
-        result = bb.search(f=self.play_games,  # given function
-                           box=boxes,  # range of values for each parameter
-                           n=BB_GLOBAL_CALLS,  # number of function calls on initial stage (global search)
-                           m=BB_LOCAL_CALLS,  # number of function calls on subsequent stage (local search)
-                           batch=PARALLEL_CALLS,  # number of calls that will be evaluated in parallel
-                           resfile='output.csv')  # text file where results will be saved
+        print('Starting', strategy, 'optimisation of:', ','.join(self.heuristic_names))
+        if strategy == 'halving':
+            result, fidelity = halving.search(f=self.play_games,  # given function, taking a fidelity
+                                              box=boxes,  # range of values for each parameter
+                                              n=HALVING_CANDIDATES,  # number of candidates at the lowest fidelity
+                                              eta=HALVING_REDUCTION,  # reduction factor between fidelities
+                                              time_budget=time_budget,  # seconds after which no fidelity is started
+                                              executor=executor,  # scheduler evaluating the function in parallel
+                                              latin_cache=io.get_design_cache_dir())  # cache of initial designs
+        else:
+            previous = history.get(history_key, []) if warm_start else []
+            prior = [p['heuristics'] + [p['loss']] for p in previous if p['fingerprint'] == fingerprint]
+            outdated = sorted((p for p in previous if p['fingerprint'] != fingerprint), key=lambda p: p['loss'])
+            global_calls = BB_GLOBAL_CALLS
+            if previous:
+                global_calls = max(BB_WARM_GLOBAL_CALLS, len(boxes) + 1)
+                print('Warm-starting from', len(previous), 'points of the previous training.')
+
+            # The ask/tell optimiser proposes a new point whenever an evaluation finishes, so the scheduler never
+            # waits for the slowest evaluation of a batch.
+            opt = self._load_checkpoint(fingerprint) if checkpoint else None
+            if opt is None:
+                opt = bb.BlackBox(box=boxes,  # range of values for each parameter
+                                  n=global_calls,  # number of function calls on initial stage (global search)
+                                  m=BB_LOCAL_CALLS,  # number of function calls on subsequent stage (local search)
+                                  x0=[p['heuristics'] for p in outdated],  # previous points to evaluate again
+                                  prior=prior,  # previous points that are still valid
+                                  latin_cache=io.get_design_cache_dir(),  # cache of initial designs
+                                  acquisition=BB_ACQUISITION)  # how the next points are chosen
+
+            last_checkpoint = time.time()
+
+            def save_progress(opt):
+                nonlocal last_checkpoint
+                if checkpoint and time.time() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self._save_checkpoint(opt, fingerprint)
+                    last_checkpoint = time.time()
+
+            with executor() as e:
+                result = bb.run_async(opt, self.play_games, e, PARALLEL_CALLS, callback=save_progress,
+                                      time_budget=time_budget)
+            evaluated, planned = opt.progress()
+            if evaluated < planned:
+                print('Time budget allowed', evaluated, 'of', planned, 'planned evaluations',
+                      '({:.0%}).'.format(evaluated / planned))
+            if checkpoint:
+                self._clear_checkpoint()
+            fidelity = 1.
 
         print('Completed after', '{:.3f}'.format(time.time() - start) + 's')
+        if self.rollout_cache:
+            self.rollout_cache.prune()  # keep the cache of simulated games within its size limit.
+
+        # Store the evaluated points for the next training, if they were evaluated on all games. The history is
+        # loaded again under a lock, as other trainings against the opponent may have stored theirs in the meantime.
+        if fidelity == 1.:
+            with io.lock(io.get_training_history_path(self.bot_name, self.opponent_name)):
+                history = io.load_training_history(self.bot_name, self.opponent_name) or {}
+                history[history_key] = [{'heuristics': list(point[:-1]), 'loss': float(point[-1]),
+                                         'fingerprint': fingerprint} for point in result]
+                io.save_training_history(history, self.bot_name, self.opponent_name)
+        else:
+            print('Time budget ran out at a fidelity of', '{:.3f}'.format(fidelity))
 
         # Get top parameter values.
         return result[0]
 
+    def _load_checkpoint(self, fingerprint):
+        """
+        Restores the black-box search of an interrupted optimisation of the same heuristics on the same games.
+        :param fingerprint: the fingerprint of the current games, see _games_fingerprint().
+        :return: a lib.blackbox.BlackBox, or None if there is nothing to resume.
+        """
+        saved = io.load_training_checkpoint(self.bot_name, self.opponent_name, self.map_type) or {}
+        if saved.get('state') is None or saved.get('heuristic_names') != self.heuristic_names or \
+                saved.get('fingerprint') != fingerprint:
+            return None
+
+        opt = bb.BlackBox.from_state(saved['state'])
+        print('Resuming from a checkpoint with', len(opt.result()), 'evaluated points.')
+        return opt
+
+    def _save_checkpoint(self, opt, fingerprint):
+        """
+        Stores the state of a black-box search, keeping anything else the checkpoint holds (such as the training job).
+        :param opt: a lib.blackbox.BlackBox.
+        :param fingerprint: the fingerprint of the current games, see _games_fingerprint().
+        :return:
+        """
+        saved = io.load_training_checkpoint(self.bot_name, self.opponent_name, self.map_type) or {}
+        saved.update({'heuristic_names': self.heuristic_names, 'fingerprint': fingerprint, 'state': opt.get_state()})
+        io.save_training_checkpoint(saved, self.bot_name, self.opponent_name, self.map_type)
+        bb.save_results(opt.result(), io.get_training_points_path(self.bot_name, self.opponent_name, self.map_type))
+
+    def _clear_checkpoint(self):
+        """
+        Removes the state of a finished black-box search. The checkpoint itself is kept if it holds anything else.
+        :return:
+        """
+        saved = io.load_training_checkpoint(self.bot_name, self.opponent_name, self.map_type)
+        if saved is None:
+            return
+        saved.pop('state', None)
+        if 'job' in saved:
+            io.save_training_checkpoint(saved, self.bot_name, self.opponent_name, self.map_type)
+        else:
+            io.remove_training_checkpoint(self.bot_name, self.opponent_name, self.map_type)
+
+    def _games_fingerprint(self):
+        """
+        Identifies everything an evaluation depends on apart from the heuristic values: the games, how they are
+        simulated and the bot's code. Scores with the same fingerprint are comparable.
+        :return: a hash string.
+        """
+        identity = (sorted(game['game_id'] for game in self.games), explorer.BOARD_SAMPLES, self.seed,
+                    self.optimisation_type, rollout_cache.bot_version(self.bot_location))
+        return hashlib.sha1(repr(identity).encode('utf-8')).hexdigest()
+
     def set_optimisation_type(self, type):
         """
         Sets whether to the optimisation function should maximise or minimise.
@@ -146,6 +361,81 @@ class Optimiser:
 
 
 
+class RolloutScheduler:
+    """
+    Schedules the evaluation of heuristic values on two levels. The values of a batch are each evaluated in their own
+    thread and each of these threads splits its evaluation into one task per game. All these tasks share one pool of
+    processes, so the cores stay busy even when fewer values are evaluated at once than there are cores. The processes
+    receive the optimiser (and with it the games) once when they start, so each task only carries the index of a game
+    and the heuristic values to play it with.
+
+    It behaves like the executor lib.blackbox expects: a context manager with a map method, and apply_async for
+    evaluations that are started one at a time.
+    """
+
+    def __init__(self, optimiser, batch, processes=None):
+        self.optimiser = optimiser  # a fully prepared optimiser.
+        self.batch = batch  # number of values evaluated at once.
+        self.processes = processes  # number of processes simulating games. None for all cores.
+        self.candidate_pool = None
+        self.game_pool = None
+
+    def __enter__(self):
+        self.game_pool = mp.Pool(self.processes, initializer=_init_worker, initargs=(self.optimiser,))
+        self.candidate_pool = ThreadPool(self.batch)
+        self.optimiser.game_executor = self.game_pool
+        return self
+
+    def __exit__(self, *args):
+        # Also reached by an exception, e.g. an interrupted training, so the pools are always shut down.
+        self.optimiser.game_executor = None
+        self.candidate_pool.terminate()
+        self.game_pool.terminate()
+        self.candidate_pool.join()
+        self.game_pool.join()
+
+    def map(self, f, values):
+        """
+        Evaluate a function for each of the values concurrently.
+        :param f: the function to evaluate, typically the optimiser's play_games.
+        :param values: a list of heuristic value lists.
+        :return: a list of the function's results, in the order of values.
+        """
+        return self.candidate_pool.map(f, values, chunksize=1)
+
+    def apply_async(self, f, args, callback=None, error_callback=None):
+        """
+        Start evaluating a function for one set of heuristic values, without waiting for it to finish.
+        :param f: the function to evaluate, typically the optimiser's play_games.
+        :param args: a tuple of arguments of f.
+        :param callback: called with the result of f.
+        :param error_callback: called with the exception if f raised one.
+        :return: an AsyncResult.
+        """
+        return self.candidate_pool.apply_async(f, args, callback=callback, error_callback=error_callback)
+
+
+def _init_worker(optimiser):
+    """
+    Initialiser of a worker process in the rollout pool. Stores the optimiser for all later simulations.
+    :param optimiser: a fully prepared Optimiser.
+    :return:
+    """
+    global _worker_optimiser
+    _worker_optimiser = optimiser
+
+
+def _play_game_in_worker(task):
+    """
+    Simulates one game with the optimiser the worker process was initialised with.
+    :param task: a tuple of (index of the game in the optimiser's games, list of heuristic values, boards to sample).
+    :return: a dictionary of the form {'misses': average misses, 'hits': average hits}.
+    """
+    idx, heuristic_values, samples = task
+    return _worker_optimiser._play_game(_worker_optimiser.games[idx],
+                                        heur.bind(_worker_optimiser.heuristic_names, heuristic_values), samples)
+
+
 def _extract_original_opp_board(finished_board):
     """
     This function removes all shots that have been fired on it, reverting sunken ships to normal. Notably, coordinates
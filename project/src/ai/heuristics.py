@@ -11,6 +11,17 @@ SEARCH_RANGES = {
 }
 
 
+def bind(heuristic_names, heuristic_values):
+    """
+    Pairs each named heuristic with the value to use it with. The pairing is immutable, so it can be shared by games
+    played concurrently without the values of one evaluation leaking into another.
+    :param heuristic_names: a list of names of heuristics in this module.
+    :param heuristic_values: a list of heuristic values, in the same order as the names.
+    :return: a tuple of heuristic tuples in the form: (heuristic function, heuristic weight).
+    """
+    return tuple((globals()[name], float(val)) for name, val in zip(heuristic_names, heuristic_values))
+
+
 def ship_adjacency(cell_modifiers, ship_modifiers, ship_sets, board, adj_weight):
     """
     Calculates which possible deployable ships are adjacent to known ships. It then multiplies each of these ships'
@@ -12,7 +12,7 @@ import importlib
 BOARD_SAMPLES = 100  # Number of boards to sample from a board
 
 
-def init_bfs(bot_location, heuristics, board, ships, state_limit=BOARD_SAMPLES, randomise=True):
+def init_bfs(bot_location, heuristics, board, ships, state_limit=BOARD_SAMPLES, randomise=True, seed=None):
     """
     This function loads a bot and then has it generate a game tree of the possible plays on the board. It initially
     traverses the tree in a breadth-first search until it has found branches <= state_limit. Branches where each child is
@@ -27,16 +27,18 @@ def init_bfs(bot_location, heuristics, board, ships, state_limit=BOARD_SAMPLES,
     :param state_limit: a number that sets an upper limit as to how many games to explore and return
     :param randomise: An extra parameter that decides whether to randomly choose from the bot's suggested moves as
     opposed to always picking the first one. Notably, this is only relevant when playing towards a terminal state.
+    :param seed: optional seed for the random choices, making the sampled games reproducible.
     :return: a list of boards, where each board has all ships sunk.
     """
     bot = getattr(importlib.import_module(bot_location), 'Bot')()  # load the bot
     bot.set_heuristics(heuristics)  # set the bot's heuristics.
+    rng = random.Random(seed)  # own random generator, so concurrent explorations do not share state.
 
-    games = _bfs_games(bot, board, ships, state_limit, randomise)
+    games = _bfs_games(bot, board, ships, state_limit, randomise, rng)
     return games
 
 
-def _bfs_games(bot, board, ships, state_limit, randomise):
+def _bfs_games(bot, board, ships, state_limit, randomise, rng=random):
     """
     Performs a BFS on the board's possible states. Each iteration, it removes an element (board) and has the bot suggest
      a list of moves. It then performs each move and adds the new boards to the queue. After each move, it also has to
@@ -52,6 +54,7 @@ def _bfs_games(bot, board, ships, state_limit, randomise):
     :param state_limit: a number that sets an upper limit as to how many games to explore and return
     :param randomise: An extra parameter that decides whether to randomly choose from the bot's suggested moves as
     opposed to always picking the first one. Notably, this is only relevant when playing towards a terminal state.
+    :param rng: the random generator used to choose between the bot's suggested moves.
     :return: a list of boards, where each board has all ships sunk.
     """
     masked_opp_board = _mask_board(board)  # Create a copy of the board with the visible ships that hides them.
@@ -90,7 +93,7 @@ def _bfs_games(bot, board, ships, state_limit, randomise):
             bot.make_move(game_state)
             # Choose the next move randomly, or let it be the first of the possible options.
             if randomise:
-                choice = random.choice(bot.last_choices)
+                choice = rng.choice(bot.last_choices)
             else:
                 choice = bot.last_choices[0]
 
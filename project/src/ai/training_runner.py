@@ -0,0 +1,302 @@
+# This module runs bot trainings in a separate process, so that games can continue to be played while a bot is being
+# trained. Trainings are submitted as jobs to a queue. The process works through them one after another and hands
+# each result over by writing it to the opponent's data directory, from where the AI picks it up before the next game.
+#
+# The runner is stopped when the client exits, before the writes still queued in the background (see write_behind.py)
+# are carried out, so a training those writes decide on is not started. Stopping ends the process with SIGTERM, which
+# the process turns into SystemExit, so a running training shuts down the processes simulating its games.
+
+# project imports
+import src.ai.bot_learning as bot_learn
+import src.utils.file_io as io
+import src.utils.write_behind as write_behind
+
+# library imports
+import atexit
+import importlib
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import traceback
+
+MAX_TRAINING_ATTEMPTS = 3  # A training that fails this many times is given up rather than resumed again.
+
+# Settings the training process needs, by module. config_manager applies them in the game process, but a process that
+# is spawned rather than forked (e.g. on Windows and macOS) starts out with the modules' defaults, so they are handed
+# over to it.
+TRAINING_SETTINGS = {'src.ai.bot_learning': ('OPTIMISATION_STRATEGY', 'HALVING_CANDIDATES', 'HALVING_REDUCTION',
+                                             'TIME_BUDGET', 'BB_GLOBAL_CALLS', 'BB_LOCAL_CALLS', 'BB_WARM_GLOBAL_CALLS',
+                                             'BB_ACQUISITION', 'CHECKPOINT_INTERVAL', 'PARALLEL_CALLS',
+                                             'ROLLOUT_PROCESSES', 'ROLLOUT_SEED'),
+                     'src.ai.heuristics': ('SEARCH_RANGES',),
+                     'src.ai.offensive_explorer': ('BOARD_SAMPLES',),
+                     'src.utils.rollout_cache': ('MAX_CACHED_ROLLOUTS', 'HEURISTIC_PRECISION'),
+                     'src.utils.file_io': ('DATA_DIR',),
+                     'src.ai.training_runner': ('MAX_TRAINING_ATTEMPTS',)}
+
+_runner = None  # The runner of the game process, created on first use.
+_stopped = False  # Whether the game process is exiting, after which no runner is started.
+_runner_lock = threading.Lock()  # guards the creation of the runner against the process exiting.
+
+
+class TrainingRunner:
+    """
+    Runs training jobs in a background process. A job is a dictionary of the form:
+
+        {'bot_name': name of the bot, 'opponent_name': name of the opponent, 'bot_location': module path to the bot,
+        'heuristic_names': list of heuristic names to train, 'map_type': type of map to train on,
+        'game_ids': list of ids of the games to train on, 'optimisation_type': 'minimise' or 'maximise'}
+
+    At most one job per bot, opponent and map type is queued or running at any time. Jobs may be submitted from
+    several threads (the game thread and the write-behind thread).
+    """
+
+    def __init__(self):
+        self.jobs = mp.Queue()  # jobs waiting to be run.
+        self.updates = mp.Queue()  # status updates sent back by the process.
+        self.process = None
+        self.queued = []  # keys of submitted jobs that have not started.
+        self.running = None  # key of the running job.
+        self.finished = 0  # number of successfully finished jobs.
+        self.failed = 0  # number of jobs that raised an error.
+        self.stopped = False  # whether the runner has been stopped, after which no jobs are accepted.
+        self.lock = threading.Lock()  # guards the bookkeeping above.
+
+    def submit(self, job):
+        """
+        Queue a training job, starting the background process if it is not running yet.
+        :param job: a job dictionary as described in the class documentation.
+        :return: True if the job was queued, False if the same training is already queued or running, or the runner
+        has been stopped.
+        """
+        with self.lock:
+            self._read_updates()
+            key = job_key(job)
+            if self.stopped or key in self.queued or key == self.running:
+                return False
+
+            if self.process is None or not self.process.is_alive():
+                # The process must not be a daemon, as the optimiser starts processes of its own.
+                self.process = mp.Process(target=_run_jobs, args=(self.jobs, self.updates, training_settings()),
+                                          name='training')
+                self.process.start()
+
+            self.queued.append(key)
+            self.jobs.put(job)
+            return True
+
+    def status(self):
+        """
+        Report on the jobs of this runner.
+        :return: a dictionary of the form {'queued': list of job keys, 'running': job key or None,
+        'finished': count, 'failed': count}, where a job key is a (bot_name, opponent_name, map_type) tuple.
+        """
+        with self.lock:
+            self._read_updates()
+            return {'queued': list(self.queued), 'running': self.running, 'finished': self.finished,
+                    'failed': self.failed}
+
+    def stop(self):
+        """
+        Stop the background process. A running training is abandoned and no more jobs are accepted. Writes still queued
+        in the background (see write_behind.py) are carried out first, but the trainings they submit are not started.
+        :return:
+        """
+        with self.lock:
+            self.stopped = True
+        write_behind.flush()
+        if self.process is not None and self.process.is_alive():
+            self.jobs.put(None)  # ends a process that is waiting for a job.
+            self.process.terminate()
+            self.process.join()
+
+    def _read_updates(self):
+        # Apply all status updates the process has sent so far.
+        while True:
+            try:
+                update, key = self.updates.get_nowait()
+            except queue.Empty:
+                return
+
+            if update == 'started':
+                if key in self.queued:
+                    self.queued.remove(key)
+                self.running = key
+            else:
+                self.running = None
+                if update == 'finished':
+                    self.finished += 1
+                else:
+                    self.failed += 1
+
+
+def get_runner():
+    """
+    Get the training runner of this process, creating it if necessary. It is stopped when the process exits. Once the
+    process is exiting, a new runner is created stopped and accepts no jobs.
+    :return: a TrainingRunner.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = TrainingRunner()
+            _runner.stopped = _stopped
+        return _runner
+
+
+def stop():
+    """
+    Stop the training runner of this process, if any, and refuse to start one from now on. Called when the process
+    exits.
+    :return:
+    """
+    global _stopped
+    with _runner_lock:
+        _stopped = True
+        runner = _runner
+    if runner is not None:
+        runner.stop()
+    else:
+        write_behind.flush()
+
+
+# Registered on import, after write_behind.py registered its own handler, so it runs before the queued writes are
+# carried out (exit handlers run in reverse order). A runner created by an exit handler would never be stopped.
+atexit.register(stop)
+
+
+def get_status():
+    """
+    Report on the background trainings of this process.
+    :return: the status of the runner (see TrainingRunner.status()), or None if nothing was trained in the background.
+    """
+    return _runner.status() if _runner is not None else None
+
+
+def training_settings():
+    """
+    :return: the current values of TRAINING_SETTINGS, as a dictionary of module path:{setting name: value}.
+    """
+    return {location: {name: getattr(importlib.import_module(location), name) for name in names}
+            for location, names in TRAINING_SETTINGS.items()}
+
+
+def apply_settings(settings):
+    """
+    Applies settings as returned by training_settings() to the modules of this process.
+    :return:
+    """
+    for location, values in settings.items():
+        module = importlib.import_module(location)
+        for name, value in values.items():
+            setattr(module, name, value)
+
+
+def run_job(job, store_result):
+    """
+    Run a training job to completion. The job is kept in a checkpoint until its result has been stored, so a client
+    that was closed during the training can resume it (see interrupted_jobs()). A job that raises an error is counted
+    as a failed attempt, and given up after MAX_TRAINING_ATTEMPTS of them.
+    :param job: a job dictionary as described in TrainingRunner.
+    :param store_result: function called with the list of trained heuristic values (in the order of the job's
+    heuristic names) to store them. The job's checkpoint is removed once it returns.
+    :return:
+    """
+    # The checkpoint is locked until the result is stored and the checkpoint removed, so other clients neither resume
+    # the job nor run the same training at the same time (they wait for this one to finish).
+    with io.lock(io.get_training_checkpoint_path(job['bot_name'], job['opponent_name'], job['map_type'])):
+        checkpoint = io.load_training_checkpoint(job['bot_name'], job['opponent_name'], job['map_type']) or {}
+        if checkpoint.get('job') != job:
+            checkpoint = {'job': job}  # a different job on the same map type replaces any state of the previous one.
+        io.save_training_checkpoint(checkpoint, job['bot_name'], job['opponent_name'], job['map_type'])
+
+        try:
+            values = _optimise(job)
+        except Exception:
+            _record_failure(job)
+            raise
+        store_result(values)
+        io.remove_training_checkpoint(job['bot_name'], job['opponent_name'], job['map_type'])
+
+
+def interrupted_jobs(bot_name, opponent_name):
+    """
+    Find the training jobs against an opponent that were started, but never finished. Jobs that are running in
+    another client are left out.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :return: a list of job dictionaries.
+    """
+    jobs = []
+    for checkpoint in io.load_training_checkpoints(bot_name, opponent_name):
+        if 'job' in checkpoint:
+            job = checkpoint['job']
+            with io.lock(io.get_training_checkpoint_path(bot_name, opponent_name, job['map_type']),
+                         blocking=False) as idle:
+                if idle:
+                    jobs.append(job)
+    return jobs
+
+
+def job_key(job):
+    return job['bot_name'], job['opponent_name'], job['map_type']
+
+
+def _optimise(job):
+    # Trains the heuristics of a job, returning their values.
+    o = bot_learn.Optimiser(job['bot_name'], job['opponent_name'], job['bot_location'])  # initialise optimiser
+    o.prepare_heuristics(job['heuristic_names'])  # set heuristics to train.
+    o.set_optimisation_type(job['optimisation_type'])  # set whether to minimise or maximise the evaluation.
+    o.prepare_offensive_games(job['game_ids'], job['map_type'])  # load the games into the optimiser.
+    result = o.optimise()  # run the optimiser.
+    return [float(val) for val in result[:-1]]
+
+
+def _save_result(job, values):
+    # Hands the result of a job run in the background over to the AI.
+    io.save_training_result({'heuristic_names': job['heuristic_names'], 'values': values, 'map_type': job['map_type']},
+                            job['bot_name'], job['opponent_name'])
+
+
+def _record_failure(job):
+    # Counts a failed attempt at a job in its checkpoint, removing the checkpoint once the job is given up. The caller
+    # must hold the lock on the checkpoint.
+    checkpoint = io.load_training_checkpoint(job['bot_name'], job['opponent_name'], job['map_type']) or {'job': job}
+    checkpoint['failures'] = checkpoint.get('failures', 0) + 1
+    if checkpoint['failures'] >= MAX_TRAINING_ATTEMPTS:
+        print('Giving up training on', job['map_type'], 'maps after', checkpoint['failures'], 'failed attempts.')
+        io.remove_training_checkpoint(job['bot_name'], job['opponent_name'], job['map_type'])
+    else:
+        io.save_training_checkpoint(checkpoint, job['bot_name'], job['opponent_name'], job['map_type'])
+
+
+def _exit_on_sigterm(signum, frame):
+    # Stopping the runner terminates the process. Exiting by SystemExit leaves the with blocks of a running training,
+    # so the pools of its rollout scheduler are shut down rather than left behind.
+    raise SystemExit(1)
+
+
+def _run_jobs(jobs, updates, settings=None):
+    """
+    The loop of the background process. Runs each job and stores its result for the AI to pick up.
+    :param jobs: queue of jobs. A None job ends the loop.
+    :param updates: queue to send (update, job key) tuples to, where update is 'started', 'finished' or 'failed'.
+    :param settings: optional settings of the game process, as returned by training_settings().
+    :return:
+    """
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    if settings:
+        apply_settings(settings)
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        key = job_key(job)
+        updates.put(('started', key))
+        try:
+            run_job(job, lambda values: _save_result(job, values))
+            updates.put(('finished', key))
+        except Exception:
+            traceback.print_exc()
+            updates.put(('failed', key))
@@ -1,4 +1,5 @@
 import src.utils.file_io as io
+import src.utils.profile_store as store
 import src.ai.bot_learning as bot_learn
 import src.ai.heuristics as heur
 
@@ -14,8 +15,7 @@ def plot_performance_vs_opponent(bot_names, opponent_name, running_avg_window, g
     colours = ('b', 'g', 'r', 'c', 'm', 'y', 'k')
 
     for name in bot_names:
-        profile = io.load_profile(name, opponent_name)
-        games = profile['games']
+        games = store.get_games(name, opponent_name)
         first_games = sorted(games)[:game_count]
         bot_data['win rate'][name] = calculate_win_rates([games[i]['victory'] for i in first_games])
         bot_data['accuracy'][name] = [games[i]['accuracy'] for i in first_games]
@@ -58,8 +58,9 @@ def plot_heuristic_vs_opponent(bot_location, bot_name, opponent_name, game_count
                                repetitions, specific_games=None, file_name_suffix=''):
     sampled_performances = [[]] * repetitions
     for i in range(repetitions):
+        # Each repetition simulates the games with a different seed, showing how much the evaluation varies.
         sampled_performances[i] = heuristic_vs_opponent(bot_location, bot_name, opponent_name, game_count,
-                                                        heuristic_name, heuristic_values, specific_games)
+                                                        heuristic_name, heuristic_values, specific_games, seed=i)
         plt.plot(heuristic_values, sampled_performances[i])
         print('Min at:', heuristic_values[np.argmin(sampled_performances[i])], 'with performance:',
               min(sampled_performances[i]))
@@ -73,21 +74,23 @@ def plot_heuristic_vs_opponent(bot_location, bot_name, opponent_name, game_count
 
 
 def heuristic_vs_opponent(bot_location, bot_name, opponent_name, game_count, heuristic_name, heuristic_values,
-                          specific_games=None):
+                          specific_games=None, seed=None):
     performances = []
     for h_val in heuristic_values:
         o = bot_learn.Optimiser(bot_name, opponent_name, bot_location)
-        game_dict = o.opponent_profile['games']
         if specific_games:
             games = specific_games
         else:
-            games = [g for g in sorted(game_dict, reverse=True)[:game_count]]
+            games = store.get_recent_game_ids(bot_name, opponent_name, limit=game_count)
         o.prepare_heuristics([heuristic_name])
         o.prepare_offensive_games(games)
         o.set_optimisation_type('minimise')
+        if seed is not None:
+            o.seed = seed
         result = o.play_games([h_val])
         print('Final avg:', '{:.3f}'.format(result))
         performances.append(result)
+        o.rollout_cache.prune()  # keep the cache of simulated games within its size limit.
 
     return performances
 
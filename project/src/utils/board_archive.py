@@ -0,0 +1,327 @@
+# This module keeps a columnar archive of the boards of finished games per bot, opponent and map type. Each column
+# (final opponent boards, our final boards, our shots, the opponent's shots and a metadata table) is a file of
+# fixed-size uint8 rows, one per game in the order the games were recorded. The files are read with numpy.memmap, so
+# training and analysis only touch the rows they use, and the most recent games of a map type are a slice of the
+# archive that copies nothing.
+#
+# The rows of a column live in a generation directory (gen_000000, gen_000001, ...). Games are appended to the columns
+# first and to the metadata table last, so the metadata table decides how many games the archive holds. Once a
+# generation holds twice MAX_GAMES_ARCHIVED games, the most recent MAX_GAMES_ARCHIVED are copied into a new generation
+# and the old one is deleted. Appending holds a lock on the archive and mapping it a shared one, so several clients
+# can archive games against the same opponent at once.
+
+# project imports
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.write_behind as write_behind
+
+# library imports
+import os
+import shutil
+import numpy as np
+
+MAX_GAMES_ARCHIVED = 5000  # The archive keeps at least this many of the most recent games per map type.
+
+BOARD_SIZE = 16  # Boards are padded to BOARD_SIZE x BOARD_SIZE cells.
+MAX_SHIPS = 16  # Largest number of ships in a game.
+MAX_SHOTS = BOARD_SIZE * BOARD_SIZE  # Largest number of shots on a board.
+
+# Codes of the cells of an encoded board.
+WATER = 0  # An empty or unknown cell.
+LAND = 1
+MISS = 2
+HIT = 3  # A hit on a ship that is unknown (opponent's board) or not sunk.
+SHIP = 16  # Ship number k (not hit) has the code SHIP + k.
+HIT_SHIP = 32  # Hit on ship number k has the code HIT_SHIP + k.
+SUNK = 48  # Sunken ship number k has the code SUNK + k.
+OTHER = 254  # Any other cell value.
+PADDING = 255  # Code of cells (or shots) outside a board.
+
+META_DTYPE = np.dtype([('game_id', '<i8'), ('rows', 'u1'), ('columns', 'u1'), ('shots', '<u2'),
+                       ('opp_shots', '<u2'), ('ships', 'u1', (MAX_SHIPS,))])
+COLUMNS = {'opp_boards': (BOARD_SIZE, BOARD_SIZE),  # final opponent boards.
+           'my_boards': (BOARD_SIZE, BOARD_SIZE),  # our final boards.
+           'shots': (MAX_SHOTS, 2),  # (row, column) of our shots in the order they were fired.
+           'opp_shots': (MAX_SHOTS, 2)}  # (row, column) of the opponent's shots in the order they were fired.
+_META_FILE = 'meta.bin'
+_GENERATION_DIR = 'gen_{:06d}'
+
+
+def append_game(bot_name, opponent_name, map_type, game_id, game):
+    """
+    Adds the boards and shots of a finished game to the archive of its map type.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :param map_type: type of map the game was played on.
+    :param game_id: id of the game.
+    :param game: the encoded game, as made by game_encoding.encode_game().
+    :return:
+    """
+    final_state = encoding.decode_turn(game, -1)
+    shots = _shot_sequence(game, 'OppBoard')
+    opp_shots = _shot_sequence(game, 'MyBoard')
+
+    meta = np.zeros(1, dtype=META_DTYPE)
+    meta['game_id'] = game_id
+    meta['rows'], meta['columns'] = len(final_state['OppBoard']), len(final_state['OppBoard'][0])
+    meta['shots'], meta['opp_shots'] = len(shots), len(opp_shots)
+    meta['ships'][0, :len(final_state['Ships'])] = final_state['Ships']
+
+    row = {'opp_boards': encode_board(final_state['OppBoard']),
+           'my_boards': encode_board(final_state['MyBoard']),
+           'shots': _encode_shots(shots),
+           'opp_shots': _encode_shots(opp_shots)}
+    with io.lock(get_archive_dir(bot_name, opponent_name, map_type)):
+        _append_rows(bot_name, opponent_name, map_type, meta,
+                     {column: value[np.newaxis] for column, value in row.items()})
+
+
+def load_archive(bot_name, opponent_name, map_type):
+    """
+    Maps the archive of a map type into memory. Nothing is read from disk until the arrays are accessed.
+    :return: a dictionary of read-only arrays with one row per game, oldest first: 'meta' (META_DTYPE records) and
+    the arrays of COLUMNS, e.g. 'opp_boards' of shape (games, BOARD_SIZE, BOARD_SIZE). None if there is no archive.
+    """
+    # Once mapped, the files of a generation stay readable even if another client compacts the archive.
+    with io.lock(get_archive_dir(bot_name, opponent_name, map_type), shared=True):
+        return _map_archive(bot_name, opponent_name, map_type)
+
+
+def recent_games(archive, count):
+    """
+    Selects the most recent games of an archive without copying them.
+    :param archive: an archive as returned by load_archive().
+    :param count: number of games.
+    :return: an archive of the same form holding the last count games.
+    """
+    return {column: rows[-count:] for column, rows in archive.items()}
+
+
+def get_games(archive, game_ids):
+    """
+    Picks games out of an archive and decodes the original fleet of their opponent boards for training.
+    :param archive: an archive as returned by load_archive().
+    :param game_ids: a list of game ids.
+    :return: a dictionary of game_id:{'game_id': game_id, 'opp_board': original board, 'ships': list of ship lengths}
+    for each of the game ids found in the archive.
+    """
+    # Look the games up in the game id column alone, without building anything per archived game.
+    ids = np.asarray(archive['meta']['game_id'])
+    order = np.argsort(ids, kind='stable')
+    wanted = np.asarray(game_ids, dtype=ids.dtype)
+    # The last of any games archived twice under one id counts, as they are in the order they were archived.
+    found = np.searchsorted(ids, wanted, side='right', sorter=order) - 1
+    games = {}
+    for game_id, pos in zip(game_ids, found):
+        if pos >= 0 and ids[order[pos]] == game_id:
+            pos = order[pos]
+            meta = archive['meta'][pos]
+            board = archive['opp_boards'][pos, :meta['rows'], :meta['columns']]
+            ships = [int(length) for length in meta['ships'] if length > 0]
+            games[game_id] = {'game_id': game_id, 'opp_board': decode_fleet(board), 'ships': ships}
+    return games
+
+
+def encode_board(board):
+    """
+    Encodes a board as a BOARD_SIZE x BOARD_SIZE uint8 array, padded with PADDING.
+    :param board: a 2D list containing a string representation of a board.
+    :return: a 2D uint8 numpy array.
+    """
+    if len(board) > BOARD_SIZE or len(board[0]) > BOARD_SIZE:
+        raise ValueError('Boards larger than ' + str(BOARD_SIZE) + 'x' + str(BOARD_SIZE) + ' cannot be archived.')
+    encoded = np.full((BOARD_SIZE, BOARD_SIZE), PADDING, dtype=np.uint8)
+    for y, row in enumerate(board):
+        for x, val in enumerate(row):
+            encoded[y, x] = _encode_cell(val)
+    return encoded
+
+
+def decode_board(encoded):
+    """
+    Decodes a board encoded by encode_board(), cutting off any padding.
+    :param encoded: a 2D uint8 numpy array.
+    :return: a 2D list containing a string representation of the board.
+    """
+    board = []
+    for row in encoded:
+        cells = [_decode_cell(val) for val in row if val != PADDING]
+        if cells:
+            board.append(cells)
+    return board
+
+
+def decode_fleet(encoded):
+    """
+    Decodes the original fleet of an encoded opponent board, as bot_learning._extract_original_opp_board() does for
+    a board of strings: shots are removed and only sunken ships are kept, as the position of a ship that was merely
+    hit is ambiguous.
+    :param encoded: a 2D uint8 numpy array.
+    :return: a 2D list containing a string representation of the board.
+    """
+    board = []
+    for row in encoded:
+        cells = [_decode_fleet_cell(val) for val in row if val != PADDING]
+        if cells:
+            board.append(cells)
+    return board
+
+
+def get_archive_dir(bot_name, opponent_name, map_type):
+    return io.DATA_DIR + io.BOTS_DIR + '/' + bot_name + io.OPP_DIR + '/' + opponent_name + io.GAMES_DIR + \
+           io.ARCHIVE_DIR + '/' + map_type
+
+
+def _encode_cell(val):
+    if val == '':
+        return WATER
+    if val == 'L':
+        return LAND
+    if val == 'M':
+        return MISS
+    if val == 'H':
+        return HIT
+    if val.isdigit() and int(val) < MAX_SHIPS:
+        return SHIP + int(val)
+    if len(val) > 1 and val[0] in 'HS' and val[1:].isdigit() and int(val[1:]) < MAX_SHIPS:
+        return (HIT_SHIP if val[0] == 'H' else SUNK) + int(val[1:])
+    return OTHER
+
+
+def _decode_cell(val):
+    if val >= SUNK + MAX_SHIPS:
+        return '?'
+    if val >= SUNK:
+        return 'S' + str(val - SUNK)
+    if val >= HIT_SHIP:
+        return 'H' + str(val - HIT_SHIP)
+    if val >= SHIP:
+        return str(val - SHIP)
+    return ['', 'L', 'M', 'H'][val]
+
+
+def _decode_fleet_cell(val):
+    if val == LAND:
+        return 'L'
+    if SUNK <= val < SUNK + MAX_SHIPS:
+        return str(val - SUNK)
+    return ''
+
+
+def _shot_sequence(game, board_key):
+    """
+    Finds the shots fired on a board, as the cells in the order they first changed.
+    :param game: an encoded game.
+    :param board_key: key of the board in the game states.
+    :return: a list of (row, column) tuples.
+    """
+    shot = set()
+    shots = []
+    for cells, _ in game['turns']:
+        for key, y, x, _ in cells:
+            if key == board_key and (y, x) not in shot:
+                shot.add((y, x))
+                shots.append((y, x))
+    return shots
+
+
+def _encode_shots(shots):
+    encoded = np.full((MAX_SHOTS, 2), PADDING, dtype=np.uint8)
+    if shots:
+        encoded[:len(shots)] = shots[:MAX_SHOTS]
+    return encoded
+
+
+def _map_archive(bot_name, opponent_name, map_type):
+    # Maps the current generation of an archive, see load_archive().
+    gen_dir = _current_generation(bot_name, opponent_name, map_type)
+    count = _count_games(gen_dir) if gen_dir else 0
+    if count == 0:
+        return None
+
+    archive = {'meta': np.memmap(gen_dir + '/' + _META_FILE, dtype=META_DTYPE, mode='r', shape=(count,))}
+    for column, shape in COLUMNS.items():
+        archive[column] = np.memmap(gen_dir + '/' + column + '.bin', dtype=np.uint8, mode='r', shape=(count,) + shape)
+    return archive
+
+
+def _generations(archive_dir):
+    # Numbers of the generations in an archive directory, oldest first.
+    if not os.path.exists(archive_dir):
+        return []
+    return sorted(int(name[4:]) for name in os.listdir(archive_dir) if name.startswith('gen_') and
+                  name[4:].isdigit())
+
+
+def _current_generation(bot_name, opponent_name, map_type):
+    """
+    :return: the directory of the newest complete generation (one with a metadata table), or None.
+    """
+    archive_dir = get_archive_dir(bot_name, opponent_name, map_type)
+    for generation in reversed(_generations(archive_dir)):
+        gen_dir = archive_dir + '/' + _GENERATION_DIR.format(generation)
+        if os.path.exists(gen_dir + '/' + _META_FILE):
+            return gen_dir
+    return None
+
+
+def _count_games(gen_dir):
+    # A partially written metadata record at the end (from a crash) is not counted.
+    return os.path.getsize(gen_dir + '/' + _META_FILE) // META_DTYPE.itemsize
+
+
+def _append_rows(bot_name, opponent_name, map_type, meta, rows):
+    """
+    Appends games to the archive, compacting it into a new generation if it has grown too large.
+    :param meta: array of META_DTYPE records of the games.
+    :param rows: dictionary of column:array of rows of the games.
+    :return:
+    """
+    gen_dir = _current_generation(bot_name, opponent_name, map_type)
+    if gen_dir is None:
+        _write_generation(bot_name, opponent_name, map_type, meta, rows)
+        return
+
+    count = _count_games(gen_dir)
+    if count + len(meta) >= 2 * MAX_GAMES_ARCHIVED:
+        archive = recent_games(_map_archive(bot_name, opponent_name, map_type), MAX_GAMES_ARCHIVED - len(meta))
+        _write_generation(bot_name, opponent_name, map_type, np.concatenate([archive.pop('meta'), meta]),
+                          {column: np.concatenate([archive[column], rows[column]]) for column in COLUMNS})
+        return
+
+    for column in COLUMNS:
+        with open(gen_dir + '/' + column + '.bin', 'ab') as writer:
+            # Cut off rows of games that never made it into the metadata table (from a crash).
+            writer.truncate(count * int(np.prod(COLUMNS[column])))
+            writer.write(np.ascontiguousarray(rows[column], dtype=np.uint8).tobytes())
+        write_behind.written(gen_dir + '/' + column + '.bin')
+    with open(gen_dir + '/' + _META_FILE, 'ab') as writer:
+        writer.truncate(count * META_DTYPE.itemsize)
+        writer.write(meta.tobytes())
+    write_behind.written(gen_dir + '/' + _META_FILE)
+
+
+def _write_generation(bot_name, opponent_name, map_type, meta, rows):
+    """
+    Writes games into a new generation of the archive and deletes the older generations. The metadata table is
+    written last, so an incomplete generation is never read.
+    """
+    archive_dir = get_archive_dir(bot_name, opponent_name, map_type)
+    io.make_dir(archive_dir)
+    generations = _generations(archive_dir)
+    gen_dir = archive_dir + '/' + _GENERATION_DIR.format(generations[-1] + 1 if generations else 0)
+    io.make_dir(gen_dir)
+    write_behind.written(gen_dir)  # so the new generation's entry in the archive directory is synced too.
+
+    for column in COLUMNS:
+        with open(gen_dir + '/' + column + '.bin', 'wb') as writer:
+            writer.write(np.ascontiguousarray(rows[column], dtype=np.uint8).tobytes())
+        write_behind.written(gen_dir + '/' + column + '.bin')
+    with open(gen_dir + '/' + _META_FILE + '.tmp', 'wb') as writer:
+        writer.write(np.ascontiguousarray(meta, dtype=META_DTYPE).tobytes())
+    os.replace(gen_dir + '/' + _META_FILE + '.tmp', gen_dir + '/' + _META_FILE)
+    write_behind.written(gen_dir + '/' + _META_FILE)
+
+    for generation in generations:
+        shutil.rmtree(archive_dir + '/' + _GENERATION_DIR.format(generation), ignore_errors=True)
+
@@ -1,8 +1,15 @@
 import src.ai.ai as ai
+import src.ai.training_runner as training_runner
 import src.ai.heuristics as heur
 import src.ai.bot_learning as learn
 import src.utils.game_recorder as record
+import src.utils.game_log as game_log
+import src.utils.profile_store as store
 import src.ai.offensive_explorer as explore
+import src.utils.rollout_cache as rollout_cache
+import src.utils.board_archive as archive
+import src.utils.write_behind as write_behind
+import src.utils.text_log as text_log
 
 import configparser
 
@@ -21,13 +28,35 @@ ai.TRAIN_INTERVAL = int(train_config['bot training frequency'])
 ai.GAME_COUNT = int(train_config['games to train'])
 ai.UNDERPERFOMANCE_THRESHOLD = float(train_config['force training if bot underperforms by'])
 ai.MAX_GAMES_WITHOUT_TRAINING = int(train_config['max games without training'])
+ai.BACKGROUND_TRAINING = train_config.getboolean('train in background')
+training_runner.MAX_TRAINING_ATTEMPTS = int(train_config['training attempts'])
 
 learn_config = config['Optimisation']
+learn.OPTIMISATION_STRATEGY = learn_config['strategy']
+learn.HALVING_CANDIDATES = int(learn_config['halving candidates'])
+learn.HALVING_REDUCTION = int(learn_config['halving reduction factor'])
+learn.TIME_BUDGET = float(learn_config['time budget']) or None
 learn.BB_GLOBAL_CALLS = int(learn_config['black box global calls'])
 learn.BB_LOCAL_CALLS = int(learn_config['black box local calls'])
+learn.BB_WARM_GLOBAL_CALLS = int(learn_config['black box warm start global calls'])
+learn.BB_ACQUISITION = learn_config['black box acquisition']
+learn.CHECKPOINT_INTERVAL = float(learn_config['checkpoint interval'])
 learn.PARALLEL_CALLS = int(learn_config['parallel calls'])
+learn.ROLLOUT_PROCESSES = int(learn_config['rollout processes']) or None
 explore.BOARD_SAMPLES = int(learn_config['boards to sample per game'])
+learn.ROLLOUT_SEED = int(learn_config['rollout seed'])
+rollout_cache.MAX_CACHED_ROLLOUTS = int(learn_config['max cached rollouts per opponent'])
+rollout_cache.HEURISTIC_PRECISION = int(learn_config['cached heuristic value decimals'])
 
 record_config = config['Logging']
 record.MAX_GAMES_LOGGED_PER_OPPONENT = int(record_config['max games to log per opponent'])
-record.LOG_TEXT =record_config.getboolean('save logs to text files')
\ No newline at end of file
+archive.MAX_GAMES_ARCHIVED = int(record_config['max games to archive per opponent'])
+game_log.MAX_GAMES_LOGGED = record.MAX_GAMES_LOGGED_PER_OPPONENT
+game_log.GAMES_PER_SEGMENT = int(record_config['games per log segment'])
+store.GAMES_KEPT_IN_FULL = max(int(record_config['profile games kept in full']), record.MAX_GAMES_LOGGED_PER_OPPONENT)
+store.GAMES_PER_SUMMARY = int(record_config['games per profile summary'])
+write_behind.WRITE_BEHIND = record_config.getboolean('write behind')
+write_behind.MAX_PENDING_WRITES = int(record_config['max pending writes'])
+record.LOG_TEXT =record_config.getboolean('save logs to text files')
+text_log.TEXT_BUNDLE_SIZE = int(record_config['text log bundle size (kb)']) * 1024
+text_log.TEXT_BUNDLES_KEPT = int(record_config['text log bundles kept'])
\ No newline at end of file
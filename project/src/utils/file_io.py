@@ -1,51 +1,214 @@
 import os
 import pickle
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 DATA_DIR = '../data'
 IMG_DIR = '/img'
 BOTS_DIR = '/bots'
 GAMES_DIR = '/games'
+GAME_LOG_DIR = '/log'
 OPP_DIR = '/opponents'
+ROLLOUTS_DIR = '/rollouts'
+TRAINING_RESULTS_DIR = '/training_results'
+DESIGNS_DIR = '/designs'
+CHECKPOINTS_DIR = '/checkpoints'
+ARCHIVE_DIR = '/archive'
 PROFILE_FILE = 'profile.p'
 GAMES_LOG_FILE = 'log.p'
+TRAINING_HISTORY_FILE = 'training.p'
 
 
-# Load a bot's opponent profile. Returns a dict if it exists.
+# Load a bot's opponent profile from a pickled profile.p file. Returns a dict if it exists. Profiles are now kept in
+# the profile store (see profile_store.py), which imports these files.
 def load_profile(bot_name, opponent_name):
     profile_path = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + '/profile.p'
     return load_pickle_if_exists(profile_path)
 
 
-# Store a bot's opponent profile.
+# Store a bot's opponent profile as a pickled profile.p file.
 def save_profile(profile, bot_name, opponent_name):
     profile_dir = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + '/profile.p'
     create_dirs(bot_name, opponent_name)
-    pickle.dump(profile, open(profile_dir, 'wb'))
+    save_pickle(profile, profile_dir)
 
 
-def save_pickled_game_log(bot_name, opponent_name, pickled_log):
-    game_pickled_log_path = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + GAMES_DIR + '/' + GAMES_LOG_FILE
-    pickle.dump(pickled_log, open(game_pickled_log_path, 'wb'))
+# Load the points a bot's optimiser evaluated against an opponent. Returns a dict if it exists.
+def load_training_history(bot_name, opponent_name):
+    return load_pickle_if_exists(get_training_history_path(bot_name, opponent_name))
+
+
+# Store the points a bot's optimiser evaluated against an opponent. To update the history, hold lock() on its path
+# from loading it until it is stored, so concurrent trainings do not overwrite each other's points.
+def save_training_history(history, bot_name, opponent_name):
+    create_dirs(bot_name, opponent_name)
+    save_pickle(history, get_training_history_path(bot_name, opponent_name))
+
+
+def get_training_history_path(bot_name, opponent_name):
+    return DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + '/' + TRAINING_HISTORY_FILE
+
+
+# Hand over the result of a training. Each result gets its own file, which only appears once it is fully written.
+def save_training_result(result, bot_name, opponent_name):
+    results_dir = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + TRAINING_RESULTS_DIR
+    make_dir(results_dir)
+    result_path = results_dir + '/' + '{:020.6f}_{}.p'.format(time.time(), os.getpid())
+    save_pickle(result, result_path)
+
+
+# Load the training results that have not been taken over yet, oldest first. Returns a list of (path, result) tuples.
+def load_training_results(bot_name, opponent_name):
+    results_dir = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + TRAINING_RESULTS_DIR
+    if not os.path.exists(results_dir):
+        return []
+    paths = sorted(results_dir + '/' + name for name in os.listdir(results_dir) if name.endswith('.p'))
+    return [(path, load_pickle_if_exists(path)) for path in paths]
+
+
+# Store the checkpoint of a training on a map type. Replaces the previous checkpoint in one step, so a crash while
+# writing leaves the previous checkpoint intact.
+def save_training_checkpoint(checkpoint, bot_name, opponent_name, map_type):
+    checkpoints_dir = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + CHECKPOINTS_DIR
+    make_dir(checkpoints_dir)
+    save_pickle(checkpoint, get_training_checkpoint_path(bot_name, opponent_name, map_type))
+
+
+# Load the checkpoint of a training on a map type. Returns a dict if it exists.
+def load_training_checkpoint(bot_name, opponent_name, map_type):
+    return load_pickle_if_exists(get_training_checkpoint_path(bot_name, opponent_name, map_type))
+
+
+# Load the checkpoints of all trainings against an opponent that have not finished. Returns a list of dicts.
+def load_training_checkpoints(bot_name, opponent_name):
+    checkpoints_dir = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + CHECKPOINTS_DIR
+    if not os.path.exists(checkpoints_dir):
+        return []
+    paths = sorted(checkpoints_dir + '/' + name for name in os.listdir(checkpoints_dir) if name.endswith('.p'))
+    return [checkpoint for checkpoint in map(load_pickle_if_exists, paths) if checkpoint is not None]
+
 
+def remove_training_checkpoint(bot_name, opponent_name, map_type):
+    remove_file(get_training_checkpoint_path(bot_name, opponent_name, map_type))
 
-def save_textual_game_log(bot_name, opponent_name, game_id, log):
-    game_log_path = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + GAMES_DIR + '/' + str(
-        game_id)
-    write_to_file(log, game_log_path)
 
+def get_training_checkpoint_path(bot_name, opponent_name, map_type):
+    return DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + CHECKPOINTS_DIR + '/' + \
+           str(map_type) + '.p'
 
+
+# Text file listing the points a training on a map type has evaluated so far.
+def get_training_points_path(bot_name, opponent_name, map_type):
+    return DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + CHECKPOINTS_DIR + '/' + \
+           str(map_type) + '.csv'
+
+
+def save_pickled_game_log(bot_name, opponent_name, pickled_log):
+    save_pickle(pickled_log, get_pickled_game_log_path(bot_name, opponent_name))
+
+
+# Load the former pickled game log (log.p). Games are now kept in the append-only log of game_log.py.
 def load_pickled_game_log(bot_name, opponent_name):
-    game_log_path = DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + GAMES_DIR + '/' + GAMES_LOG_FILE
-    return load_pickle_if_exists(game_log_path)
+    return load_pickle_if_exists(get_pickled_game_log_path(bot_name, opponent_name))
+
+
+def remove_pickled_game_log(bot_name, opponent_name):
+    remove_file(get_pickled_game_log_path(bot_name, opponent_name))
+
+
+def get_pickled_game_log_path(bot_name, opponent_name):
+    return DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + GAMES_DIR + '/' + GAMES_LOG_FILE
+
+
+def get_design_cache_dir():
+    return DATA_DIR + DESIGNS_DIR
+
+
+# Directory in which the results of simulated games against an opponent are cached.
+def get_rollout_cache_dir(bot_name, opponent_name):
+    return DATA_DIR + BOTS_DIR + '/' + bot_name + OPP_DIR + '/' + opponent_name + ROLLOUTS_DIR
 
 
 def load_pickle_if_exists(path):
-    if os.path.exists(path):
-        return pickle.load(open(path, "rb"))
-    else:
+    try:
+        with open(path, "rb") as reader:
+            return pickle.load(reader)
+    except FileNotFoundError:
         return None
 
 
+# Written to a temporary file and renamed, so readers (in any process) never see a half-written file and a crash
+# leaves the previous version intact.
+def save_pickle(obj, path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as writer:
+        pickle.dump(obj, writer)
+    os.replace(tmp_path, path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:  # removed by another process in the meantime.
+        pass
+
+
+@contextmanager
+def lock(path, shared=False, blocking=True):
+    """
+    Locks a file or directory against other processes (and threads) for the duration of a with block. The lock is
+    held on a separate file next to it, path + '.lock'. Locks are advisory: they only keep out code that locks too.
+    Note that a lock cannot be taken again while it is held, not even by the same thread.
+    :param path: path of the file or directory.
+    :param shared: whether several readers may hold the lock at once. Windows only has exclusive locks.
+    :param blocking: whether to wait for the lock. If not, the block runs without it when it is held elsewhere.
+    :return: whether the lock was acquired.
+    """
+    make_dir(os.path.dirname(path))
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT)
+    try:
+        acquired = _acquire_lock(fd, shared, blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _release_lock(fd)
+    finally:
+        os.close(fd)
+
+
+def _acquire_lock(fd, shared, blocking):
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.01)
+
+
+def _release_lock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
 def read_file(file_name):
     with open(file_name, mode='r') as reader:
         return [line.rstrip() for line in reader]
@@ -65,5 +228,4 @@ def create_dirs(bot_name, opponent_name):
 
 
 def make_dir(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+    os.makedirs(path, exist_ok=True)  # another process may create it at the same time.
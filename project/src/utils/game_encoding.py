@@ -0,0 +1,104 @@
+# This module encodes recorded games compactly. A game state holds both boards and some metadata, of which at most a
+# few cells change from one turn to the next. An encoded game therefore keeps the first game state in full and only
+# the changes of every following turn. Any turn can be rebuilt from it on demand.
+#
+# An encoded game is a dictionary of the form:
+#
+#   {'initial': the first game state, 'turns': list of turn deltas}
+#
+# where a turn delta is a tuple (cells, changed), cells being a tuple of (board key, row, column, new value) tuples
+# and changed a dictionary of the other keys of the game state whose value changed (e.g. 'Round' or 'IsMover').
+
+# library imports
+import copy
+
+BOARD_KEYS = ('MyBoard', 'OppBoard')  # Keys of the game state that hold boards, which are encoded cell by cell.
+
+
+def encode_turn(previous_state, game_state):
+    """
+    Encodes the changes from one game state to the next.
+    :param previous_state: the game state of the previous turn.
+    :param game_state: the game state of the turn to encode.
+    :return: a turn delta.
+    """
+    cells = []
+    changed = {}
+    for key, value in game_state.items():
+        previous = previous_state.get(key)
+        if key in BOARD_KEYS and _same_shape(previous, value):
+            for y, (old_row, new_row) in enumerate(zip(previous, value)):
+                if old_row != new_row:
+                    cells.extend((key, y, x, new) for x, (old, new) in enumerate(zip(old_row, new_row)) if old != new)
+        elif key not in previous_state or previous != value:
+            changed[key] = value
+    return tuple(cells), changed
+
+
+def encode_game(game_states):
+    """
+    Encodes a list of game states.
+    :param game_states: the list of game states of a game, in the order they occurred.
+    :return: an encoded game.
+    """
+    return {'initial': game_states[0],
+            'turns': [encode_turn(previous, state) for previous, state in zip(game_states, game_states[1:])]}
+
+
+def apply_turn(game_state, turn):
+    """
+    Applies a turn delta to a game state in place.
+    :param game_state: the game state of the turn before.
+    :param turn: a turn delta.
+    :return:
+    """
+    cells, changed = turn
+    game_state.update(copy.deepcopy(changed))
+    for key, y, x, value in cells:
+        game_state[key][y][x] = value
+
+
+def decode_turn(game, turn):
+    """
+    Rebuilds a single game state of an encoded game.
+    :param game: an encoded game.
+    :param turn: index of the game state, where 0 is the initial state and -1 the final one.
+    :return: the game state.
+    """
+    if turn < 0:
+        turn += count_turns(game)
+    if not 0 <= turn < count_turns(game):
+        raise IndexError('Turn ' + str(turn) + ' is not part of the game.')
+
+    game_state = copy.deepcopy(game['initial'])
+    for delta in game['turns'][:turn]:
+        apply_turn(game_state, delta)
+    return game_state
+
+
+def decode_game(game):
+    """
+    Rebuilds all game states of an encoded game.
+    :param game: an encoded game.
+    :return: the list of game states.
+    """
+    game_state = copy.deepcopy(game['initial'])
+    game_states = [game_state]
+    for delta in game['turns']:
+        game_state = copy.deepcopy(game_state)
+        apply_turn(game_state, delta)
+        game_states.append(game_state)
+    return game_states
+
+
+def count_turns(game):
+    """
+    :return: the number of game states of an encoded game, including the initial one.
+    """
+    return len(game['turns']) + 1
+
+
+def _same_shape(a, b):
+    # Whether two values are boards of the same dimensions, so that one can be encoded as cell changes of the other.
+    return isinstance(a, list) and isinstance(b, list) and len(a) == len(b) and \
+        all(isinstance(r_a, list) and isinstance(r_b, list) and len(r_a) == len(r_b) for r_a, r_b in zip(a, b))
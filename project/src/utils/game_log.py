@@ -0,0 +1,300 @@
+# This module keeps the full game logs per bot and opponent as an append-only log. Rather than unpickling and
+# rewriting every logged game at the end of each game, as the single log.p file required, finishing a game appends one
+# record. The log is split into segments, each a file of length-prefixed records next to an index file that holds the
+# position of every record. Old games are dropped by deleting whole segments, so no file is ever rewritten. Games are
+# stored delta encoded (see game_encoding.py). Several clients may log games against the same opponent at once, so
+# appending holds a lock on the log and reading a shared one.
+#
+# A record starts with a small header: a dictionary of metadata about the game and its final state, each pickled
+# separately from the encoded game. Listing games (list_games()) or fetching final states (load_final_states()) thus
+# only reads the start of each record.
+
+# project imports
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.write_behind as write_behind
+
+# library imports
+import os
+import pickle
+import struct
+
+MAX_GAMES_LOGGED = 200  # The log keeps at least this many of the most recent games (set from the game recorder).
+GAMES_PER_SEGMENT = 50  # Number of games per segment. The log holds at most MAX_GAMES_LOGGED + this many games.
+
+_LENGTH = struct.Struct('>I')  # Prefix of a record: the length of its payload.
+_INDEX_ENTRY = struct.Struct('>qQI')  # An index entry: game id, offset of the record and length of its payload.
+_HEADER_MAGIC = b'GLH1'  # Start of a payload, to tell a record from a corrupt position.
+_HEADER = struct.Struct('>4sII')  # Start of a header: _HEADER_MAGIC, length of the metadata and of the final state.
+_SEGMENT_FILE = 'segment_{:06d}.log'
+_INDEX_FILE = 'segment_{:06d}.idx'
+
+
+def append_game(bot_name, opponent_name, game_id, game, metadata=None):
+    """
+    Appends a finished game to the log. A new segment is started once the current one is full, and the oldest
+    segments are deleted as long as the others still hold MAX_GAMES_LOGGED games.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :param game_id: id of the game.
+    :param game: the encoded game, as made by game_encoding.encode_game().
+    :param metadata: optional dictionary of further metadata to list the game with (e.g. its 'map_type').
+    :return:
+    """
+    payload = _make_payload(game_id, game, metadata)
+    log_dir = get_log_dir(bot_name, opponent_name)
+    with io.lock(log_dir):
+        _import_pickled_log(bot_name, opponent_name)
+        io.make_dir(log_dir)
+
+        segments = _segments(log_dir)
+        _append_record(log_dir, _open_segment(log_dir, segments), game_id, payload)
+
+        # Retention: drop whole segments, oldest first, while the remaining ones hold enough games.
+        counts = [_count_entries(log_dir, segment) for segment in segments]
+        while len(segments) > 1 and sum(counts[1:]) >= MAX_GAMES_LOGGED:
+            io.remove_file(log_dir + '/' + _INDEX_FILE.format(segments[0]))
+            io.remove_file(log_dir + '/' + _SEGMENT_FILE.format(segments[0]))
+            segments.pop(0)
+            counts.pop(0)
+
+
+def list_games(bot_name, opponent_name):
+    """
+    Lists the logged games with their metadata, without loading any game states.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :return: a list of dictionaries of 'game_id', 'size' (bytes of the record), 'turns' (number of game states) and
+    any metadata the game was logged with, in the order the games were logged. Games logged before metadata was
+    kept only have 'game_id' and 'size'.
+    """
+    return [dict(_read_part(bot_name, opponent_name, entry, 'metadata'), game_id=entry[0], size=entry[3])
+            for entry in _snapshot(bot_name, opponent_name)]
+
+
+def list_game_ids(bot_name, opponent_name):
+    """
+    :return: the ids of all logged games, in the order they were logged.
+    """
+    return [entry[0] for entry in _snapshot(bot_name, opponent_name)]
+
+
+def iter_games(bot_name, opponent_name, game_ids=None, decode=True):
+    """
+    Streams logged games one at a time, so only one game is held in memory. Games removed by another client while
+    streaming (e.g. by retention) are skipped.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :param game_ids: optional list of game ids. If not given, all logged games are streamed.
+    :param decode: whether to decode the games into lists of game states. If not, the encoded games are yielded, e.g. to
+    rebuild only some of their turns with game_encoding.decode_turn().
+    :return: a generator of (game_id, game) tuples, in the order the games were logged.
+    """
+    for entry in _entries(bot_name, opponent_name, game_ids):
+        game = _read_part(bot_name, opponent_name, entry, 'game')
+        if game is not None:
+            yield entry[0], encoding.decode_game(game) if decode else game
+
+
+def load_games(bot_name, opponent_name, game_ids):
+    """
+    Loads the game states of logged games. Only the records of the requested games are read.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :param game_ids: a list of game ids.
+    :return: a dictionary of game_id:list of game states for each of the game ids found in the log.
+    """
+    return dict(iter_games(bot_name, opponent_name, game_ids))
+
+
+def load_encoded_games(bot_name, opponent_name, game_ids):
+    """
+    Loads logged games without decoding them (see game_encoding.py).
+    :return: a dictionary of game_id:encoded game for each of the game ids found in the log.
+    """
+    return dict(iter_games(bot_name, opponent_name, game_ids, decode=False))
+
+
+def load_game(bot_name, opponent_name, game_id):
+    """
+    Loads the game states of a logged game.
+    :return: a list of game states, or None if the game is not in the log.
+    """
+    return load_games(bot_name, opponent_name, [game_id]).get(game_id)
+
+
+def load_final_states(bot_name, opponent_name, game_ids):
+    """
+    Loads only the final state of logged games, reading just the header of each record.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :param game_ids: a list of game ids.
+    :return: a dictionary of game_id:final game state for each of the game ids found in the log.
+    """
+    final_states = {}
+    for entry in _entries(bot_name, opponent_name, game_ids):
+        final_state = _read_part(bot_name, opponent_name, entry, 'final_state')
+        if final_state is not None:
+            final_states[entry[0]] = final_state
+    return final_states
+
+
+def get_log_dir(bot_name, opponent_name):
+    return io.DATA_DIR + io.BOTS_DIR + '/' + bot_name + io.OPP_DIR + '/' + opponent_name + io.GAMES_DIR + \
+           io.GAME_LOG_DIR
+
+
+def _snapshot(bot_name, opponent_name):
+    # The index of the log, read under a shared lock after importing any pickled log.
+    _import_pickled_log_if_any(bot_name, opponent_name)
+    with io.lock(get_log_dir(bot_name, opponent_name), shared=True):
+        return _index(bot_name, opponent_name)
+
+
+def _entries(bot_name, opponent_name, game_ids):
+    # The index entries of the requested games (or all games), in the order they were logged.
+    entries = _snapshot(bot_name, opponent_name)
+    if game_ids is None:
+        return entries
+    wanted = set(game_ids)
+    return [entry for entry in entries if entry[0] in wanted]
+
+
+def _index(bot_name, opponent_name):
+    """
+    Reads the index files of all segments. If a game was logged more than once, its last record is used.
+    :return: a list of (game id, segment, offset, length) tuples, in the order the games were logged.
+    """
+    log_dir = get_log_dir(bot_name, opponent_name)
+    entries = {}
+    for segment in _segments(log_dir):
+        with open(log_dir + '/' + _INDEX_FILE.format(segment), 'rb') as reader:
+            data = reader.read()
+        # A partially written entry at the end (from a crash) is ignored.
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        for game_id, offset, length in _INDEX_ENTRY.iter_unpack(data[:usable]):
+            entries.pop(game_id, None)
+            entries[game_id] = (game_id, segment, offset, length)
+    return list(entries.values())
+
+
+def _segments(log_dir):
+    # Numbers of the segments in the log directory, oldest first.
+    if not os.path.exists(log_dir):
+        return []
+    return sorted(int(name[8:14]) for name in os.listdir(log_dir) if name.startswith('segment_') and
+                  name.endswith('.idx'))
+
+
+def _open_segment(log_dir, segments):
+    """
+    Chooses the segment to append to, starting a new one if the last is full.
+    :param log_dir: the log directory.
+    :param segments: the list of segments, which a new segment is added to.
+    :return: the number of the segment.
+    """
+    if not segments or _count_entries(log_dir, segments[-1]) >= GAMES_PER_SEGMENT:
+        segments.append(segments[-1] + 1 if segments else 0)
+    return segments[-1]
+
+
+def _count_entries(log_dir, segment):
+    path = log_dir + '/' + _INDEX_FILE.format(segment)
+    return os.path.getsize(path) // _INDEX_ENTRY.size if os.path.exists(path) else 0
+
+
+def _append_record(log_dir, segment, game_id, payload):
+    """
+    Appends a record to a segment and then its entry to the segment's index, so an entry never points to a record
+    that is not completely written.
+    """
+    segment_path = log_dir + '/' + _SEGMENT_FILE.format(segment)
+    with open(segment_path, 'ab') as writer:
+        offset = writer.tell()
+        writer.write(_LENGTH.pack(len(payload)))
+        writer.write(payload)
+    write_behind.written(segment_path)
+
+    index_path = log_dir + '/' + _INDEX_FILE.format(segment)
+    with open(index_path, 'ab') as writer:
+        # Cut off a partially written entry (from a crash), so the entries stay aligned.
+        size = writer.tell()
+        if size % _INDEX_ENTRY.size:
+            writer.truncate(size - size % _INDEX_ENTRY.size)
+        writer.write(_INDEX_ENTRY.pack(game_id, offset, len(payload)))
+    write_behind.written(index_path)
+
+
+def _make_payload(game_id, game, metadata=None):
+    # The payload of a record: a header of metadata and the final state, followed by the pickled game.
+    metadata = dict(metadata or {}, turns=encoding.count_turns(game))
+    metadata.pop('game_id', None)  # kept in the index.
+    metadata = pickle.dumps(metadata, pickle.HIGHEST_PROTOCOL)
+    final_state = pickle.dumps(encoding.decode_turn(game, -1), pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(_HEADER_MAGIC, len(metadata), len(final_state)) + metadata + final_state + \
+        pickle.dumps(game, pickle.HIGHEST_PROTOCOL)
+
+
+def _read_part(bot_name, opponent_name, entry, part):
+    """
+    Reads part of a record under a shared lock on the log.
+    :param entry: the index entry of the record.
+    :param part: 'metadata', 'final_state' or 'game'.
+    :return: the part, or None if the record's segment has been removed since the index was read.
+    """
+    with io.lock(get_log_dir(bot_name, opponent_name), shared=True):
+        try:
+            return _read_record(get_log_dir(bot_name, opponent_name), *entry[1:], part=part)
+        except FileNotFoundError:
+            return None
+
+
+def _read_record(log_dir, segment, offset, length, part='game'):
+    """
+    Reads part of a record, skipping the parts before it.
+    :return: the unpickled part.
+    """
+    with open(log_dir + '/' + _SEGMENT_FILE.format(segment), 'rb') as reader:
+        reader.seek(offset)
+        if _LENGTH.unpack(reader.read(_LENGTH.size))[0] != length:
+            raise IOError('Corrupt record at offset ' + str(offset) + ' of segment ' + str(segment) + '.')
+        start = reader.read(_HEADER.size)
+        if length < _HEADER.size or start[:len(_HEADER_MAGIC)] != _HEADER_MAGIC:
+            raise IOError('Corrupt record at offset ' + str(offset) + ' of segment ' + str(segment) + '.')
+
+        _, metadata_length, final_state_length = _HEADER.unpack(start)
+        if part == 'metadata':
+            return pickle.loads(reader.read(metadata_length))
+        reader.seek(metadata_length, os.SEEK_CUR)
+        if part == 'final_state':
+            return pickle.loads(reader.read(final_state_length))
+        reader.seek(final_state_length, os.SEEK_CUR)
+        return pickle.loads(reader.read(length - _HEADER.size - metadata_length - final_state_length))
+
+
+def _import_pickled_log_if_any(bot_name, opponent_name):
+    # Readers only lock the log for an import if there is a pickled log to import.
+    if os.path.exists(io.get_pickled_game_log_path(bot_name, opponent_name)):
+        with io.lock(get_log_dir(bot_name, opponent_name)):
+            _import_pickled_log(bot_name, opponent_name)
+
+
+def _import_pickled_log(bot_name, opponent_name):
+    """
+    Moves the games of a pickled log.p file (the former game log) into the log, oldest first, and deletes the file.
+    The games are encoded on the way. The caller must hold the lock on the log.
+    :return:
+    """
+    pickled_log = io.load_pickled_game_log(bot_name, opponent_name)
+    if pickled_log is None:
+        return
+
+    log_dir = get_log_dir(bot_name, opponent_name)
+    io.make_dir(log_dir)
+    logged = set(entry[0] for entry in _index(bot_name, opponent_name))
+    segments = _segments(log_dir)
+    for game_id in sorted(pickled_log):
+        if game_id not in logged:
+            _append_record(log_dir, _open_segment(log_dir, segments), game_id,
+                           _make_payload(game_id, encoding.encode_game(pickled_log[game_id])))
+    io.remove_pickled_game_log(bot_name, opponent_name)
@@ -1,13 +1,19 @@
-# This module records games either as textual logs or pickles them for later use.
+# This module records games to the game log and board archive, and optionally exports them as text.
 # project imports
+import src.utils.board_archive as archive
 import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.game_log as game_log
+import src.utils.text_log as text_log
+import src.utils.write_behind as write_behind
+import src.ai.board_info as board_info
 
 # library imports
-import datetime
+import numpy as np
 
 
-MAX_GAMES_LOGGED_PER_OPPONENT = 200 # The largest number of games to log in a pickle file.
-LOG_TEXT = False # Whether to also log the games in files as text. This generates a log file per game.
+MAX_GAMES_LOGGED_PER_OPPONENT = 200 # The number of most recent games that are kept in the game log at least.
+LOG_TEXT = False # Whether to also export the games as text, in the background (see text_log.py).
 
 # Class that exists to log games the bots partake in.
 class GameRecorder:
@@ -18,59 +24,31 @@ class GameRecorder:
         self.bot_name = bot_name  # Name of our bot.
         self.opponent_name = game_state['OpponentId']  # Name of opponent's bot.
         self.game_id = game_state['GameId']  # ID of the game.
-        self.game_history = io.load_pickled_game_log(self.bot_name, self.opponent_name)
-        if not self.game_history:
-            self.game_history = {}
-        self.game_states = [game_state]
+        self.game = {'initial': game_state, 'turns': []}  # The game, encoded as the first state and turn deltas.
+        self.last_state = game_state  # The most recent game state.
 
         # Initial setup.
         io.create_dirs(self.bot_name, self.opponent_name)
 
-    # Record both boards every turn.
+    # Record the changes to the previous turn every turn.
     def record_turn(self, game_state):
-        self.game_states.append(game_state)
+        self.game['turns'].append(encoding.encode_turn(self.last_state, game_state))
+        self.last_state = game_state
 
 
-    # Wrap up and write the file.
+    # Wrap up and queue the game to be written in the background (see write_behind.py).
     def record_end(self):
-        self.game_history[self.game_id] = self.game_states
-        if len(self.game_history) > MAX_GAMES_LOGGED_PER_OPPONENT:
-            self.game_history = {k:self.game_history[k] for k in sorted(self.game_history, reverse=True)[:MAX_GAMES_LOGGED_PER_OPPONENT]}
+        write_behind.submit(self._write)
 
-        io.save_pickled_game_log(self.bot_name,self.opponent_name,self.game_history)
+    def _write(self):
+        map_type = 'land' if board_info.is_there_land(np.array(self.last_state['MyBoard'])) else 'no-land'
 
-        if LOG_TEXT:
-            write_log_as_text(self.bot_name,self.game_states)
-
-
-def write_log_as_text(bot_name,game_states):
-
-    game_id = game_states[0]['GameId']
-    opponent_name = game_states[0]['OpponentId']
-
-    log = [datetime.datetime.now().strftime('%d/%m/%y %H:%M:%S')]
-    log.append('\nGameId: ' + str(game_id))
-    log.append('\nShips: ' + str(game_states[0]['Ships']))
-    log.append('\n--GAME START--\n\n')
+        # Append the game to the log. Older games are dropped segment by segment, keeping the most recent ones.
+        game_log.append_game(self.bot_name, self.opponent_name, self.game_id, self.game, {'map_type': map_type})
 
-    for game_state in game_states:
-        log.append('\n')
-        log.append(bot_name)
-        log.append('\n' + board_to_string(game_state['MyBoard']) + '\n')
-        log.append(opponent_name)
-        log.append('\n' + board_to_string(game_state['OppBoard']) + '\n')
-        log.append('\n')
+        # Add the game's boards and shots to the archive the optimiser trains on.
+        archive.append_game(self.bot_name, self.opponent_name, map_type, self.game_id, self.game)
 
-    log.append('\n\n--GAME END--')
-    io.save_textual_game_log(bot_name, opponent_name, game_id, ''.join(log))
-
-
- # Converts board to somewhat more readable string.
-def board_to_string(board):
-    text = ''
-    for row in board:
-        for field in row:
-            text += "{:<2}".format(field) + " "
-        text += '\n'
-
-    return text
+        # Render the game as text from the log, batched with the other games logged meanwhile.
+        if LOG_TEXT:
+            text_log.export_game(self.bot_name, self.opponent_name, self.game_id)
@@ -0,0 +1,65 @@
+# This module measures the overhead of the black box optimiser itself, i.e. the time it takes to propose new points
+# without evaluating any games. The overhead grows with the number of heuristics trained at once (the dimension of the
+# search) and with the number of points evaluated so far. Run it with: python -m src.utils.optimiser_benchmark
+
+# project imports
+import lib.blackbox as bb
+
+# library imports
+import time
+import numpy as np
+
+DIMENSIONS = [1, 2, 3, 5, 8, 10]  # Numbers of heuristics to measure.
+EVALUATED_POINTS = 40  # Number of points evaluated before measuring.
+BATCH = 4  # Number of points proposed at once, as with PARALLEL_CALLS.
+REPETITIONS = 5  # Number of proposals measured per dimension.
+
+
+def measure_overhead(d, evaluated=EVALUATED_POINTS, batch=BATCH, repetitions=REPETITIONS, acquisition='vectorized'):
+    """
+    Measures how long the black box takes to propose a batch of points in a d-dimensional search.
+    :param d: number of dimensions (heuristics).
+    :param evaluated: number of points evaluated before measuring.
+    :param batch: number of points proposed at once.
+    :param repetitions: number of proposals to average over.
+    :param acquisition: how the black box chooses new points, 'vectorized' or 'slsqp'.
+    :return: average seconds per proposal of a batch.
+    """
+    np.random.seed(0)
+    opt = bb.BlackBox([[0., 1.]] * d, evaluated, batch * repetitions, acquisition=acquisition)
+    for k, x in opt.ask(evaluated):
+        opt.tell(k, _objective(x))
+
+    durations = []
+    for _ in range(repetitions):
+        start = time.time()
+        proposals = opt.ask(batch)
+        durations.append(time.time() - start)
+        for k, x in proposals:
+            opt.tell(k, _objective(x))
+    return float(np.mean(durations))
+
+
+def run(dimensions=DIMENSIONS, acquisition='vectorized'):
+    """
+    Prints the overhead per proposed batch for each number of dimensions.
+    :param dimensions: list of numbers of dimensions.
+    :param acquisition: how the black box chooses new points, 'vectorized' or 'slsqp'.
+    :return: a dictionary of dimension:average seconds per proposal.
+    """
+    results = {}
+    print('Black box overhead with', EVALUATED_POINTS, 'evaluated points and batches of', BATCH, '(' + acquisition + ')')
+    for d in dimensions:
+        results[d] = measure_overhead(d, acquisition=acquisition)
+        print('d =', '{:2d}'.format(d), '{:8.3f}'.format(results[d] * 1000), 'ms per batch')
+    return results
+
+
+def _objective(x):
+    # A cheap stand-in for playing games: a shifted quadratic with a bit of curvature in every dimension.
+    x = np.asarray(x)
+    return float(np.sum((x - 0.3) ** 2 * np.arange(1, len(x) + 1)) + 1.)
+
+
+if __name__ == '__main__':
+    run()
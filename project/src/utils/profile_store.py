@@ -0,0 +1,569 @@
+# This module stores the profiles of bots against their opponents in a SQLite database in the data directory. Rather
+# than reading and rewriting every game ever played against an opponent, as the pickled profile.p files required, a
+# finished game is a single insert and the AI queries only what it needs. Running totals of the games are kept per map
+# type next to them, so summarising a profile takes the same time however many games it holds. Only the most recent
+# games are kept in full: older ones are compacted into summaries of GAMES_PER_SUMMARY games each, which the running
+# totals still include. Existing profile.p files are imported when the AI first opens them, or all at once with:
+# python -m src.utils.profile_store migrate
+# and the running totals can be recomputed from the games with:
+# python -m src.utils.profile_store rebuild-aggregates
+
+# project imports
+import src.utils.file_io as io
+
+# library imports
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import sys
+
+PROFILE_DB_FILE = 'profiles.db'  # Name of the database in the data directory.
+TIMEOUT = 30  # Seconds to wait for another process (such as the training process) to release the database.
+GAMES_KEPT_IN_FULL = 1000  # Number of most recent games per opponent whose records are never compacted.
+GAMES_PER_SUMMARY = 100  # Number of consecutive older games that are compacted into one summary per map type.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    bot TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    bot_name TEXT NOT NULL,
+    PRIMARY KEY (bot, opponent)
+);
+CREATE TABLE IF NOT EXISTS games (
+    bot TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    game_id INTEGER NOT NULL,
+    map_type TEXT,
+    accuracy REAL,
+    evasion REAL,
+    victory INTEGER,
+    heuristics TEXT,
+    metrics TEXT,
+    PRIMARY KEY (bot, opponent, game_id)
+);
+CREATE INDEX IF NOT EXISTS games_by_map_type ON games (bot, opponent, map_type, game_id);
+CREATE TABLE IF NOT EXISTS aggregates (
+    bot TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    map_type TEXT NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    accuracy_sum REAL NOT NULL DEFAULT 0,
+    accuracy_games INTEGER NOT NULL DEFAULT 0,
+    evasion_sum REAL NOT NULL DEFAULT 0,
+    evasion_games INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bot, opponent, map_type)
+);
+CREATE TABLE IF NOT EXISTS history (
+    bot TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    first_game_id INTEGER NOT NULL,
+    last_game_id INTEGER NOT NULL,
+    map_type TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    accuracy_sum REAL NOT NULL,
+    accuracy_games INTEGER NOT NULL,
+    evasion_sum REAL NOT NULL,
+    evasion_games INTEGER NOT NULL,
+    PRIMARY KEY (bot, opponent, first_game_id, map_type)
+);
+CREATE TABLE IF NOT EXISTS heuristics (
+    bot TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    map_type TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (bot, opponent, name, map_type)
+);
+CREATE TABLE IF NOT EXISTS training_state (
+    bot TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    map_type TEXT NOT NULL,
+    games_since_training INTEGER NOT NULL,
+    accuracy_before_training REAL NOT NULL,
+    accuracy_after_training REAL NOT NULL,
+    PRIMARY KEY (bot, opponent, map_type)
+);
+"""
+
+_NO_MAP_TYPE = ''  # Map type of the running totals of games without a map type.
+_GAME_COLUMNS = ('accuracy', 'evasion', 'victory', 'map_type', 'heuristics')  # Game stats with their own column.
+_initialised = set()  # Paths of databases whose schema has been created by this process.
+
+
+def has_profile(bot_name, opponent_name):
+    """
+    Checks whether a bot has a profile against an opponent.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :return: True or False.
+    """
+    with _connect() as db:
+        return db.execute('SELECT 1 FROM profiles WHERE bot = ? AND opponent = ?',
+                          (bot_name, opponent_name)).fetchone() is not None
+
+
+def create_profile(bot_name, opponent_name, display_name):
+    """
+    Creates an empty profile of a bot against an opponent, if there is none.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param display_name: the name the bot calls itself (its bot_name attribute).
+    :return:
+    """
+    with _connect() as db:
+        db.execute('INSERT OR IGNORE INTO profiles VALUES (?, ?, ?)', (bot_name, opponent_name, display_name))
+
+
+def get_display_name(bot_name, opponent_name):
+    """
+    :return: the name the bot calls itself in its profile against the opponent, or None if there is no profile.
+    """
+    with _connect() as db:
+        row = db.execute('SELECT bot_name FROM profiles WHERE bot = ? AND opponent = ?',
+                         (bot_name, opponent_name)).fetchone()
+    return row[0] if row else None
+
+
+def add_game(bot_name, opponent_name, game_id, stats, track_training=False):
+    """
+    Records a finished game, replacing any game of the same id. A game whose id falls in a block of compacted games
+    (see compact_games()) is not recorded, as its previous record can no longer be taken out of the running totals.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param game_id: id of the game.
+    :param stats: a dictionary of the game's stats, as described in ai.AI ('accuracy', 'evasion', 'victory',
+    'map_type', optionally 'heuristics' and any other metrics of the bot).
+    :param track_training: whether the game counts towards the training state of its map type. If so, the games
+    since training and the average accuracy after training are updated in the same transaction.
+    :return: whether the game was recorded.
+    """
+    with _connect(write=True) as db:
+        if not _insert_game(db, bot_name, opponent_name, game_id, stats):
+            return False
+        if track_training:
+            _track_training(db, bot_name, opponent_name, stats.get('map_type'), stats['accuracy'])
+    return True
+
+
+def count_games(bot_name, opponent_name, map_type=None):
+    """
+    :return: the number of games the bot played against the opponent, optionally only on the given map type.
+    """
+    return get_stats(bot_name, opponent_name, map_type)['games']
+
+
+def get_games(bot_name, opponent_name, map_type=None, limit=None):
+    """
+    Loads the stats of the most recent games.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param map_type: optional map type of the games.
+    :param limit: optional largest number of games.
+    :return: a dictionary of game_id:stats, as described in ai.AI.
+    """
+    query, args = _games_filter(bot_name, opponent_name, map_type)
+    query = 'SELECT game_id, map_type, accuracy, evasion, victory, heuristics, metrics FROM games WHERE ' + query + \
+            ' ORDER BY game_id DESC'
+    if limit is not None:
+        query, args = query + ' LIMIT ?', args + (limit,)
+    with _connect() as db:
+        return {row[0]: _game_stats(row) for row in db.execute(query, args)}
+
+
+def get_recent_game_ids(bot_name, opponent_name, map_type=None, recent=None, limit=None):
+    """
+    Selects the most recent games of a map type.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param map_type: optional map type of the games.
+    :param recent: optional number of most recent games (of any map type) to select from.
+    :param limit: optional largest number of game ids to return.
+    :return: a list of game ids, most recent first.
+    """
+    query = 'SELECT game_id, map_type FROM games WHERE bot = ? AND opponent = ? ORDER BY game_id DESC LIMIT ?'
+    query = 'SELECT game_id FROM (' + query + ')'
+    args = (bot_name, opponent_name, -1 if recent is None else recent)
+    if map_type is not None:
+        query, args = query + ' WHERE map_type = ?', args + (map_type,)
+    query, args = query + ' ORDER BY game_id DESC LIMIT ?', args + (-1 if limit is None else limit,)
+    with _connect() as db:
+        return [row[0] for row in db.execute(query, args)]
+
+
+def get_stats(bot_name, opponent_name, map_type=None):
+    """
+    Summarises the games of the bot against the opponent from the running totals, without reading the games.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param map_type: optional map type of the games.
+    :return: a dictionary of 'games', 'wins', 'accuracy' (average) and 'evasion' (average).
+    """
+    query, args = _games_filter(bot_name, opponent_name, map_type)
+    with _connect() as db:
+        row = db.execute('SELECT TOTAL(games), TOTAL(wins), TOTAL(accuracy_sum), TOTAL(accuracy_games), '
+                         'TOTAL(evasion_sum), TOTAL(evasion_games) FROM aggregates WHERE ' + query, args).fetchone()
+    games, wins, accuracy_sum, accuracy_games, evasion_sum, evasion_games = row
+    return {'games': int(games), 'wins': int(wins),
+            'accuracy': accuracy_sum / accuracy_games if accuracy_games else None,
+            'evasion': evasion_sum / evasion_games if evasion_games else None}
+
+
+def compact_games(bot_name, opponent_name):
+    """
+    Compacts the games older than the GAMES_KEPT_IN_FULL most recent ones into summaries, in blocks of
+    GAMES_PER_SUMMARY consecutive games with one summary per map type. The compacted games are deleted, but still
+    count towards the running totals (see get_stats()). Games that do not fill a block yet are left alone.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :return: the number of games compacted.
+    """
+    with _connect(write=True) as db:
+        oldest_kept = db.execute('SELECT game_id FROM games WHERE bot = ? AND opponent = ? ORDER BY game_id DESC '
+                                 'LIMIT 1 OFFSET ?', (bot_name, opponent_name, GAMES_KEPT_IN_FULL - 1)).fetchone()
+        if oldest_kept is None:
+            return 0
+        old = db.execute('SELECT game_id, map_type, victory, accuracy, evasion FROM games WHERE bot = ? AND '
+                         'opponent = ? AND game_id < ? ORDER BY game_id', (bot_name, opponent_name, oldest_kept[0]))
+        old = old.fetchall()
+        compacted = len(old) - len(old) % GAMES_PER_SUMMARY
+        if compacted == 0:
+            return 0
+
+        for start in range(0, compacted, GAMES_PER_SUMMARY):
+            block = old[start:start + GAMES_PER_SUMMARY]
+            summaries = {}
+            for _, map_type, victory, accuracy, evasion in block:
+                summary = summaries.setdefault(_aggregate_map_type(map_type), [0, 0, 0., 0, 0., 0])
+                for pos, val in enumerate((1, victory or 0, accuracy or 0., accuracy is not None, evasion or 0.,
+                                           evasion is not None)):
+                    summary[pos] += val
+            for map_type, summary in summaries.items():
+                db.execute('INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (bot_name, opponent_name, block[0][0], block[-1][0], map_type) + tuple(summary))
+        db.execute('DELETE FROM games WHERE bot = ? AND opponent = ? AND game_id <= ?',
+                   (bot_name, opponent_name, old[compacted - 1][0]))
+    return compacted
+
+
+def get_history(bot_name, opponent_name, map_type=None):
+    """
+    Loads the summaries of compacted games.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param map_type: optional map type of the games.
+    :return: a list of dictionaries of 'first_game_id', 'last_game_id', 'map_type', 'games', 'wins', 'accuracy'
+    (average) and 'evasion' (average), oldest first.
+    """
+    query, args = _games_filter(bot_name, opponent_name, map_type)
+    history = []
+    with _connect() as db:
+        for row in db.execute('SELECT first_game_id, last_game_id, map_type, games, wins, accuracy_sum, '
+                              'accuracy_games, evasion_sum, evasion_games FROM history WHERE ' + query +
+                              ' ORDER BY first_game_id, map_type', args):
+            first_game_id, last_game_id, m_t, games, wins, accuracy_sum, accuracy_games, evasion_sum, \
+                evasion_games = row
+            history.append({'first_game_id': first_game_id, 'last_game_id': last_game_id,
+                            'map_type': m_t if m_t != _NO_MAP_TYPE else None, 'games': games, 'wins': wins,
+                            'accuracy': accuracy_sum / accuracy_games if accuracy_games else None,
+                            'evasion': evasion_sum / evasion_games if evasion_games else None})
+    return history
+
+
+def rebuild_aggregates(bot_name=None, opponent_name=None):
+    """
+    Recomputes the running totals from the games and the summaries of compacted games, e.g. for a database written
+    before they were kept.
+    :param bot_name: optional name of the bot's data directory. If not given, the totals of all bots are rebuilt.
+    :param opponent_name: optional name of the opponent. If not given, the totals of all opponents are rebuilt.
+    :return:
+    """
+    with _connect() as db:
+        _rebuild_aggregates(db, bot_name, opponent_name)
+
+
+def get_heuristics(bot_name, opponent_name):
+    """
+    :return: the trained heuristics of the bot against the opponent, as a dictionary of the form
+    {name of a heuristic: {map_type: heuristic value}, ...}.
+    """
+    heuristics = {}
+    with _connect() as db:
+        for name, map_type, value in db.execute('SELECT name, map_type, value FROM heuristics '
+                                                'WHERE bot = ? AND opponent = ?', (bot_name, opponent_name)):
+            heuristics.setdefault(name, {})[map_type] = value
+    return heuristics
+
+
+def set_heuristic(bot_name, opponent_name, name, map_type, value):
+    """
+    Stores the trained value of a heuristic on a map type.
+    :return:
+    """
+    with _connect() as db:
+        db.execute('INSERT OR REPLACE INTO heuristics VALUES (?, ?, ?, ?, ?)',
+                   (bot_name, opponent_name, name, map_type, value))
+
+
+def get_training_state(bot_name, opponent_name, map_type):
+    """
+    :return: the training state of a map type as a dictionary of 'games_since_training', 'accuracy_before_training'
+    and 'accuracy_after_training', or None if the bot has never been tracked on the map type.
+    """
+    with _connect() as db:
+        row = db.execute('SELECT games_since_training, accuracy_before_training, accuracy_after_training '
+                         'FROM training_state WHERE bot = ? AND opponent = ? AND map_type = ?',
+                         (bot_name, opponent_name, map_type)).fetchone()
+    if row is None:
+        return None
+    return {'games_since_training': row[0], 'accuracy_before_training': row[1], 'accuracy_after_training': row[2]}
+
+
+def set_training_state(bot_name, opponent_name, map_type, training_state):
+    """
+    Stores the training state of a map type.
+    :param training_state: a dictionary as returned by get_training_state().
+    :return:
+    """
+    with _connect() as db:
+        _set_training_state(db, bot_name, opponent_name, map_type, training_state)
+
+
+def reset_training_state(bot_name, opponent_name, map_type):
+    """
+    Starts tracking a map type afresh after the bot has been trained on it: the average accuracy after the previous
+    training becomes the accuracy before training. A map type that was never tracked is left alone. This is a single
+    update, so it cannot be undone by a game being recorded at the same time.
+    :return:
+    """
+    with _connect() as db:
+        db.execute('UPDATE training_state SET games_since_training = 0, '
+                   'accuracy_before_training = accuracy_after_training, accuracy_after_training = 0 '
+                   'WHERE bot = ? AND opponent = ? AND map_type = ?', (bot_name, opponent_name, map_type))
+
+
+def load_profile(bot_name, opponent_name):
+    """
+    Assembles the whole profile of the bot against the opponent, in the form of the former profile.p files (see
+    ai.AI). Only meant for analysis; the AI queries what it needs.
+    :return: a profile dictionary or None if there is no profile.
+    """
+    display_name = get_display_name(bot_name, opponent_name)
+    if display_name is None:
+        return None
+
+    misc = {}
+    with _connect() as db:
+        for row in db.execute('SELECT map_type, games_since_training, accuracy_before_training, '
+                              'accuracy_after_training FROM training_state WHERE bot = ? AND opponent = ?',
+                              (bot_name, opponent_name)):
+            for key, val in zip(('games_since_training', 'accuracy_before_training', 'accuracy_after_training'),
+                                row[1:]):
+                misc.setdefault(key, {})[row[0]] = val
+
+    return {'bot_name': display_name, 'opponent_name': opponent_name,
+            'games': get_games(bot_name, opponent_name), 'heuristics': get_heuristics(bot_name, opponent_name),
+            'misc': misc}
+
+
+def import_profile(bot_name, opponent_name, profile):
+    """
+    Imports a profile dictionary in the form of the former profile.p files, in a single transaction.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :param profile: a profile dictionary (see ai.AI).
+    :return:
+    """
+    misc = profile.get('misc', {})
+    with _connect(write=True) as db:
+        db.execute('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)',
+                   (bot_name, opponent_name, profile.get('bot_name', bot_name)))
+        for game_id, stats in profile.get('games', {}).items():
+            _insert_game(db, bot_name, opponent_name, game_id, stats)
+        for name, values in profile.get('heuristics', {}).items():
+            for map_type, value in values.items():
+                db.execute('INSERT OR REPLACE INTO heuristics VALUES (?, ?, ?, ?, ?)',
+                           (bot_name, opponent_name, name, map_type, value))
+        for map_type in misc.get('games_since_training', {}):
+            _set_training_state(db, bot_name, opponent_name, map_type,
+                                {key: misc[key][map_type] for key in ('games_since_training',
+                                                                      'accuracy_before_training',
+                                                                      'accuracy_after_training')})
+
+
+def import_pickled_profile(bot_name, opponent_name):
+    """
+    Imports the profile.p file of a bot against an opponent, unless the store already holds a profile of the two. The
+    AI does this the first time it opens a profile, so profiles from before the store are never ignored.
+    :param bot_name: name of the bot's data directory.
+    :param opponent_name: name of the opponent.
+    :return: True if a profile was imported, False otherwise.
+    """
+    if has_profile(bot_name, opponent_name):
+        return False
+    profile = io.load_profile(bot_name, opponent_name)
+    if not profile:
+        return False
+    import_profile(bot_name, opponent_name, profile)
+    return True
+
+
+def migrate():
+    """
+    Imports every profile.p file in the data directory that has not been imported yet. The files are left in place.
+    :return: a list of (bot name, opponent name) tuples of the imported profiles.
+    """
+    imported = []
+    bots_dir = io.DATA_DIR + io.BOTS_DIR
+    if not os.path.exists(bots_dir):
+        return imported
+
+    for bot_name in sorted(os.listdir(bots_dir)):
+        opponents_dir = bots_dir + '/' + bot_name + io.OPP_DIR
+        if not os.path.isdir(opponents_dir):
+            continue
+        for opponent_name in sorted(os.listdir(opponents_dir)):
+            if import_pickled_profile(bot_name, opponent_name):
+                imported.append((bot_name, opponent_name))
+    return imported
+
+
+def get_db_path():
+    return io.DATA_DIR + '/' + PROFILE_DB_FILE
+
+
+@contextmanager
+def _connect(write=False):
+    """
+    Opens the database, creating its tables on first use. The connection commits when the block succeeds, rolls back
+    when it raises and is closed either way.
+    :param write: whether the block writes based on what it reads. If so, the block is one transaction that holds
+    the write lock from the start, so no other process (e.g. another client or the training process) writes between
+    its reads and its writes. Otherwise the transaction only starts with the first write.
+    :return: a sqlite3 connection.
+    """
+    path = get_db_path()
+    if path not in _initialised:
+        io.make_dir(io.DATA_DIR)
+    db = sqlite3.connect(path, timeout=TIMEOUT)
+    try:
+        if path not in _initialised:
+            # Write-ahead logging lets the client read while the training process writes.
+            db.execute('PRAGMA journal_mode=WAL')
+            tables = set(row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+            db.executescript(_SCHEMA)
+            if 'games' in tables and 'aggregates' not in tables:
+                # A database from before running totals were kept.
+                with db:
+                    _rebuild_aggregates(db)
+            _initialised.add(path)
+        with db:
+            if write:
+                db.execute('BEGIN IMMEDIATE')
+            yield db
+    finally:
+        db.close()
+
+
+def _insert_game(db, bot_name, opponent_name, game_id, stats):
+    # A compacted game only survives in the summary of its block, so recording it again would count it twice.
+    compacted = db.execute('SELECT 1 FROM history WHERE bot = ? AND opponent = ? AND ? BETWEEN first_game_id AND '
+                           'last_game_id LIMIT 1', (bot_name, opponent_name, game_id)).fetchone()
+    if compacted is not None:
+        return False
+
+    # A game that is recorded again replaces the previous record, so that record is taken out of the totals first.
+    previous = db.execute('SELECT map_type, victory, accuracy, evasion FROM games WHERE bot = ? AND opponent = ? AND '
+                          'game_id = ?', (bot_name, opponent_name, game_id)).fetchone()
+    if previous is not None:
+        _add_to_aggregates(db, bot_name, opponent_name, *previous, sign=-1)
+
+    metrics = {key: val for key, val in stats.items() if key not in _GAME_COLUMNS}
+    heuristics = stats.get('heuristics')
+    db.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+               (bot_name, opponent_name, game_id, stats.get('map_type'), stats.get('accuracy'), stats.get('evasion'),
+                _to_int(stats.get('victory')), None if heuristics is None else json.dumps(heuristics),
+                json.dumps(metrics) if metrics else None))
+    _add_to_aggregates(db, bot_name, opponent_name, stats.get('map_type'), _to_int(stats.get('victory')),
+                       stats.get('accuracy'), stats.get('evasion'))
+    return True
+
+
+def _add_to_aggregates(db, bot_name, opponent_name, map_type, victory, accuracy, evasion, sign=1):
+    # Adds a game to (or with a sign of -1, removes it from) the running totals of its map type.
+    key = (bot_name, opponent_name, _aggregate_map_type(map_type))
+    db.execute('INSERT OR IGNORE INTO aggregates (bot, opponent, map_type) VALUES (?, ?, ?)', key)
+    db.execute('UPDATE aggregates SET games = games + ?, wins = wins + ?, accuracy_sum = accuracy_sum + ?, '
+               'accuracy_games = accuracy_games + ?, evasion_sum = evasion_sum + ?, evasion_games = evasion_games + ? '
+               'WHERE bot = ? AND opponent = ? AND map_type = ?',
+               (sign, sign * (victory or 0), sign * (accuracy or 0.), sign * (accuracy is not None),
+                sign * (evasion or 0.), sign * (evasion is not None)) + key)
+
+
+def _rebuild_aggregates(db, bot_name=None, opponent_name=None):
+    conditions = [(column, value) for column, value in (('bot', bot_name), ('opponent', opponent_name))
+                  if value is not None]
+    where = ' WHERE ' + ' AND '.join(column + ' = ?' for column, _ in conditions) if conditions else ''
+    args = tuple(value for _, value in conditions)
+    db.execute('DELETE FROM aggregates' + where, args)
+    db.execute('INSERT INTO aggregates SELECT bot, opponent, map_type, TOTAL(games), TOTAL(wins), TOTAL(accuracy_sum), '
+               'TOTAL(accuracy_games), TOTAL(evasion_sum), TOTAL(evasion_games) FROM ('
+               'SELECT bot, opponent, COALESCE(map_type, ?) AS map_type, COUNT(*) AS games, TOTAL(victory) AS wins, '
+               'TOTAL(accuracy) AS accuracy_sum, COUNT(accuracy) AS accuracy_games, TOTAL(evasion) AS evasion_sum, '
+               'COUNT(evasion) AS evasion_games FROM games' + where + ' GROUP BY bot, opponent, COALESCE(map_type, ?) '
+               'UNION ALL SELECT bot, opponent, map_type, games, wins, accuracy_sum, accuracy_games, evasion_sum, '
+               'evasion_games FROM history' + where + ') GROUP BY bot, opponent, map_type',
+               (_NO_MAP_TYPE,) + args + (_NO_MAP_TYPE,) + args)
+
+
+def _aggregate_map_type(map_type):
+    return _NO_MAP_TYPE if map_type is None else map_type
+
+
+def _set_training_state(db, bot_name, opponent_name, map_type, training_state):
+    db.execute('INSERT OR REPLACE INTO training_state VALUES (?, ?, ?, ?, ?, ?)',
+               (bot_name, opponent_name, map_type, training_state['games_since_training'],
+                training_state['accuracy_before_training'], training_state['accuracy_after_training']))
+
+
+def _track_training(db, bot_name, opponent_name, map_type, accuracy):
+    # Counts a game towards the training state of its map type, updating the running average of the accuracy after
+    # training in the same statement. A map type that was never tracked starts out with the game's accuracy.
+    db.execute('INSERT INTO training_state VALUES (?, ?, ?, 1, 0, ?) ON CONFLICT (bot, opponent, map_type) DO UPDATE '
+               'SET games_since_training = games_since_training + 1, accuracy_after_training = '
+               'accuracy_after_training + (excluded.accuracy_after_training - accuracy_after_training) / '
+               '(games_since_training + 1)', (bot_name, opponent_name, map_type, accuracy))
+
+
+def _games_filter(bot_name, opponent_name, map_type):
+    if map_type is None:
+        return 'bot = ? AND opponent = ?', (bot_name, opponent_name)
+    return 'bot = ? AND opponent = ? AND map_type = ?', (bot_name, opponent_name, map_type)
+
+
+def _game_stats(row):
+    # Converts a row of the games table back to the stats dictionary it was recorded from.
+    game_id, map_type, accuracy, evasion, victory, heuristics, metrics = row
+    stats = json.loads(metrics) if metrics else {}
+    stats.update({'accuracy': accuracy, 'evasion': evasion, 'victory': None if victory is None else bool(victory),
+                  'map_type': map_type})
+    if heuristics is not None:
+        stats['heuristics'] = [tuple(pair) for pair in json.loads(heuristics)]
+    return stats
+
+
+def _to_int(victory):
+    return None if victory is None else int(bool(victory))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['migrate']:
+        for bot, opponent in migrate():
+            print('Imported the profile of', bot, 'against', opponent + '.')
+    elif sys.argv[1:] == ['rebuild-aggregates']:
+        rebuild_aggregates()
+        print('Rebuilt the running totals of all profiles.')
+    else:
+        print('Usage: python -m src.utils.profile_store migrate|rebuild-aggregates')
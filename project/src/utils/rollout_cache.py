@@ -0,0 +1,170 @@
+# This module caches the results of rollouts (games simulated by offensive_explorer) on disk. The optimiser and the
+# analysis tools frequently evaluate identical or near-identical heuristic values on the same training games, so
+# storing the outcome of each simulated game lets later training sessions and sweeps reuse it instead of re-simulating.
+
+# project imports
+import src.utils.file_io as io
+
+# library imports
+import ast
+import functools
+import hashlib
+import importlib.util
+import os
+import pickle
+import tempfile
+
+MAX_CACHED_ROLLOUTS = 20000  # Largest number of rollout results kept per bot and opponent before evicting old ones.
+HEURISTIC_PRECISION = 3  # Number of decimals heuristic values are rounded to, so near-identical values share results.
+# Modules that play the rollouts (the simulator and the heuristics handed to the bot), part of every bot's version.
+SIMULATOR_LOCATIONS = ('src.ai.offensive_explorer', 'src.ai.heuristics')
+PROJECT_PACKAGES = ('src', 'lib')  # Top-level packages of this project, whose modules are part of a bot's version.
+
+
+class RolloutCache:
+    """
+    A persistent cache of rollout results between a bot and an opponent. Each result is stored in its own small file
+    in the opponent's data directory, named by the hash of its key. The key is made up of:
+
+    (bot version, game id, quantised heuristic vector, sample count, seed)
+
+    Storing one file per result means that several processes (e.g. the optimiser's workers) can read and write the cache
+    at the same time without coordinating. Eviction is least-recently-used, based on file modification times which are
+    refreshed on every hit.
+    """
+
+    def __init__(self, bot_name, opponent_name, bot_version):
+        self.bot_version = bot_version  # identifies the bot's code, so results of older bot versions are not reused.
+        self.cache_dir = io.get_rollout_cache_dir(bot_name, opponent_name)
+        io.make_dir(self.cache_dir)
+
+    def get(self, game_id, heuristic_names, heuristic_values, samples, seed):
+        """
+        Look up the result of a rollout.
+        :param game_id: id of the game that was simulated.
+        :param heuristic_names: a list of heuristic names.
+        :param heuristic_values: a list of heuristic values, in the same order as the names.
+        :param samples: the number of boards sampled for the game.
+        :param seed: the seed the rollout was made with.
+        :return: the stored result or None if there is none.
+        """
+        path = self._path(game_id, heuristic_names, heuristic_values, samples, seed)
+        try:
+            with open(path, 'rb') as reader:
+                result = pickle.load(reader)
+            os.utime(path)  # mark as recently used.
+            return result
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, game_id, heuristic_names, heuristic_values, samples, seed, result):
+        """
+        Store the result of a rollout. The file is written to a temporary name first and then renamed, so concurrent
+        readers never see a partially written result.
+        :param result: a picklable result, e.g. a dictionary of average hits and misses.
+        :return:
+        """
+        path = self._path(game_id, heuristic_names, heuristic_values, samples, seed)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as writer:
+            pickle.dump(result, writer)
+        os.replace(tmp_path, path)
+
+    def prune(self, max_entries=None):
+        """
+        Evict the least recently used results until at most max_entries are left.
+        :param max_entries: optional upper limit. Defaults to MAX_CACHED_ROLLOUTS.
+        :return: the number of evicted results.
+        """
+        if max_entries is None:
+            max_entries = MAX_CACHED_ROLLOUTS
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.p'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:  # evicted by another process in the meantime.
+                    continue
+
+        evicted = 0
+        if len(entries) > max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - max_entries]:
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    continue
+
+        return evicted
+
+    def _path(self, game_id, heuristic_names, heuristic_values, samples, seed):
+        key = make_key(self.bot_version, game_id, heuristic_names, heuristic_values, samples, seed)
+        return self.cache_dir + '/' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.p'
+
+
+def make_key(bot_version, game_id, heuristic_names, heuristic_values, samples, seed):
+    """
+    Build the key a rollout is stored under. The heuristic values are rounded to HEURISTIC_PRECISION decimals and paired
+    with their names, so the same values for different heuristics never collide.
+    :return: a tuple of (bot version, game id, quantised heuristic vector, sample count, seed).
+    """
+    heuristic_vector = tuple((name, round(float(val), HEURISTIC_PRECISION))
+                             for name, val in zip(heuristic_names, heuristic_values))
+    return bot_version, game_id, heuristic_vector, samples, seed
+
+
+@functools.lru_cache(maxsize=None)
+def bot_version(bot_location):
+    """
+    Derive a version of a bot from the source of its module, the modules that simulate its games and every project
+    module these import, directly or indirectly (e.g. heuristics or ship_targeting). Any change to that code therefore
+    invalidates the rollouts that were cached for the bot.
+    :param bot_location: a string of a module path to where the bot resides.
+    :return: a short hash string.
+    """
+    digest = hashlib.sha1()
+    for location in sorted(_project_modules([bot_location] + list(SIMULATOR_LOCATIONS))):
+        spec = importlib.util.find_spec(location)
+        with open(spec.origin, 'rb') as reader:
+            digest.update(location.encode('utf-8') + b'\0' + reader.read() + b'\0')
+    return digest.hexdigest()[:12]
+
+
+def _project_modules(locations):
+    """
+    Finds the project modules that the given modules import, directly or indirectly, by parsing their source.
+    :param locations: a list of module paths.
+    :return: a set of module paths, including the given ones.
+    """
+    found = set()
+    pending = list(locations)
+    while pending:
+        location = pending.pop()
+        if location in found:
+            continue
+        spec = importlib.util.find_spec(location)
+        if spec is None or spec.origin is None or not spec.origin.endswith('.py'):
+            continue
+        found.add(location)
+        with open(spec.origin, 'rb') as reader:
+            tree = ast.parse(reader.read(), filename=spec.origin)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                # "from package import module" may name a module as well as an attribute.
+                names = [node.module] + [node.module + '.' + alias.name for alias in node.names]
+            else:
+                continue
+            pending.extend(name for name in names if name.split('.')[0] in PROJECT_PACKAGES and
+                           _module_exists(name))
+    return found
+
+
+def _module_exists(location):
+    try:
+        return importlib.util.find_spec(location) is not None
+    except ImportError:  # e.g. an attribute imported from a module rather than a module.
+        return False
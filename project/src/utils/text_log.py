@@ -0,0 +1,117 @@
+# This module exports recorded games as human-readable text. Games are rendered from the game log (see game_log.py)
+# by the background thread of write_behind.py once they have been logged, so exporting costs the game thread nothing.
+# The thread renders the games logged in a batch of writes together and writes them in one go.
+#
+# Rendered games are appended to gzip compressed bundles, text/bundle_XXXXXX.txt.gz, each holding one gzip member per
+# batch of games. A bundle reads as a single text file (e.g. with zcat). A new bundle is started once the current one
+# holds TEXT_BUNDLE_SIZE bytes and only the most recent TEXT_BUNDLES_KEPT bundles are kept. Any logged game can also
+# be rendered on demand:
+#
+#   python -m src.utils.text_log <bot name> <opponent name> [game id]
+
+# project imports
+import src.utils.file_io as io
+import src.utils.game_log as game_log
+import src.utils.write_behind as write_behind
+
+# library imports
+import datetime
+import gzip
+import os
+import re
+import sys
+
+TEXT_BUNDLE_SIZE = 1024 * 1024  # Compressed size in bytes from which a new bundle is started.
+TEXT_BUNDLES_KEPT = 10  # Number of most recent bundles kept per opponent.
+
+_BUNDLE_FILE = 'bundle_{:06d}.txt.gz'
+_BUNDLE_PATTERN = re.compile(r'bundle_(\d{6})\.txt\.gz$')
+_FIELD = '{:<2} '.format  # A cell of a rendered board.
+
+_pending = {}  # (bot name, opponent name):list of logged game ids not yet exported. Only used by one thread.
+
+
+def export_game(bot_name, opponent_name, game_id):
+    """
+    Exports a logged game to the text bundles. On the background thread of write_behind.py, the game is exported
+    together with the others logged before the queue runs empty.
+    :param bot_name: name of the bot.
+    :param opponent_name: name of the opponent.
+    :param game_id: id of the game.
+    :return:
+    """
+    key = (bot_name, opponent_name)
+    queued = key in _pending
+    _pending.setdefault(key, []).append(game_id)
+    if not queued:
+        write_behind.when_idle(_export_pending, bot_name, opponent_name)
+
+
+def render_game(bot_name, game_states, exported=None):
+    """
+    Renders a game as text.
+    :param bot_name: name of the bot.
+    :param game_states: the list of game states of the game.
+    :param exported: optional datetime to head the text with.
+    :return: the game as a string.
+    """
+    opponent_name = game_states[0]['OpponentId']
+    parts = [exported.strftime('%d/%m/%y %H:%M:%S')] if exported else []
+    parts.extend(['\nGameId: ', str(game_states[0]['GameId']), '\nShips: ', str(game_states[0]['Ships']),
+                  '\n--GAME START--\n\n'])
+    for game_state in game_states:
+        parts.extend(['\n', bot_name, '\n', board_to_string(game_state['MyBoard']), '\n',
+                      opponent_name, '\n', board_to_string(game_state['OppBoard']), '\n\n'])
+    parts.append('\n\n--GAME END--\n')
+    return ''.join(parts)
+
+
+# Converts board to somewhat more readable string.
+def board_to_string(board):
+    return ''.join([''.join(map(_FIELD, row)) + '\n' for row in board])
+
+
+def get_text_log_dir(bot_name, opponent_name):
+    return io.DATA_DIR + io.BOTS_DIR + '/' + bot_name + io.OPP_DIR + '/' + opponent_name + io.GAMES_DIR + '/text'
+
+
+def _export_pending(bot_name, opponent_name):
+    game_ids = _pending.pop((bot_name, opponent_name), [])
+    exported = datetime.datetime.now()
+    text = ''.join([render_game(bot_name, game_states, exported)
+                    for _, game_states in game_log.iter_games(bot_name, opponent_name, game_ids)])
+    if text:
+        _append_to_bundle(bot_name, opponent_name, gzip.compress(text.encode()))
+
+
+def _append_to_bundle(bot_name, opponent_name, member):
+    text_dir = get_text_log_dir(bot_name, opponent_name)
+    io.make_dir(text_dir)
+    with io.lock(text_dir):
+        bundles = _bundles(text_dir)
+        if not bundles or os.path.getsize(text_dir + '/' + _BUNDLE_FILE.format(bundles[-1])) >= TEXT_BUNDLE_SIZE:
+            bundles.append(bundles[-1] + 1 if bundles else 0)
+        path = text_dir + '/' + _BUNDLE_FILE.format(bundles[-1])
+        with open(path, 'ab') as writer:
+            writer.write(member)
+        write_behind.written(path)
+
+        for bundle in bundles[:-TEXT_BUNDLES_KEPT]:
+            io.remove_file(text_dir + '/' + _BUNDLE_FILE.format(bundle))
+
+
+def _bundles(text_dir):
+    # Numbers of the bundles in the directory, in ascending order.
+    matches = [_BUNDLE_PATTERN.match(name) for name in os.listdir(text_dir)]
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        for game in game_log.list_games(*sys.argv[1:]):
+            print(game['game_id'], game.get('turns', ''), game.get('map_type', ''))
+    elif len(sys.argv) == 4:
+        game = game_log.load_game(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+        print(render_game(sys.argv[1], game) if game else 'No game ' + sys.argv[3] + ' in the log.')
+    else:
+        print('Usage: python -m src.utils.text_log <bot name> <opponent name> [game id]')
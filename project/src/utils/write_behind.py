@@ -0,0 +1,170 @@
+# This module takes the writes at the end of a game (the game log, the board archive and the profile) off the game
+# thread. Writes are queued and carried out in order by a background thread, so the next game can be offered while
+# the last one is still being stored. Files written by the thread are synced to disk in batches, together with the
+# directories holding them (so new and renamed files are durable too), and all queued writes are carried out before
+# the client exits.
+#
+# A batch ends once the queue has run empty or MAX_PENDING_WRITES writes have been carried out since the last sync.
+# A crash of the client therefore loses at most the queued writes (MAX_PENDING_WRITES) and the one in progress. A crash
+# of the whole system may also lose the writes of the current batch, at most another MAX_PENDING_WRITES. A game
+# queues about four writes.
+
+# library imports
+import atexit
+import os
+import queue
+import threading
+import traceback
+
+WRITE_BEHIND = True  # Whether writes are queued for the background thread. If not, they are carried out at once.
+MAX_PENDING_WRITES = 8  # Largest number of queued writes (and of writes per sync). Queueing another one waits.
+
+_writer = None  # The writer of this process, created on first use.
+
+
+class Writer:
+    """
+    Carries out queued writes in a background thread, one after another in the order they were queued. A write is a
+    function and its arguments. A write that raises an error is reported and skipped.
+    """
+
+    def __init__(self):
+        self.writes = queue.Queue(MAX_PENDING_WRITES)  # writes waiting to be carried out.
+        self.unsynced = set()  # paths of files written since the last sync.
+        self.unsynced_writes = 0  # number of writes carried out since the last sync.
+        self.idle = []  # functions (and their arguments) to call once the queue has run empty.
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def submit(self, write, *args, **kwargs):
+        """
+        Queue a write, waiting if MAX_PENDING_WRITES writes are queued already.
+        :param write: a function that writes something.
+        :param args: positional arguments of the function.
+        :param kwargs: keyword arguments of the function.
+        :return:
+        """
+        self.writes.put((write, args, kwargs))
+
+    def flush(self):
+        """
+        Wait until all queued writes have been carried out and synced to disk.
+        :return:
+        """
+        self.writes.join()
+
+    def _run(self):
+        while True:
+            write, args, kwargs = self.writes.get()
+            try:
+                write(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                # Finish and sync once per batch of writes rather than after each one.
+                self.unsynced_writes += 1
+                if self.writes.empty():
+                    self._run_idle()
+                    self._sync()
+                elif self.unsynced_writes >= MAX_PENDING_WRITES:
+                    self._sync()
+                self.writes.task_done()
+
+    def _run_idle(self):
+        while self.idle:
+            callback, args = self.idle.pop(0)
+            try:
+                callback(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def _sync(self):
+        # Files first, then the directories holding their names.
+        for path in sorted(self.unsynced) + sorted(set(os.path.dirname(path) for path in self.unsynced)):
+            sync_path(path)
+        self.unsynced.clear()
+        self.unsynced_writes = 0
+
+
+def get_writer():
+    """
+    Get the writer of this process, creating it if necessary. All queued writes are carried out before the process
+    exits.
+    :return: a Writer.
+    """
+    global _writer
+    if _writer is None:
+        _writer = Writer()
+    return _writer
+
+
+def submit(write, *args, **kwargs):
+    """
+    Queue a write for the background thread, or carry it out at once if WRITE_BEHIND is off.
+    :param write: a function that writes something.
+    :param args: positional arguments of the function.
+    :param kwargs: keyword arguments of the function.
+    :return:
+    """
+    if WRITE_BEHIND:
+        get_writer().submit(write, *args, **kwargs)
+    else:
+        write(*args, **kwargs)
+
+
+def flush():
+    """
+    Wait until all queued writes have been carried out, e.g. before reading what they wrote.
+    :return:
+    """
+    if _writer is not None:
+        _writer.flush()
+
+
+# Registered on import rather than with the writer, so that the exit handlers of the modules importing this one (such
+# as training_runner.py) run before the queued writes are carried out.
+atexit.register(flush)
+
+
+def written(path):
+    """
+    Note that a file has been written to, created or renamed. If it was by the background thread, the file and its
+    directory are synced to disk with the rest of the batch. A new directory can be noted the same way.
+    :param path: path of the file or directory.
+    :return:
+    """
+    if _writer is not None and threading.current_thread() is _writer.thread:
+        _writer.unsynced.add(path)
+
+
+def sync_path(path):
+    """
+    Syncs a file or directory to disk. Paths that have been removed in the meantime (e.g. a compacted archive) and
+    directories on systems that cannot open them (Windows) are skipped.
+    :param path: path of the file or directory.
+    :return:
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # some file systems cannot sync directories.
+    finally:
+        os.close(fd)
+
+
+def when_idle(callback, *args):
+    """
+    Call a function once no more writes are queued, so that work can be batched over several writes. Only the
+    background thread defers the call; anywhere else the function is called at once.
+    :param callback: a function.
+    :param args: positional arguments of the function.
+    :return:
+    """
+    if _writer is not None and threading.current_thread() is _writer.thread:
+        _writer.idle.append((callback, args))
+    else:
+        callback(*args)
@@ -1,5 +1,10 @@
-from unittest import TestCase
+from unittest import TestCase, mock
+import tempfile
+
 import src.ai.ai as ai
+import src.ai.training_runner as training_runner
+import src.utils.file_io as io
+import src.utils.profile_store as store
 
 
 class TestIsGameOver(TestCase):
@@ -28,4 +33,63 @@ class TestIsGameOver(TestCase):
                                   ['', '', '', 'L', 'L', '', '', ''],
                                   ['', '', '', '', '', '', '', '']]
 
-        self.assertFalse(ai.is_game_over(game_state))
\ No newline at end of file
+        self.assertFalse(ai.is_game_over(game_state))
+
+class TestBackgroundTraining(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        io.DATA_DIR = self.data_dir.name
+        self.game_state = {'OpponentId': 'housebot', 'GameId': 1,
+                           'MyBoard': [['', 'L'],
+                                       ['', '']]}
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        self.data_dir.cleanup()
+
+    # The result of a background training is stored in the profile and used when the bot is next loaded.
+    def test_take_over_training_result(self):
+        games = {0: {'accuracy': 0.4, 'evasion': 0.5, 'victory': True, 'map_type': 'land', 'heuristics': []}}
+        profile = {'bot_name': 'Pho', 'opponent_name': 'housebot', 'games': games, 'heuristics': {},
+                   'misc': {'games_since_training': {'land': 20}, 'accuracy_before_training': {'land': 0.3},
+                            'accuracy_after_training': {'land': 0.4}}}
+        store.import_profile('pho', 'housebot', profile)
+        io.save_training_result({'heuristic_names': ['ship_adjacency'], 'values': [0.5], 'map_type': 'land'},
+                                'pho', 'housebot')
+
+        bot = ai.AI(self.game_state)
+        bot.load_bot('pho', heuristic_choices=['ship_adjacency'])
+
+        self.assertEqual([('ship_adjacency', 0.5)], bot.heuristic_info)
+        self.assertEqual([], io.load_training_results('pho', 'housebot'))
+        saved = store.load_profile('pho', 'housebot')
+        self.assertEqual({'land': 0.5}, saved['heuristics']['ship_adjacency'])
+        self.assertEqual(0, saved['misc']['games_since_training']['land'])
+        self.assertEqual(0.4, saved['misc']['accuracy_before_training']['land'])
+
+    # A training that was interrupted by closing the client is continued when the bot is next loaded.
+    def test_resume_interrupted_training(self):
+        games = {0: {'accuracy': 0.4, 'evasion': 0.5, 'victory': True, 'map_type': 'land', 'heuristics': []}}
+        profile = {'bot_name': 'Pho', 'opponent_name': 'housebot', 'games': games, 'heuristics': {},
+                   'misc': {'games_since_training': {'land': 20}, 'accuracy_before_training': {'land': 0.3},
+                            'accuracy_after_training': {'land': 0.4}}}
+        store.import_profile('pho', 'housebot', profile)
+        job = {'bot_name': 'pho', 'opponent_name': 'housebot', 'bot_location': 'src.ai.bots.pho',
+               'heuristic_names': ['ship_adjacency'], 'map_type': 'land', 'game_ids': [0],
+               'optimisation_type': 'minimise'}
+        io.save_training_checkpoint({'job': job}, 'pho', 'housebot', 'land')
+
+        old_background = ai.BACKGROUND_TRAINING
+        ai.BACKGROUND_TRAINING = False
+        try:
+            with mock.patch.object(training_runner, '_optimise', return_value=[0.7]) as optimise:
+                bot = ai.AI(self.game_state)
+                bot.load_bot('pho', heuristic_choices=['ship_adjacency'])
+        finally:
+            ai.BACKGROUND_TRAINING = old_background
+
+        optimise.assert_called_once_with(job)
+        self.assertEqual([], training_runner.interrupted_jobs('pho', 'housebot'))
+        self.assertEqual({'land': 0.7}, store.load_profile('pho', 'housebot')['heuristics']['ship_adjacency'])
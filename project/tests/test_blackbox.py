@@ -0,0 +1,203 @@
+from unittest import TestCase
+from multiprocessing.pool import ThreadPool
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+import lib.blackbox as bb
+
+
+class TestRBF(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.points = np.zeros((12, 3))
+        self.points[:, 0:-1] = rng.rand(12, 2)
+        self.points[:, -1] = np.sin(5 * self.points[:, 0]) + self.points[:, 1] ** 2
+        self.T = np.array([[0.8, 0.2], [-0.3, 1.1]])
+
+    # The fit must pass through the points it was built from.
+    def test_interpolates_points(self):
+        fit = bb.rbf(self.points, self.T)
+        for point in self.points:
+            self.assertAlmostEqual(point[-1], fit(point[0:-1]), places=8)
+
+    # Evaluating many points at once must match evaluating them one at a time.
+    def test_batched_fit(self):
+        fit = bb.rbf(self.points, self.T)
+        queries = np.random.RandomState(1).rand(50, 2)
+        batched = fit(queries)
+
+        self.assertEqual((50,), batched.shape)
+        for query, value in zip(queries, batched):
+            self.assertAlmostEqual(value, fit(query), places=10)
+
+
+class TestRescale(TestCase):
+
+    # The scaling matrix stretches the direction in which the function changes fastest the most.
+    def test_anisotropic_function(self):
+        np.random.seed(0)
+        points = np.zeros((30, 4))
+        points[:, 0:-1] = bb.latin(30, 3)
+        points[:, -1] = 25 * (points[:, 0] - 0.5) ** 2 + (points[:, 1] - 0.5) ** 2 + (points[:, 2] - 0.5) ** 2
+
+        T = bb.rescale(points, 10000, 0.05)
+
+        self.assertEqual((3, 3), T.shape)
+        self.assertTrue(np.isrealobj(T))
+        self.assertAlmostEqual(1., np.linalg.norm(T))
+        stretch = np.linalg.norm(T, axis=0)
+        self.assertEqual(0, np.argmax(stretch))
+
+
+class TestLatin(TestCase):
+
+    # Each dimension of a latin hypercube holds every level exactly once.
+    def test_is_latin_hypercube(self):
+        n, d = 15, 3
+        lh = bb.latin(n, d)
+
+        self.assertEqual((n, d), lh.shape)
+        for dim in range(d):
+            self.assertEqual([i / (n - 1.) for i in range(n)], sorted(lh[:, dim]))
+
+    # Shuffling must spread the points better than the initial diagonal.
+    def test_improves_spread(self):
+        def spread(points):
+            return sum(1. / np.linalg.norm(points[i] - points[j]) for i in range(len(points)) for j in range(i))
+
+        n, d = 15, 3
+        diagonal = np.array([[i / (n - 1.)] * d for i in range(n)])
+        self.assertLess(spread(bb.latin(n, d)), spread(diagonal))
+
+    def test_cached_design(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            design = bb.latin(10, 2, cache_dir)
+            self.assertTrue(np.array_equal(design, bb.latin(10, 2, cache_dir)))
+
+
+class TestSelectBatch(TestCase):
+
+    # Chosen points keep their distance to existing points and each other, while preferring low fitted values.
+    def test_respects_radii(self):
+        np.random.seed(0)
+        existing = np.array([[0.1, 0.1], [0.9, 0.9], [0.5, 0.2]])
+        radii = [0.2, 0.15, 0.1]
+
+        def fit(x):
+            return np.sum((x - 0.3) ** 2, axis=1)
+
+        batch = bb.select_batch(fit, existing, radii, 5000)
+
+        self.assertEqual((3, 2), batch.shape)
+        for j, r in enumerate(radii):
+            others = np.vstack([existing, batch[:j]])
+            self.assertTrue(np.all(np.linalg.norm(others - batch[j], axis=1) >= r))
+        # The best candidate is close to the minimum of the fit.
+        self.assertLess(np.linalg.norm(batch[0] - 0.3), 0.05)
+
+    def test_search(self):
+        np.random.seed(0)
+
+        def f(x):
+            return (x[0] - 1.) ** 2 + (x[1] + 0.5) ** 2 + 1.
+
+        points = bb.search(f, [[-2., 2.], [-2., 2.]], 8, 8, 2, None, acquisition='vectorized', executor=ThreadPool)
+
+        self.assertEqual((16, 3), points.shape)
+        self.assertLess(points[0][-1], 1.5)
+
+
+class TestBlackBox(TestCase):
+
+    @staticmethod
+    def f(x):
+        return (x[0] - 1.) ** 2 + (x[1] + 0.5) ** 2 + 1.
+
+    def setUp(self):
+        np.random.seed(0)
+        self.box = [[-2., 2.], [-2., 2.]]
+
+    # Subsequent points need the whole initial stage, but may be requested while others are being evaluated.
+    def test_ask_and_tell_out_of_order(self):
+        opt = bb.BlackBox(self.box, 4, 4, acquisition='vectorized')
+
+        initial = opt.ask(6)
+        self.assertEqual(4, len(initial))
+        for k, x in reversed(initial[1:]):
+            opt.tell(k, self.f(x))
+        self.assertEqual([], opt.ask(2))
+
+        opt.tell(initial[0][0], self.f(initial[0][1]))
+        first, second = opt.ask(2)
+        third = opt.ask(1)[0]
+        self.assertEqual([first[0], second[0], third[0]], opt.pending())
+
+        for k, x in [third, first, second]:
+            opt.tell(k, self.f(x))
+        opt.tell(*[(k, self.f(x)) for k, x in opt.ask(1)][0])
+
+        self.assertTrue(opt.done())
+        self.assertEqual((8, 3), opt.result().shape)
+        self.assertEqual([], opt.ask(1))
+
+    # Restoring a pickled state hands out the points that were pending again.
+    def test_state_round_trip(self):
+        opt = bb.BlackBox(self.box, 4, 2, acquisition='vectorized')
+        proposals = opt.ask(4)
+        for k, x in proposals[0:3]:
+            opt.tell(k, self.f(x))
+
+        restored = bb.BlackBox.from_state(pickle.loads(pickle.dumps(opt.get_state())))
+        self.assertEqual([], restored.pending())
+        k, x = restored.ask(1)[0]
+        self.assertEqual(proposals[3][0], k)
+        self.assertTrue(np.allclose(proposals[3][1], x))
+
+        restored.tell(k, self.f(x))
+        for k, x in restored.ask(2):
+            restored.tell(k, self.f(x))
+        self.assertTrue(restored.done())
+
+    def test_run_async(self):
+        opt = bb.BlackBox(self.box, 6, 6, prior=[[1., -0.5, 1.]], acquisition='vectorized')
+        with ThreadPool(3) as pool:
+            points = bb.run_async(opt, self.f, pool, 3)
+
+        self.assertEqual((13, 3), points.shape)
+        self.assertEqual([1., -0.5, 1.], list(points[0]))
+
+    # Reducing the plan cuts down both stages in proportion; dropped points are never handed out.
+    def test_reduce(self):
+        opt = bb.BlackBox(self.box, 8, 8, acquisition='vectorized')
+        for k, x in opt.ask(2):
+            opt.tell(k, self.f(x))
+
+        opt.reduce(4)
+        asked = 2
+        while not opt.done():
+            proposals = opt.ask(3)
+            asked += len(proposals)
+            for k, x in proposals:
+                opt.tell(k, self.f(x))
+
+        self.assertEqual(6, asked)
+        self.assertEqual((6, 16), opt.progress())
+
+    # A search with a time budget stops early with the points evaluated so far.
+    def test_run_async_time_budget(self):
+        def slow(x):
+            time.sleep(0.05)
+            return self.f(x)
+
+        opt = bb.BlackBox(self.box, 20, 20, acquisition='vectorized')
+        start = time.time()
+        with ThreadPool(2) as pool:
+            points = bb.run_async(opt, slow, pool, 2, time_budget=0.3)
+
+        self.assertLess(time.time() - start, 0.6)
+        self.assertLess(len(points), 40)
+        self.assertEqual(len(points), opt.progress()[0])
@@ -0,0 +1,112 @@
+from unittest import TestCase
+import os
+import tempfile
+import numpy as np
+
+import src.ai.bot_learning as learn
+import src.utils.board_archive as archive
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+
+
+class TestBoardArchive(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_max_games = archive.MAX_GAMES_ARCHIVED
+        io.DATA_DIR = self.data_dir.name
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        archive.MAX_GAMES_ARCHIVED = self.old_max_games
+        self.data_dir.cleanup()
+
+    # A game in which we fire at two cells and the opponent at one.
+    @staticmethod
+    def _game(opp_board, ships):
+        def board(first_cell, rows=None):
+            board = [list(row) for row in rows] if rows else [['' for _ in row] for row in opp_board]
+            board[0][0] = first_cell
+            return board
+
+        states = [{'Ships': ships, 'MyBoard': board(''), 'OppBoard': board('')},
+                  {'Ships': ships, 'MyBoard': board(''), 'OppBoard': board('M')},
+                  {'Ships': ships, 'MyBoard': board('H'), 'OppBoard': board('M')},
+                  {'Ships': ships, 'MyBoard': board('H'), 'OppBoard': board('M', opp_board)}]
+        return encoding.encode_game(states)
+
+    # The decoded fleet must match the one extracted from the game log.
+    def test_fleet_matches_extraction(self):
+        finished_board = [['', 'S0', 'S0', 'S0'],
+                          ['', 'H', 'H', ''],
+                          ['L', '', 'M', 'S1'],
+                          ['', 'M', '', 'S1']]
+
+        encoded = archive.encode_board(finished_board)
+        self.assertEqual(finished_board, archive.decode_board(encoded))
+        self.assertEqual(learn._extract_original_opp_board(finished_board), archive.decode_fleet(encoded))
+
+    def test_append_and_get_games(self):
+        small_board = [['', 'S0'],
+                       ['L', '']]
+        large_board = [['', '', 'M'],
+                       ['S1', 'S1', ''],
+                       ['S0', 'S0', 'S0']]
+
+        archive.append_game('pho', 'housebot', 'land', 2, self._game(small_board, [1]))
+        archive.append_game('pho', 'housebot', 'land', 1, self._game(large_board, [3, 2]))
+
+        games = archive.get_games(archive.load_archive('pho', 'housebot', 'land'), [1, 2, 3])
+        self.assertEqual({1, 2}, set(games))
+        self.assertEqual([['', '0'], ['L', '']], games[2]['opp_board'])
+        self.assertEqual([1], games[2]['ships'])
+        self.assertEqual([['', '', ''], ['1', '1', ''], ['0', '0', '0']], games[1]['opp_board'])
+        self.assertEqual([3, 2], games[1]['ships'])
+        self.assertIsNone(archive.load_archive('pho', 'housebot', 'no-land'))
+
+    # Games are picked by id from the memory-mapped archive, the last one archived under an id counting.
+    def test_get_games_by_id(self):
+        for pos, game_id in enumerate([7, 3, 9, 3]):
+            archive.append_game('pho', 'housebot', 'land', game_id, self._game([['', 'S0'], ['', '']], [pos + 1]))
+
+        games = archive.get_games(archive.load_archive('pho', 'housebot', 'land'), [9, 3, 4, 7])
+        self.assertEqual([9, 3, 7], list(games))
+        self.assertEqual({9: [3], 3: [4], 7: [1]}, {game_id: game['ships'] for game_id, game in games.items()})
+        self.assertEqual({}, archive.get_games(archive.load_archive('pho', 'housebot', 'land'), []))
+
+    def test_shots_and_recent_games(self):
+        for game_id in range(4):
+            archive.append_game('pho', 'housebot', 'land', game_id, self._game([['', 'S0'], ['', '']], [1]))
+
+        stored = archive.load_archive('pho', 'housebot', 'land')
+        recent = archive.recent_games(stored, 2)
+        self.assertEqual([2, 3], list(recent['meta']['game_id']))
+        self.assertTrue(np.shares_memory(recent['opp_boards'], stored['opp_boards']))
+
+        meta = recent['meta'][-1]
+        self.assertEqual((2, 1), (meta['shots'], meta['opp_shots']))
+        self.assertEqual([[0, 0], [0, 1]], recent['shots'][-1, :meta['shots']].tolist())
+        self.assertEqual([[0, 0]], recent['opp_shots'][-1, :meta['opp_shots']].tolist())
+        self.assertEqual([['H', ''], ['', '']], archive.decode_board(recent['my_boards'][-1]))
+
+    # The archive is compacted into a new generation once it holds twice the games to keep, keeping the most recent.
+    def test_compaction(self):
+        archive.MAX_GAMES_ARCHIVED = 3
+        for game_id in range(10):
+            archive.append_game('pho', 'housebot', 'land', game_id, self._game([['', 'S0']], [1]))
+
+        self.assertEqual([6, 7, 8, 9], list(archive.load_archive('pho', 'housebot', 'land')['meta']['game_id']))
+        self.assertEqual(['gen_000002'], os.listdir(archive.get_archive_dir('pho', 'housebot', 'land')))
+
+    # Rows of a game that was not completely appended (from a crash) are ignored and overwritten.
+    def test_partial_append(self):
+        archive.append_game('pho', 'housebot', 'land', 1, self._game([['', 'S0']], [1]))
+        gen_dir = archive.get_archive_dir('pho', 'housebot', 'land') + '/gen_000000'
+        with open(gen_dir + '/opp_boards.bin', 'ab') as writer:
+            writer.write(b'\x00' * 10)
+
+        archive.append_game('pho', 'housebot', 'land', 2, self._game([['', 'S0'], ['', 'S0']], [2]))
+        games = archive.get_games(archive.load_archive('pho', 'housebot', 'land'), [1, 2])
+        self.assertEqual([['', '0']], games[1]['opp_board'])
+        self.assertEqual([['', '0'], ['', '0']], games[2]['opp_board'])
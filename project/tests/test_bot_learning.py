@@ -1,6 +1,12 @@
 from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
 
 import src.ai.bot_learning as learn
+import src.ai.heuristics as heur
+import src.ai.offensive_explorer as explorer
+import src.utils.file_io as io
+import src.utils.rollout_cache as rollout_cache
 
 
 class TestBoardExtraction(TestCase):
@@ -18,3 +24,140 @@ class TestBoardExtraction(TestCase):
 
         self.assertEqual(original_board_test, learn._extract_original_opp_board(finished_board))
 
+
+
+class TestConcurrentEvaluation(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_samples = explorer.BOARD_SAMPLES
+        io.DATA_DIR = self.data_dir.name
+        explorer.BOARD_SAMPLES = 5
+
+        board = [['', '1', '', '', '', ''],
+                 ['', '1', '', '', '', ''],
+                 ['', '1', '', 'L', '', ''],
+                 ['', '', '0', '0', '0', '0'],
+                 ['', '', '', '', '', ''],
+                 ['2', '2', '', '', '', '']]
+
+        # Without a cache, every evaluation has to actually play the games.
+        self.optimiser = learn.Optimiser('pho', 'housebot', 'src.ai.bots.pho', use_rollout_cache=False)
+        self.optimiser.prepare_heuristics(['ship_adjacency'])
+        self.optimiser.set_optimisation_type('minimise')
+        self.optimiser.games = [{'game_id': game_id, 'opp_board': board, 'ships': [4, 3, 2]} for game_id in range(3)]
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        explorer.BOARD_SAMPLES = self.old_samples
+        self.data_dir.cleanup()
+
+    # Many evaluations of different values in parallel in one process must match their serial evaluation.
+    def test_parallel_evaluations_are_deterministic(self):
+        values = [[0.05], [5.], [1.], [0.5]]
+        serial = [self.optimiser.play_games(v) for v in values]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            parallel = list(executor.map(self.optimiser.play_games, values * 4))
+
+        self.assertEqual(serial * 4, parallel)
+        self.assertEqual(('ship_adjacency',), self.optimiser.heuristic_names)
+
+    # Spreading the games of several evaluations over a pool of processes gives the results of the serial path.
+    def test_scheduler_matches_serial(self):
+        values = [[0.05], [5.], [1.]]
+        serial = [self.optimiser.play_games(v) for v in values]
+
+        with learn.RolloutScheduler(self.optimiser, batch=2, processes=2) as scheduler:
+            self.assertEqual(serial, scheduler.map(self.optimiser.play_games, values))
+            self.assertEqual(serial[1], scheduler.apply_async(self.optimiser.play_games, ([5.],)).get())
+        self.assertIsNone(self.optimiser.game_executor)
+
+    # Cached games are merged with the ones the pool plays, each in its place.
+    def test_scheduler_merges_cached_games(self):
+        heuristics = heur.bind(self.optimiser.heuristic_names, [1.])
+        played = [self.optimiser._play_game(game, heuristics, explorer.BOARD_SAMPLES) for game in self.optimiser.games]
+        self.optimiser.rollout_cache = rollout_cache.RolloutCache('pho', 'housebot', 'test')
+        self.optimiser.rollout_cache.put(1, self.optimiser.heuristic_names, [1.], explorer.BOARD_SAMPLES,
+                                         self.optimiser.seed, {'misses': 100., 'hits': 0.})
+
+        with learn.RolloutScheduler(self.optimiser, batch=1, processes=2) as scheduler:
+            score = scheduler.map(self.optimiser.play_games, [[1.]])[0]
+
+        self.assertAlmostEqual((played[0]['misses'] + 100. + played[2]['misses']) / 3, score)
+        self.assertEqual(played[2], self.optimiser.rollout_cache.get(2, self.optimiser.heuristic_names, [1.],
+                                                                     explorer.BOARD_SAMPLES, self.optimiser.seed))
+
+    # An error inside the scheduler still shuts its pools down.
+    def test_scheduler_shuts_down_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with learn.RolloutScheduler(self.optimiser, batch=2, processes=2) as scheduler:
+                workers = list(scheduler.game_pool._pool)
+                raise RuntimeError('interrupted')
+
+        self.assertIsNone(self.optimiser.game_executor)
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+
+
+class CountingOptimiser(learn.Optimiser):
+    """
+    Counts its evaluations and fails once it has made a given number, as if the client was closed.
+    """
+    evaluations = 0
+    limit = None
+
+    def play_games(self, heuristic_values, fidelity=1.):
+        if CountingOptimiser.limit is not None and CountingOptimiser.evaluations >= CountingOptimiser.limit:
+            raise RuntimeError('interrupted')
+        CountingOptimiser.evaluations += 1
+        return super().play_games(heuristic_values, fidelity)
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_settings = (explorer.BOARD_SAMPLES, learn.BB_GLOBAL_CALLS, learn.BB_LOCAL_CALLS, learn.PARALLEL_CALLS,
+                             learn.ROLLOUT_PROCESSES, learn.CHECKPOINT_INTERVAL)
+        io.DATA_DIR = self.data_dir.name
+        explorer.BOARD_SAMPLES = 5
+        learn.BB_GLOBAL_CALLS, learn.BB_LOCAL_CALLS, learn.PARALLEL_CALLS = 3, 2, 1
+        learn.ROLLOUT_PROCESSES = 1
+        learn.CHECKPOINT_INTERVAL = 0
+        CountingOptimiser.evaluations = 0
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        explorer.BOARD_SAMPLES, learn.BB_GLOBAL_CALLS, learn.BB_LOCAL_CALLS, learn.PARALLEL_CALLS, \
+            learn.ROLLOUT_PROCESSES, learn.CHECKPOINT_INTERVAL = self.old_settings
+        self.data_dir.cleanup()
+
+    def _optimiser(self):
+        board = [['', '1', '', ''],
+                 ['', '1', '', ''],
+                 ['0', '0', '0', ''],
+                 ['', '', '', '']]
+        optimiser = CountingOptimiser('pho', 'housebot', 'src.ai.bots.pho', use_rollout_cache=False)
+        optimiser.prepare_heuristics(['ship_adjacency'])
+        optimiser.set_optimisation_type('minimise')
+        optimiser.games = [{'game_id': 0, 'opp_board': board, 'ships': [3, 2]}]
+        optimiser.map_type = 'no-land'
+        return optimiser
+
+    # An interrupted optimisation continues with the points it had not evaluated yet.
+    def test_resume(self):
+        CountingOptimiser.limit = 4
+        with self.assertRaises(RuntimeError):
+            self._optimiser().optimise()
+        self.assertIsNotNone(io.load_training_checkpoint('pho', 'housebot', 'no-land'))
+        self.assertEqual(5, len(io.read_file(io.get_training_points_path('pho', 'housebot', 'no-land'))))
+
+        CountingOptimiser.limit = None
+        CountingOptimiser.evaluations = 0
+        result = self._optimiser().optimise()
+
+        self.assertEqual(1, CountingOptimiser.evaluations)
+        self.assertEqual(2, len(result))
+        self.assertIsNone(io.load_training_checkpoint('pho', 'housebot', 'no-land'))
@@ -0,0 +1,105 @@
+from unittest import TestCase
+import multiprocessing as mp
+import tempfile
+
+import src.ai.training_runner as training_runner
+import src.utils.board_archive as archive
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.game_log as game_log
+import src.utils.profile_store as store
+
+CLIENTS = 6  # Number of processes writing at once.
+GAMES = 15  # Number of games each process records.
+
+
+def _game(game_id):
+    boards = [[[''] * 3 for _ in range(3)] for _ in range(2)]
+    boards[1][game_id % 3][game_id // 3 % 3] = 'S0'
+    return encoding.encode_game([{'GameId': game_id, 'Ships': [1], 'MyBoard': boards[0], 'OppBoard': boards[1]}])
+
+
+# Records games like a client does at the end of each game, and stores training points like a training does.
+def _client(data_dir, client):
+    io.DATA_DIR = data_dir
+    game_log.GAMES_PER_SEGMENT = 4
+    for k in range(GAMES):
+        game_id = client * GAMES + k
+        game_log.append_game('pho', 'housebot', game_id, _game(game_id))
+        archive.append_game('pho', 'housebot', 'land', game_id, _game(game_id))
+        store.add_game('pho', 'housebot', game_id, {'accuracy': 0.5, 'evasion': 0.5, 'victory': True,
+                                                    'map_type': 'land'})
+        with io.lock(io.get_training_history_path('pho', 'housebot')):
+            history = io.load_training_history('pho', 'housebot') or {}
+            history[game_id] = k
+            io.save_training_history(history, 'pho', 'housebot')
+
+
+# Records the same few games over and over with different stats, as clients that replay a game would.
+def _rerecording_client(data_dir, client):
+    io.DATA_DIR = data_dir
+    for k in range(GAMES):
+        store.add_game('pho', 'housebot', k % 3, {'accuracy': 0.1 * client, 'evasion': 0.5,
+                                                  'victory': client % 2 == 0, 'map_type': 'land'})
+
+
+class TestConcurrentAccess(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        io.DATA_DIR = self.data_dir.name
+        io.create_dirs('pho', 'housebot')
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        self.data_dir.cleanup()
+
+    # No game is lost or corrupted when several clients record games against the same opponent at once.
+    def test_clients_recording_at_once(self):
+        clients = [mp.Process(target=_client, args=(self.data_dir.name, client)) for client in range(CLIENTS)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        self.assertEqual([0] * CLIENTS, [client.exitcode for client in clients])
+
+        game_ids = list(range(CLIENTS * GAMES))
+        self.assertEqual(game_ids, sorted(game_log.list_game_ids('pho', 'housebot')))
+        logged = game_log.load_games('pho', 'housebot', game_ids)
+        self.assertEqual({game_id: encoding.decode_game(_game(game_id)) for game_id in game_ids}, logged)
+
+        archived = archive.get_games(archive.load_archive('pho', 'housebot', 'land'), game_ids)
+        self.assertEqual(game_ids, sorted(archived))
+        for game_id in game_ids:
+            fleet = [['', '', ''] for _ in range(3)]
+            fleet[game_id % 3][game_id // 3 % 3] = '0'
+            self.assertEqual(fleet, archived[game_id]['opp_board'])
+
+        self.assertEqual(CLIENTS * GAMES, store.get_stats('pho', 'housebot')['games'])
+        self.assertEqual(game_ids, sorted(io.load_training_history('pho', 'housebot')))
+
+    # The running totals stay consistent with the games when several clients replace the same games at once.
+    def test_clients_replacing_games_at_once(self):
+        clients = [mp.Process(target=_rerecording_client, args=(self.data_dir.name, client))
+                   for client in range(CLIENTS)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        self.assertEqual([0] * CLIENTS, [client.exitcode for client in clients])
+
+        stats = store.get_stats('pho', 'housebot')
+        store.rebuild_aggregates()
+        rebuilt = store.get_stats('pho', 'housebot')
+        self.assertEqual((3, rebuilt['wins']), (stats['games'], stats['wins']))
+        self.assertAlmostEqual(rebuilt['accuracy'], stats['accuracy'])
+
+    # A training that is running in another client is not resumed.
+    def test_running_training_is_not_resumed(self):
+        job = {'bot_name': 'pho', 'opponent_name': 'housebot', 'map_type': 'land'}
+        io.save_training_checkpoint({'job': job}, 'pho', 'housebot', 'land')
+
+        with io.lock(io.get_training_checkpoint_path('pho', 'housebot', 'land')):
+            self.assertEqual([], training_runner.interrupted_jobs('pho', 'housebot'))
+        self.assertEqual([job], training_runner.interrupted_jobs('pho', 'housebot'))
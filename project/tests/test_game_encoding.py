@@ -0,0 +1,62 @@
+from unittest import TestCase
+import copy
+import pickle
+import random
+
+import src.utils.game_encoding as encoding
+
+
+class TestGameEncoding(TestCase):
+
+    # A game of alternating shots on two 10x10 boards, each shot changing one cell.
+    @staticmethod
+    def _game(turns=80):
+        random.seed(1)
+        my_board = [['' for _ in range(10)] for _ in range(10)]
+        opp_board = [['' for _ in range(10)] for _ in range(10)]
+        game_state = {'GameId': 7, 'OpponentId': 'housebot', 'GameStatus': 'RUNNING', 'Round': 0, 'IsMover': True,
+                      'Ships': [5, 4, 3, 3, 2], 'MyBoard': my_board, 'OppBoard': opp_board}
+        game_states = [game_state]
+        for r in range(1, turns):
+            game_state = copy.deepcopy(game_state)  # states from the server share nothing.
+            board = 'OppBoard' if game_state['IsMover'] else 'MyBoard'
+            game_state[board][random.randrange(10)][random.randrange(10)] = random.choice(['M', 'H'])
+            game_state['IsMover'] = not game_state['IsMover']
+            game_state['Round'] = r
+            game_states.append(game_state)
+        game_states[-1]['GameStatus'] = 'WON'
+        return game_states
+
+    def test_round_trip(self):
+        game_states = self._game()
+        game = encoding.encode_game(game_states)
+
+        self.assertEqual(game_states, encoding.decode_game(game))
+        self.assertEqual(len(game_states), encoding.count_turns(game))
+        for turn in [0, 1, 37, -1]:
+            self.assertEqual(game_states[turn], encoding.decode_turn(game, turn))
+        with self.assertRaises(IndexError):
+            encoding.decode_turn(game, len(game_states))
+
+    # Decoding must not alter the encoded game, so it can be decoded again.
+    def test_decoding_keeps_game(self):
+        game = encoding.encode_game(self._game())
+        pickled = pickle.dumps(game)
+        encoding.decode_game(game)[-1]['MyBoard'][0][0] = 'X'
+        encoding.decode_turn(game, 0)['OppBoard'][0][0] = 'X'
+
+        self.assertEqual(pickled, pickle.dumps(game))
+
+    def test_turn_delta(self):
+        previous = {'Round': 1, 'IsMover': True, 'OppBoard': [['', ''], ['', '']]}
+        game_state = {'Round': 2, 'IsMover': False, 'OppBoard': [['', 'H'], ['', '']]}
+
+        cells, changed = encoding.encode_turn(previous, game_state)
+        self.assertEqual((('OppBoard', 0, 1, 'H'),), cells)
+        self.assertEqual({'Round': 2, 'IsMover': False}, changed)
+
+    def test_size(self):
+        game_states = self._game()
+
+        encoded_size = len(pickle.dumps(encoding.encode_game(game_states), pickle.HIGHEST_PROTOCOL))
+        self.assertLess(encoded_size, 0.1 * len(pickle.dumps(game_states, pickle.HIGHEST_PROTOCOL)))
@@ -0,0 +1,102 @@
+from unittest import TestCase
+import os
+import pickle
+import tempfile
+
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.game_log as game_log
+
+
+class TestGameLog(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_limits = game_log.MAX_GAMES_LOGGED, game_log.GAMES_PER_SEGMENT
+        io.DATA_DIR = self.data_dir.name
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        game_log.MAX_GAMES_LOGGED, game_log.GAMES_PER_SEGMENT = self.old_limits
+        self.data_dir.cleanup()
+
+    @staticmethod
+    def _game(game_id):
+        return [{'GameId': game_id, 'Round': r, 'OppBoard': [['', 'M'], ['H', '']]} for r in range(3)]
+
+    def test_append_and_load(self):
+        for game_id in [4, 9, 2]:
+            game_log.append_game('pho', 'housebot', game_id, encoding.encode_game(self._game(game_id)))
+
+        self.assertEqual([4, 9, 2], game_log.list_game_ids('pho', 'housebot'))
+        self.assertEqual({9: self._game(9), 2: self._game(2)}, game_log.load_games('pho', 'housebot', [9, 2, 5]))
+        self.assertIsNone(game_log.load_game('pho', 'housebot', 5))
+
+    # Old games are dropped a segment at a time, always keeping the most recent MAX_GAMES_LOGGED.
+    def test_segment_rotation(self):
+        game_log.MAX_GAMES_LOGGED, game_log.GAMES_PER_SEGMENT = 5, 3
+        for game_id in range(12):
+            game_log.append_game('pho', 'housebot', game_id, encoding.encode_game(self._game(game_id)))
+
+        self.assertEqual(list(range(6, 12)), game_log.list_game_ids('pho', 'housebot'))
+        self.assertEqual(4, len(os.listdir(game_log.get_log_dir('pho', 'housebot'))))
+
+    # An index entry that was only partly written before a crash is ignored and overwritten.
+    def test_partial_index_entry(self):
+        game_log.append_game('pho', 'housebot', 1, encoding.encode_game(self._game(1)))
+        index_path = game_log.get_log_dir('pho', 'housebot') + '/segment_000000.idx'
+        with open(index_path, 'ab') as writer:
+            writer.write(b'\x00\x01\x02')
+
+        self.assertEqual([1], game_log.list_game_ids('pho', 'housebot'))
+        game_log.append_game('pho', 'housebot', 2, encoding.encode_game(self._game(2)))
+        self.assertEqual({1: self._game(1), 2: self._game(2)}, game_log.load_games('pho', 'housebot', [1, 2]))
+
+    # The games of a former pickled log are moved into the log.
+    def test_import_pickled_log(self):
+        io.create_dirs('pho', 'housebot')
+        io.save_pickled_game_log('pho', 'housebot', {3: self._game(3), 1: self._game(1)})
+
+        game_log.append_game('pho', 'housebot', 5, encoding.encode_game(self._game(5)))
+
+        self.assertEqual([1, 3, 5], game_log.list_game_ids('pho', 'housebot'))
+        self.assertEqual({1: self._game(1), 3: self._game(3)}, game_log.load_games('pho', 'housebot', [1, 3]))
+        self.assertIsNone(io.load_pickled_game_log('pho', 'housebot'))
+
+    # Games are listed with their metadata without reading the game states.
+    def test_list_games(self):
+        game_log.append_game('pho', 'housebot', 4, encoding.encode_game(self._game(4)), {'map_type': 'land'})
+        game_log.append_game('pho', 'housebot', 2, encoding.encode_game(self._game(2)))
+
+        listed = game_log.list_games('pho', 'housebot')
+        self.assertEqual([4, 2], [game['game_id'] for game in listed])
+        self.assertEqual('land', listed[0]['map_type'])
+        self.assertEqual([3, 3], [game['turns'] for game in listed])
+        self.assertTrue(all(game['size'] > 0 for game in listed))
+
+    # Games are streamed one at a time in the order they were logged.
+    def test_iter_games(self):
+        for game_id in [4, 9, 2]:
+            game_log.append_game('pho', 'housebot', game_id, encoding.encode_game(self._game(game_id)))
+
+        games = game_log.iter_games('pho', 'housebot')
+        self.assertEqual((4, self._game(4)), next(games))
+        self.assertEqual([9, 2], [game_id for game_id, _ in games])
+        self.assertEqual([(2, encoding.encode_game(self._game(2)))],
+                         list(game_log.iter_games('pho', 'housebot', [2], decode=False)))
+
+    def test_load_final_states(self):
+        for game_id in [4, 9]:
+            game_log.append_game('pho', 'housebot', game_id, encoding.encode_game(self._game(game_id)))
+
+        self.assertEqual({9: self._game(9)[-1]}, game_log.load_final_states('pho', 'housebot', [9, 5]))
+
+    # A record that does not start with a header is reported as corrupt rather than read.
+    def test_record_without_header(self):
+        log_dir = game_log.get_log_dir('pho', 'housebot')
+        io.make_dir(log_dir)
+        game_log._append_record(log_dir, 0, 7, pickle.dumps(encoding.encode_game(self._game(7))))
+
+        self.assertRaises(IOError, game_log.load_games, 'pho', 'housebot', [7])
+        self.assertRaises(IOError, game_log.load_final_states, 'pho', 'housebot', [7])
@@ -0,0 +1,32 @@
+from unittest import TestCase
+from multiprocessing.pool import ThreadPool
+
+import lib.halving as halving
+
+
+class TestSuccessiveHalving(TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def quadratic(self, x, fidelity):
+        self.calls.append(fidelity)
+        return (x[0] - 0.3) ** 2
+
+    # 27 candidates with a reduction factor of 3 are evaluated in rungs of 27, 9, 3 and 1 candidates.
+    def test_rungs(self):
+        points, fidelity = halving.search(self.quadratic, [[0., 1.]], 27, eta=3, executor=ThreadPool)
+
+        self.assertEqual(1., fidelity)
+        self.assertEqual(1, len(points))
+        self.assertEqual([27, 9, 3, 1], [self.calls.count(3. ** -k) for k in [3, 2, 1, 0]])
+        self.assertAlmostEqual(0.3, points[0][0], delta=1. / 26)
+
+    # Once the budget is spent, the highest completed rung is returned.
+    def test_time_budget(self):
+        points, fidelity = halving.search(self.quadratic, [[0., 1.]], 27, eta=3, time_budget=0.,
+                                          executor=ThreadPool)
+
+        self.assertEqual(1. / 27, fidelity)
+        self.assertEqual(27, len(points))
+        self.assertEqual(sorted(points[:, -1]), list(points[:, -1]))
@@ -0,0 +1,165 @@
+from unittest import TestCase
+import tempfile
+
+import src.utils.file_io as io
+import src.utils.profile_store as store
+
+
+class TestProfileStore(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_retention = store.GAMES_KEPT_IN_FULL, store.GAMES_PER_SUMMARY
+        io.DATA_DIR = self.data_dir.name
+        store.create_profile('pho', 'housebot', 'Pho')
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        store.GAMES_KEPT_IN_FULL, store.GAMES_PER_SUMMARY = self.old_retention
+        self.data_dir.cleanup()
+
+    def test_add_and_get_games(self):
+        stats = {'accuracy': 0.4, 'evasion': 0.5, 'victory': True, 'map_type': 'land',
+                 'heuristics': [('ship_adjacency', 0.5)], 'turns': 30}
+        store.add_game('pho', 'housebot', 7, stats)
+        store.add_game('pho', 'housebot', 8, {'accuracy': 0.2, 'evasion': 0.3, 'victory': False, 'map_type': 'no-land'})
+
+        self.assertEqual({7: stats}, store.get_games('pho', 'housebot', 'land'))
+        self.assertEqual([8], list(store.get_games('pho', 'housebot', limit=1)))
+        self.assertEqual(2, store.count_games('pho', 'housebot'))
+        self.assertEqual(0, store.count_games('pho', 'other'))
+
+    # Training games are the most recent of a map type among the most recent games of any map type.
+    def test_recent_game_ids(self):
+        for game_id in range(10):
+            store.add_game('pho', 'housebot', game_id, {'accuracy': 0.5, 'evasion': 0.5, 'victory': True,
+                                                         'map_type': 'land' if game_id % 2 else 'no-land'})
+
+        self.assertEqual([9, 7, 5], store.get_recent_game_ids('pho', 'housebot', 'land', recent=6, limit=5))
+        self.assertEqual([9, 8], store.get_recent_game_ids('pho', 'housebot', limit=2))
+
+    def test_stats(self):
+        store.add_game('pho', 'housebot', 1, {'accuracy': 0.4, 'evasion': 0.6, 'victory': True, 'map_type': 'land'})
+        store.add_game('pho', 'housebot', 2, {'accuracy': 0.2, 'evasion': 0.2, 'victory': False, 'map_type': 'land'})
+        store.add_game('pho', 'housebot', 3, {'accuracy': 0.3, 'evasion': 0.1, 'victory': True, 'map_type': 'no-land'})
+
+        stats = store.get_stats('pho', 'housebot', 'land')
+        self.assertEqual(2, stats['games'])
+        self.assertEqual(1, stats['wins'])
+        self.assertAlmostEqual(0.3, stats['accuracy'])
+        self.assertAlmostEqual(0.4, stats['evasion'])
+        self.assertEqual(3, store.get_stats('pho', 'housebot')['games'])
+
+    # Recording a game again replaces it in the running totals too, which match totals rebuilt from the games.
+    def test_aggregates(self):
+        store.add_game('pho', 'housebot', 1, {'accuracy': 0.4, 'evasion': 0.6, 'victory': True, 'map_type': 'land'})
+        store.add_game('pho', 'housebot', 2, {'accuracy': 0.2, 'evasion': None, 'victory': False})
+        store.add_game('pho', 'housebot', 1, {'accuracy': 0.1, 'evasion': 0.2, 'victory': False, 'map_type': 'land'})
+
+        stats = store.get_stats('pho', 'housebot')
+        self.assertEqual(2, stats['games'])
+        self.assertEqual(0, stats['wins'])
+        self.assertAlmostEqual(0.15, stats['accuracy'])
+        self.assertAlmostEqual(0.2, stats['evasion'])
+        self.assertEqual(1, store.count_games('pho', 'housebot', 'land'))
+
+        store.rebuild_aggregates()
+        self.assertEqual(stats, store.get_stats('pho', 'housebot'))
+
+    # The running totals of a database written before they were kept are rebuilt when it is opened.
+    def test_aggregates_of_older_database(self):
+        store.add_game('pho', 'housebot', 1, {'accuracy': 0.4, 'evasion': 0.6, 'victory': True, 'map_type': 'land'})
+        with store._connect() as db:
+            db.execute('DROP TABLE aggregates')
+        store._initialised.clear()
+
+        self.assertEqual({'games': 1, 'wins': 1, 'accuracy': 0.4, 'evasion': 0.6}, store.get_stats('pho', 'housebot'))
+
+    # Old games are compacted into summaries of whole blocks, while the stats still include them.
+    def test_compact_games(self):
+        store.GAMES_KEPT_IN_FULL, store.GAMES_PER_SUMMARY = 5, 3
+        for game_id in range(12):
+            store.add_game('pho', 'housebot', game_id, {'accuracy': game_id / 10, 'evasion': 0.5,
+                                                         'victory': game_id % 3 == 0,
+                                                         'map_type': 'land' if game_id % 2 else 'no-land'})
+        stats = {map_type: store.get_stats('pho', 'housebot', map_type) for map_type in [None, 'land', 'no-land']}
+
+        self.assertEqual(6, store.compact_games('pho', 'housebot'))
+        self.assertEqual(0, store.compact_games('pho', 'housebot'))
+        self.assertEqual(list(range(6, 12)), sorted(store.get_games('pho', 'housebot')))
+        self.assertEqual([{'first_game_id': 0, 'last_game_id': 2, 'map_type': 'land', 'games': 1, 'wins': 0,
+                           'accuracy': 0.1, 'evasion': 0.5},
+                          {'first_game_id': 3, 'last_game_id': 5, 'map_type': 'land', 'games': 2, 'wins': 1,
+                           'accuracy': 0.4, 'evasion': 0.5}], store.get_history('pho', 'housebot', 'land'))
+        for map_type in stats:
+            self.assertEqual(stats[map_type], store.get_stats('pho', 'housebot', map_type))
+
+        store.rebuild_aggregates('pho')
+        for map_type in stats:
+            new_stats = store.get_stats('pho', 'housebot', map_type)
+            self.assertEqual(stats[map_type]['games'], new_stats['games'])
+            self.assertEqual(stats[map_type]['wins'], new_stats['wins'])
+            self.assertAlmostEqual(stats[map_type]['accuracy'], new_stats['accuracy'])
+
+    # A compacted game that is recorded again is not counted twice, while games after the compacted blocks are added.
+    def test_add_compacted_game(self):
+        store.GAMES_KEPT_IN_FULL, store.GAMES_PER_SUMMARY = 2, 2
+        for game_id in range(4):
+            store.add_game('pho', 'housebot', game_id, {'accuracy': 0.5, 'evasion': 0.5, 'victory': True,
+                                                        'map_type': 'land'})
+        self.assertEqual(2, store.compact_games('pho', 'housebot'))
+
+        self.assertFalse(store.add_game('pho', 'housebot', 1, {'accuracy': 0.1, 'evasion': 0.5, 'victory': False,
+                                                               'map_type': 'land'}, track_training=True))
+        self.assertTrue(store.add_game('pho', 'housebot', 4, {'accuracy': 0.5, 'evasion': 0.5, 'victory': True,
+                                                              'map_type': 'land'}))
+        self.assertEqual({'games': 5, 'wins': 5, 'accuracy': 0.5, 'evasion': 0.5}, store.get_stats('pho', 'housebot'))
+        self.assertEqual([2, 3, 4], sorted(store.get_games('pho', 'housebot')))
+        self.assertIsNone(store.get_training_state('pho', 'housebot', 'land'))
+
+    # A game updates the training state of its map type in the store: the games since training and their average.
+    def test_training_state(self):
+        self.assertIsNone(store.get_training_state('pho', 'housebot', 'land'))
+        for game_id, accuracy in enumerate([0.4, 0.6, 0.8]):
+            store.add_game('pho', 'housebot', game_id, {'accuracy': accuracy, 'evasion': 0.6, 'victory': True,
+                                                        'map_type': 'land'}, track_training=True)
+        state = store.get_training_state('pho', 'housebot', 'land')
+        self.assertEqual((3, 0), (state['games_since_training'], state['accuracy_before_training']))
+        self.assertAlmostEqual(0.6, state['accuracy_after_training'])
+
+        store.reset_training_state('pho', 'housebot', 'land')
+        store.reset_training_state('pho', 'housebot', 'no-land')
+        store.add_game('pho', 'housebot', 3, {'accuracy': 0.5, 'evasion': 0.6, 'victory': True, 'map_type': 'land'},
+                       track_training=True)
+        state = store.get_training_state('pho', 'housebot', 'land')
+        self.assertEqual(1, state['games_since_training'])
+        self.assertAlmostEqual(0.6, state['accuracy_before_training'])
+        self.assertAlmostEqual(0.5, state['accuracy_after_training'])
+        self.assertIsNone(store.get_training_state('pho', 'housebot', 'no-land'))
+
+    # Pickled profiles are imported once and read back in the same form.
+    def test_migrate(self):
+        profile = {'bot_name': 'Gazpacho', 'opponent_name': 'housebot',
+                   'games': {3: {'accuracy': 0.4, 'evasion': 0.5, 'victory': False, 'map_type': 'land',
+                                 'heuristics': [('ship_adjacency', 0.25)]}},
+                   'heuristics': {'ship_adjacency': {'land': 0.25}},
+                   'misc': {'games_since_training': {'land': 1}, 'accuracy_before_training': {'land': 0},
+                            'accuracy_after_training': {'land': 0.4}}}
+        io.save_profile(profile, 'gazpacho', 'housebot')
+
+        self.assertEqual([('gazpacho', 'housebot')], store.migrate())
+        self.assertEqual([], store.migrate())
+        self.assertEqual(profile, store.load_profile('gazpacho', 'housebot'))
+
+    # A profile.p file is imported when its profile is first opened, and only then.
+    def test_import_pickled_profile(self):
+        profile = {'bot_name': 'Gazpacho', 'opponent_name': 'housebot',
+                   'games': {3: {'accuracy': 0.4, 'evasion': 0.5, 'victory': False, 'map_type': 'land'}},
+                   'heuristics': {}, 'misc': {}}
+        io.save_profile(profile, 'gazpacho', 'housebot')
+
+        self.assertTrue(store.import_pickled_profile('gazpacho', 'housebot'))
+        self.assertFalse(store.import_pickled_profile('gazpacho', 'housebot'))
+        self.assertFalse(store.import_pickled_profile('gazpacho', 'otherbot'))
+        self.assertEqual(1, store.count_games('gazpacho', 'housebot'))
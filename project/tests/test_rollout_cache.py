@@ -0,0 +1,77 @@
+from unittest import TestCase, mock
+import io as io_module
+import os
+import tempfile
+
+import src.utils.file_io as io
+import src.utils.rollout_cache as rollout_cache
+
+
+class TestRolloutCache(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        io.DATA_DIR = self.data_dir.name
+        self.cache = rollout_cache.RolloutCache('pho', 'housebot', 'v1')
+
+    def tearDown(self):
+        io.DATA_DIR = self.old_data_dir
+        self.data_dir.cleanup()
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get(1, ['ship_adjacency'], [0.5], 100, 0))
+
+    def test_put_and_get(self):
+        result = {'misses': 30.5, 'hits': 17}
+        self.cache.put(1, ['ship_adjacency'], [0.5], 100, 0, result)
+        self.assertEqual(result, self.cache.get(1, ['ship_adjacency'], [0.5], 100, 0))
+        # Any other part of the key must not match.
+        self.assertIsNone(self.cache.get(2, ['ship_adjacency'], [0.5], 100, 0))
+        self.assertIsNone(self.cache.get(1, ['ship_adjacency'], [0.6], 100, 0))
+        self.assertIsNone(self.cache.get(1, ['ship_adjacency'], [0.5], 50, 0))
+        self.assertIsNone(self.cache.get(1, ['ship_adjacency'], [0.5], 100, 1))
+        self.assertIsNone(rollout_cache.RolloutCache('pho', 'housebot', 'v2').get(1, ['ship_adjacency'], [0.5], 100, 0))
+
+    # Values that only differ past the quantisation precision share the same result.
+    def test_quantised_heuristics(self):
+        self.cache.put(1, ['ship_adjacency'], [0.50001], 100, 0, {'misses': 1, 'hits': 1})
+        self.assertIsNotNone(self.cache.get(1, ['ship_adjacency'], [0.49999], 100, 0))
+
+    def test_prune_evicts_least_recently_used(self):
+        for game_id in range(5):
+            self.cache.put(game_id, ['ship_adjacency'], [0.5], 100, 0, {'misses': game_id, 'hits': 0})
+
+        # Make games 0 and 1 the least recently used, then use game 2 again.
+        paths = {game_id: self.cache._path(game_id, ['ship_adjacency'], [0.5], 100, 0) for game_id in range(5)}
+        for game_id in range(5):
+            os.utime(paths[game_id], (1000 + game_id, 1000 + game_id))
+        os.utime(paths[2], (900, 900))
+        self.assertIsNotNone(self.cache.get(2, ['ship_adjacency'], [0.5], 100, 0))
+
+        self.assertEqual(2, self.cache.prune(3))
+        remaining = [g for g in range(5) if os.path.exists(paths[g])]
+        self.assertEqual([2, 3, 4], remaining)
+
+    # A bot's version covers the modules it imports and the simulator, not only its own module.
+    def test_bot_version_covers_imports(self):
+        modules = rollout_cache._project_modules(['src.ai.bots.pho'] + list(rollout_cache.SIMULATOR_LOCATIONS))
+        self.assertTrue({'src.ai.bots.pho', 'src.ai.ship_targeting', 'src.ai.heuristics',
+                         'src.ai.offensive_explorer'} <= modules)
+
+        rollout_cache.bot_version.cache_clear()
+        version = rollout_cache.bot_version('src.ai.bots.pho')
+        real_open = open
+
+        # Changing the source of heuristics (as seen by the hash) changes the version.
+        def edited_open(path, mode='r', *args, **kwargs):
+            reader = real_open(path, mode, *args, **kwargs)
+            if path.endswith('heuristics.py') and 'b' in mode:
+                return io_module.BytesIO(reader.read() + b'# edited')
+            return reader
+
+        rollout_cache.bot_version.cache_clear()
+        with mock.patch('builtins.open', edited_open):
+            self.assertNotEqual(version, rollout_cache.bot_version('src.ai.bots.pho'))
+        rollout_cache.bot_version.cache_clear()
+        self.assertEqual(version, rollout_cache.bot_version('src.ai.bots.pho'))
@@ -0,0 +1,85 @@
+from unittest import TestCase
+import gzip
+import os
+import tempfile
+import threading
+
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.game_log as game_log
+import src.utils.text_log as text_log
+import src.utils.write_behind as write_behind
+
+
+class TestTextLog(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_limits = text_log.TEXT_BUNDLE_SIZE, text_log.TEXT_BUNDLES_KEPT
+        io.DATA_DIR = self.data_dir.name
+
+    def tearDown(self):
+        write_behind.flush()
+        io.DATA_DIR = self.old_data_dir
+        text_log.TEXT_BUNDLE_SIZE, text_log.TEXT_BUNDLES_KEPT = self.old_limits
+        self.data_dir.cleanup()
+
+    @staticmethod
+    def _game(game_id):
+        return [{'GameId': game_id, 'OpponentId': 'housebot', 'Ships': [2, 3], 'Round': r,
+                 'MyBoard': [['', 'L'], ['', '']], 'OppBoard': [['', 'M'], ['H', '']]} for r in range(3)]
+
+    # Logs and exports a game, as GameRecorder does.
+    def _log(self, game_id):
+        game_log.append_game('pho', 'housebot', game_id, encoding.encode_game(self._game(game_id)))
+        text_log.export_game('pho', 'housebot', game_id)
+
+    def _bundles(self):
+        text_dir = text_log.get_text_log_dir('pho', 'housebot')
+        return sorted(os.listdir(text_dir)) if os.path.isdir(text_dir) else []
+
+    def _read_bundles(self):
+        text = ''
+        for name in self._bundles():
+            if name.endswith('.gz'):
+                with gzip.open(text_log.get_text_log_dir('pho', 'housebot') + '/' + name, 'rt') as reader:
+                    text += reader.read()
+        return text
+
+    def test_board_to_string(self):
+        self.assertEqual('   M  \nH     \n', text_log.board_to_string([['', 'M'], ['H', '']]))
+
+    def test_render_game(self):
+        text = text_log.render_game('pho', self._game(1))
+
+        self.assertTrue(text.startswith('\nGameId: 1\nShips: [2, 3]\n--GAME START--'))
+        self.assertEqual(3, text.count('\npho\n   L  \n'))
+        self.assertTrue(text.endswith('--GAME END--\n'))
+
+    # Games logged in one batch of background writes are exported together, as one gzip member of a bundle.
+    def test_batched_export(self):
+        release = threading.Event()
+        write_behind.submit(release.wait)
+        for game_id in range(3):
+            write_behind.submit(self._log, game_id)
+        self.assertEqual([], self._bundles())
+        release.set()
+        write_behind.flush()
+
+        text = self._read_bundles()
+        self.assertEqual(3, text.count('--GAME START--'))
+        self.assertLess(text.index('GameId: 0'), text.index('GameId: 2'))
+        with open(text_log.get_text_log_dir('pho', 'housebot') + '/bundle_000000.txt.gz', 'rb') as reader:
+            self.assertEqual(1, reader.read().count(b'\x1f\x8b\x08'))
+
+    # A new bundle is started once the current one is full and the oldest bundles are removed.
+    def test_bundle_rotation(self):
+        text_log.TEXT_BUNDLE_SIZE, text_log.TEXT_BUNDLES_KEPT = 1, 2
+        for game_id in range(4):
+            self._log(game_id)
+
+        self.assertEqual(['bundle_000002.txt.gz', 'bundle_000003.txt.gz'],
+                         [name for name in self._bundles() if name.endswith('.gz')])
+        self.assertNotIn('GameId: 1\n', self._read_bundles())
+        self.assertIn('GameId: 3\n', self._read_bundles())
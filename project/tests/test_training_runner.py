@@ -0,0 +1,190 @@
+from unittest import TestCase, mock, skipUnless
+import multiprocessing as mp
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import src.ai.bot_learning as learn
+import src.ai.offensive_explorer as explorer
+import src.ai.training_runner as training_runner
+import src.utils.board_archive as archive
+import src.utils.file_io as io
+import src.utils.game_encoding as encoding
+import src.utils.write_behind as write_behind
+
+
+class RolloutOptimiser:
+    """
+    Stands in for the optimiser of a training, keeping a pool of processes busy simulating games until it is stopped.
+    The ids of the pool's processes are written to the data directory.
+    """
+
+    def __init__(self, *args):
+        self.game_executor = None
+
+    def prepare_heuristics(self, *args):
+        pass
+
+    set_optimisation_type = prepare_offensive_games = prepare_heuristics
+
+    def optimise(self):
+        with learn.RolloutScheduler(self, batch=1, processes=2) as scheduler:
+            for _ in range(2):
+                scheduler.game_pool.apply_async(time.sleep, (60,))
+            with open(io.DATA_DIR + '/workers.tmp', 'w') as writer:
+                writer.write(' '.join(str(worker.pid) for worker in scheduler.game_pool._pool))
+            os.replace(io.DATA_DIR + '/workers.tmp', io.DATA_DIR + '/workers')
+            time.sleep(60)
+
+
+def _is_running(pid):
+    # Whether a process exists and has not exited (a zombie waiting to be reaped has exited).
+    try:
+        with open('/proc/' + str(pid) + '/stat') as reader:
+            return reader.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+class TestTrainingRunner(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.old_data_dir = io.DATA_DIR
+        self.old_settings = training_runner.training_settings()
+        io.DATA_DIR = self.data_dir.name
+        self.job = {'bot_name': 'pho', 'opponent_name': 'housebot', 'bot_location': 'src.ai.bots.pho',
+                    'heuristic_names': ['ship_adjacency'], 'map_type': 'no-land', 'game_ids': [0],
+                    'optimisation_type': 'minimise'}
+
+    def tearDown(self):
+        training_runner.apply_settings(self.old_settings)
+        io.DATA_DIR = self.old_data_dir
+        self.data_dir.cleanup()
+
+    def _archive_game(self):
+        board = [['', '1', '', ''],
+                 ['', '1', '', ''],
+                 ['0', '0', '0', ''],
+                 ['', '', '', '']]
+        final = [['S' + cell if cell else cell for cell in row] for row in board]
+        empty = [['' for _ in row] for row in board]
+        states = [{'Ships': [3, 2], 'MyBoard': empty, 'OppBoard': empty},
+                  {'Ships': [3, 2], 'MyBoard': empty, 'OppBoard': final}]
+        archive.append_game('pho', 'housebot', 'no-land', 0, encoding.encode_game(states))
+
+    # A job is run with the settings of the game process and its result stored for the AI.
+    def test_run_job_with_settings(self):
+        self._archive_game()
+        settings = training_runner.training_settings()
+        settings['src.ai.bot_learning'].update({'BB_GLOBAL_CALLS': 3, 'BB_LOCAL_CALLS': 2, 'PARALLEL_CALLS': 1,
+                                                'ROLLOUT_PROCESSES': 1, 'CHECKPOINT_INTERVAL': 0})
+        settings['src.ai.offensive_explorer']['BOARD_SAMPLES'] = 5
+        settings['src.ai.training_runner']['MAX_TRAINING_ATTEMPTS'] = 4
+        jobs, updates = queue.Queue(), queue.Queue()
+        jobs.put(self.job)
+        jobs.put(None)
+
+        training_runner._run_jobs(jobs, updates, settings)
+
+        self.assertEqual(3, learn.BB_GLOBAL_CALLS)
+        self.assertEqual(5, explorer.BOARD_SAMPLES)
+        self.assertEqual(4, training_runner.MAX_TRAINING_ATTEMPTS)
+        key = training_runner.job_key(self.job)
+        self.assertEqual([('started', key), ('finished', key)], [updates.get_nowait() for _ in range(2)])
+        (_, result), = io.load_training_results('pho', 'housebot')
+        self.assertEqual(['ship_adjacency'], result['heuristic_names'])
+        self.assertEqual(1, len(result['values']))
+        self.assertEqual([], training_runner.interrupted_jobs('pho', 'housebot'))
+
+    # The job stays locked until its result is stored and its checkpoint removed, so no other client resumes it.
+    def test_result_stored_under_lock(self):
+        seen = []
+        with mock.patch.object(training_runner, '_optimise', return_value=[0.7]):
+            training_runner.run_job(self.job, lambda values: seen.append(
+                (values, training_runner.interrupted_jobs('pho', 'housebot'),
+                 io.load_training_checkpoint('pho', 'housebot', 'no-land'))))
+
+        self.assertEqual([([0.7], [], {'job': self.job})], seen)
+        self.assertIsNone(io.load_training_checkpoint('pho', 'housebot', 'no-land'))
+
+    # A job that keeps failing is resumed until it has failed MAX_TRAINING_ATTEMPTS times.
+    def test_failing_job_is_given_up(self):
+        io.save_training_checkpoint({'job': self.job}, 'pho', 'housebot', 'no-land')  # no games to train on.
+        jobs, updates = queue.Queue(), queue.Queue()
+
+        with mock.patch.object(training_runner, 'MAX_TRAINING_ATTEMPTS', 2), mock.patch('traceback.print_exc'):
+            jobs.put(self.job)
+            jobs.put(None)
+            training_runner._run_jobs(jobs, updates)
+            self.assertEqual([self.job], training_runner.interrupted_jobs('pho', 'housebot'))
+
+            jobs.put(self.job)
+            jobs.put(None)
+            training_runner._run_jobs(jobs, updates)
+            self.assertEqual([], training_runner.interrupted_jobs('pho', 'housebot'))
+
+        self.assertEqual(['started', 'failed'] * 2, [updates.get_nowait()[0] for _ in range(4)])
+
+    # The runner reports on the jobs of its process and accepts none once stopped.
+    def test_submit_status_and_stop(self):
+        runner = training_runner.TrainingRunner()
+        self.assertTrue(runner.submit(self.job))  # fails at once, as there are no games to train on.
+
+        deadline = time.time() + 30
+        while runner.status()['failed'] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual({'queued': [], 'running': None, 'finished': 0, 'failed': 1}, runner.status())
+
+        runner.stop()
+        self.assertFalse(runner.process.is_alive())
+        self.assertFalse(runner.submit(self.job))
+
+    # Trainings submitted by writes still queued when the runner stops are not started.
+    def test_stop_flushes_queued_writes(self):
+        runner = training_runner.TrainingRunner()
+        submitted = []
+        release = threading.Event()
+        write_behind.submit(release.wait)
+        write_behind.submit(lambda: submitted.append(runner.submit(self.job)))
+        threading.Timer(0.2, release.set).start()
+
+        runner.stop()
+
+        self.assertEqual([False], submitted)
+        self.assertIsNone(runner.process)
+
+    # Stopping the runner during a training shuts down the processes simulating its games.
+    @skipUnless(os.path.isdir('/proc') and mp.get_start_method() == 'fork', 'needs /proc and forked processes')
+    def test_stop_shuts_down_rollout_pool(self):
+        runner = training_runner.TrainingRunner()
+        with mock.patch.object(learn, 'Optimiser', RolloutOptimiser):
+            runner.submit(self.job)
+
+        deadline = time.time() + 30
+        while not os.path.exists(io.DATA_DIR + '/workers') and time.time() < deadline:
+            time.sleep(0.05)
+        with open(io.DATA_DIR + '/workers') as reader:
+            workers = [int(pid) for pid in reader.read().split()]
+        self.assertEqual(2, len(workers))
+
+        runner.stop()
+
+        self.assertFalse(runner.process.is_alive())
+        self.assertEqual([], [pid for pid in workers if _is_running(pid)])
+
+    # A training decided on by a write still queued when the client exits is not started, and the client exits.
+    def test_exit_with_queued_training(self):
+        script = ('import src.ai.training_runner as training_runner, src.utils.write_behind as write_behind\n'
+                  'import src.utils.file_io as io\n'
+                  'io.DATA_DIR = ' + repr(io.DATA_DIR) + '\n'
+                  'write_behind.submit(lambda: print(training_runner.get_runner().submit(' + repr(self.job) + ')))\n')
+        project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', script], cwd=project_dir, capture_output=True, text=True,
+                                timeout=60)
+
+        self.assertEqual('False\n', result.stdout)
@@ -0,0 +1,109 @@
+from unittest import TestCase, mock
+import tempfile
+import threading
+
+import src.utils.write_behind as write_behind
+
+
+class TestWriteBehind(TestCase):
+
+    def setUp(self):
+        self.writer = write_behind.Writer()
+
+    # Writes are carried out in order, in the background thread, and flush waits for all of them.
+    def test_writes_in_order(self):
+        done = []
+        for i in range(50):
+            self.writer.submit(lambda k: done.append((k, threading.current_thread().name)), i)
+        self.writer.flush()
+
+        self.assertEqual([(i, 'write-behind') for i in range(50)], done)
+
+    # A failing write is reported and does not stop the ones after it.
+    def test_failed_write(self):
+        done = []
+        with mock.patch('traceback.print_exc'):
+            self.writer.submit(lambda: 1 / 0)
+            self.writer.submit(done.append, 1)
+            self.writer.flush()
+
+        self.assertEqual([1], done)
+
+    # Queueing waits while MAX_PENDING_WRITES writes are queued.
+    def test_bounded_queue(self):
+        release = threading.Event()
+        self.writer.submit(release.wait)
+        for _ in range(write_behind.MAX_PENDING_WRITES):
+            self.writer.submit(lambda: None)
+
+        self.assertTrue(self.writer.writes.full())
+        release.set()
+        self.writer.flush()
+        self.assertTrue(self.writer.writes.empty())
+
+    @staticmethod
+    def _write(path):
+        with open(path, 'w') as writer:
+            writer.write('game')
+        write_behind.written(path)
+
+    # Files written by the thread, and the directory holding them, are synced once the queue has run empty.
+    def test_sync_written_files(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = [data_dir + '/' + str(i) for i in range(3)]
+            with mock.patch.object(write_behind, '_writer', self.writer), \
+                    mock.patch.object(write_behind, 'sync_path', wraps=write_behind.sync_path) as sync_path:
+                for path in paths:
+                    self.writer.submit(self._write, path)
+                self.writer.flush()
+
+            self.assertEqual(paths + [data_dir], [call.args[0] for call in sync_path.call_args_list])
+            self.assertEqual(set(), self.writer.unsynced)
+
+    # While the queue stays busy, files are synced after every MAX_PENDING_WRITES writes, so that a crash loses no
+    # more writes than that.
+    def test_sync_busy_queue(self):
+        synced = []
+        release = threading.Event()
+        with tempfile.TemporaryDirectory() as data_dir, \
+                mock.patch.object(write_behind, '_writer', self.writer), \
+                mock.patch.object(write_behind, 'MAX_PENDING_WRITES', 2), \
+                mock.patch.object(write_behind, 'sync_path', side_effect=synced.append):
+            self.writer.submit(release.wait)
+            for i in range(4):
+                self.writer.submit(self._write, data_dir + '/' + str(i))
+            self.writer.submit(synced.append, 'last write')
+            release.set()
+            self.writer.flush()
+
+        # The wait and file 0 make a batch, files 1 and 2 the next, and file 3 ends with the queue.
+        self.assertEqual([data_dir + '/0', data_dir, data_dir + '/1', data_dir + '/2', data_dir, 'last write',
+                          data_dir + '/3', data_dir], synced)
+
+    # A file removed before the batch is synced is skipped.
+    def test_sync_removed_file(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            write_behind.sync_path(data_dir + '/removed')
+            write_behind.sync_path(data_dir)
+
+    # With WRITE_BEHIND off, a write is carried out before submit returns.
+    def test_without_write_behind(self):
+        done = []
+        with mock.patch.object(write_behind, 'WRITE_BEHIND', False):
+            write_behind.submit(done.append, 1)
+
+        self.assertEqual([1], done)
+
+    # Functions deferred by the thread run once the queue has run empty, after the writes queued meanwhile.
+    def test_when_idle(self):
+        done = []
+        release = threading.Event()
+        with mock.patch.object(write_behind, '_writer', self.writer):
+            self.writer.submit(release.wait)
+            self.writer.submit(lambda: write_behind.when_idle(done.append, 'idle'))
+            self.writer.submit(done.append, 'write')
+            release.set()
+            self.writer.flush()
+            write_behind.when_idle(done.append, 'at once')
+
+        self.assertEqual(['write', 'idle', 'at once'], done)